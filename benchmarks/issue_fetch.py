@@ -0,0 +1,227 @@
+"""Benchmark fetching many issues one by one against a GraphQL bulk fetch.
+
+A synthetic GitHub API serves issues with comments over REST and GraphQL,
+with a fixed latency per request, and services.github is pointed at it with
+the REST backend. The same issues are fetched by looping over
+get_issue_by_id and with get_issues_bulk, and the requests and seconds of
+each are printed:
+
+    python -m benchmarks.issue_fetch --issues 200 --comments 150 --latency 0.05
+"""
+
+import json
+import re
+import threading
+import time
+from argparse import ArgumentParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import services.github
+from config import config
+from services.github import backends
+
+ISSUE_PATH = re.compile(r"^/repos/[^/]+/[^/]+/issues/(\d+)(/comments)?$")
+# An alias of the query built by backends.build_issues_query.
+ISSUE_ALIAS = re.compile(r"issue(\d+): issue\(number: (\d+)\) \{ "
+                         r"(number title body )?comments\(first: (\d+)"
+                         r'(?:, after: "(\d+)")?\)')
+
+
+class SyntheticGitHubServer(ThreadingHTTPServer):
+    """A GitHub API serving issues numbered from 1 with the same comments."""
+
+    daemon_threads = True
+
+    def __init__(self, issues: int, comments: int, latency: float = 0.0):
+        super().__init__(("127.0.0.1", 0), SyntheticGitHubHandler)
+        self.issues = issues
+        self.comments = comments
+        self.latency = latency
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    @property
+    def base_url(self) -> str:
+        """The URL to use as github_api_url."""
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count_request(self):
+        """Count a request and wait for the latency."""
+        with self._lock:
+            self.requests += 1
+        time.sleep(self.latency)
+
+    def get_comments(self, issue_id: int, offset: int, count: int) -> list:
+        """Return comments of an issue in the GraphQL format."""
+        return [{
+            "author": {
+                "login": f"user{index % 7}"
+            },
+            "authorAssociation": "CONTRIBUTOR",
+            "body": f"Comment {index} on issue {issue_id}.",
+            "includesCreatedEdit": False,
+            "isMinimized": False,
+        } for index in range(offset, min(self.comments, offset + count))]
+
+    def __enter__(self):
+        threading.Thread(target=self.serve_forever,
+                         kwargs={"poll_interval": 0.05},
+                         daemon=True).start()
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+        self.server_close()
+
+
+class SyntheticGitHubHandler(BaseHTTPRequestHandler):
+    """Answer the REST and GraphQL requests of RestBackend."""
+
+    protocol_version = "HTTP/1.1"
+    # Send the headers and the body without waiting for delayed ACKs.
+    disable_nagle_algorithm = True
+    server: SyntheticGitHubServer
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """Answer an issue or a page of its comments."""
+        self.server.count_request()
+        url = urlparse(self.path)
+        match = ISSUE_PATH.match(url.path)
+        if not match or not 1 <= int(match[1]) <= self.server.issues:
+            self.send_json({"message": "Not Found"}, status=404)
+            return
+        issue_id = int(match[1])
+        if not match[2]:
+            self.send_json({
+                "number": issue_id,
+                "title": f"Issue {issue_id}",
+                "body": f"Body of issue {issue_id}.",
+            })
+            return
+        query = parse_qs(url.query)
+        per_page = int(query.get("per_page", ["30"])[0])
+        page = int(query.get("page", ["1"])[0])
+        comments = [{
+            "user": comment["author"],
+            "author_association": comment["authorAssociation"],
+            "created_at": "2024-01-01T00:00:00Z",
+            "updated_at": "2024-01-01T00:00:00Z",
+            "body": comment["body"],
+        } for comment in self.server.get_comments(issue_id, (page - 1) *
+                                                  per_page, per_page)]
+        headers = {}
+        if page * per_page < self.server.comments:
+            headers["Link"] = (f"<{self.server.base_url}{url.path}?"
+                               f"per_page={per_page}&page={page + 1}>; "
+                               'rel="next"')
+        self.send_json(comments, headers=headers)
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        """Answer a GraphQL query of issues."""
+        self.server.count_request()
+        length = int(self.headers.get("Content-Length", 0))
+        query = json.loads(self.rfile.read(length))["query"]
+        repository = {}
+        for alias, number, issue_fields, first, after in ISSUE_ALIAS.findall(
+                query):
+            issue_id = int(number)
+            offset = int(after or 0)
+            count = int(first)
+            node = {
+                "comments": {
+                    "pageInfo": {
+                        "hasNextPage": offset + count < self.server.comments,
+                        "endCursor": str(offset + count),
+                    },
+                    "nodes":
+                    self.server.get_comments(issue_id, offset, count),
+                }
+            }
+            if issue_fields:
+                node.update({
+                    "number": issue_id,
+                    "title": f"Issue {issue_id}",
+                    "body": f"Body of issue {issue_id}.",
+                })
+            repository[f"issue{alias}"] = node
+        self.send_json({"data": {"repository": repository}})
+
+    def send_json(self,
+                  data,
+                  status: int = 200,
+                  headers: dict[str, str] | None = None):
+        """Send a JSON response."""
+        payload = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        """Do not log the requests."""
+
+
+def run(issues: int, comments: int, latency: float) -> dict:
+    """Fetch the issues of a synthetic API both ways and measure them."""
+    repo = "benchmark/benchmark"
+    issue_ids = list(range(1, issues + 1))
+    results = {}
+    with SyntheticGitHubServer(issues, comments, latency) as server:
+        settings = {
+            "github_backend": "rest",
+            "github_api_url": server.base_url,
+            "github_token": "benchmark",
+        }
+        saved = {key: config.get(key) for key in settings}
+        config.update(settings)
+        try:
+            fetched = {}
+            for name, fetch in (
+                ("get_issue_by_id", lambda: [
+                    services.github.get_issue_by_id(repo, issue_id)
+                    for issue_id in issue_ids
+                ]),
+                ("get_issues_bulk",
+                 lambda: services.github.get_issues_bulk(repo, issue_ids)),
+            ):
+                requests = server.requests
+                start = time.perf_counter()
+                fetched[name] = fetch()
+                results[name] = {
+                    "requests": server.requests - requests,
+                    "seconds": time.perf_counter() - start,
+                }
+            results["same_issues"] = (fetched["get_issue_by_id"] ==
+                                      fetched["get_issues_bulk"])
+        finally:
+            backends.reset_backend()
+            config.update(saved)
+    return results
+
+
+def main(args=None):
+    """Run the benchmark and print the results."""
+    parser = ArgumentParser(
+        description="Benchmark get_issue_by_id against get_issues_bulk")
+    parser.add_argument("--issues", type=int, default=100)
+    parser.add_argument("--comments", type=int, default=20)
+    parser.add_argument("--latency",
+                        type=float,
+                        default=0.05,
+                        help="Seconds of latency per request")
+    parsed = parser.parse_args(args)
+
+    results = run(parsed.issues, parsed.comments, parsed.latency)
+    for name in ("get_issue_by_id", "get_issues_bulk"):
+        print(f"{name}: {results[name]['requests']} requests, "
+              f"{results[name]['seconds']:.3f} seconds")
+    print(f"same issues: {results['same_issues']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,6 @@
 """This module provides functions to generate a modification from an issue and a codebase."""
 
+from .bm25_index import generate_query_from_issue, search_relevant_files
 from .code_modification import (
     apply_modification,
     generate_commit_message,
@@ -7,8 +8,16 @@ from .code_modification import (
     generate_modification_from_issue,
     verify_modification,
 )
+from .context_packer import pack_messages
+from .context_selection import select_context_files
 from .logic_utils import (
     generate_messages_from_files,
     generate_messages_from_issue,
     validate_text,
 )
+from .prompt_layout import layout_prompt
+from .repo_context import (
+    get_context_files,
+    get_file_messages,
+    invalidate_contexts,
+)
@@ -0,0 +1,217 @@
+"""A module to retrieve files relevant to an issue with a BM25 index."""
+
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter
+
+import schemas
+from config import config
+from utils.logging_utils import log
+from utils.path_utils import safe_join
+
+from . import file_cache, index_manifest, logic_utils
+
+INDEX_NAME = "bm25"
+
+DEFAULT_TOP_K = 10
+K1 = 1.5
+B = 0.75
+
+IDENTIFIER_PATTERN = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+WORD_PATTERN = re.compile(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|[0-9]+")
+STOP_WORDS = frozenset([
+    "an", "and", "are", "as", "at", "be", "by", "for", "from", "if", "in",
+    "is", "it", "of", "on", "or", "the", "this", "to", "with", "def",
+    "class", "import", "return", "self", "none", "true", "false", "not",
+    "py", "tex"
+])
+
+
+def tokenize(text: str) -> list[str]:
+    """Split text into lowercase terms.
+
+    Each identifier is split into its snake_case and camelCase parts, and
+    the whole identifier is kept as well when it has several parts.
+    """
+    terms = []
+    for identifier in IDENTIFIER_PATTERN.findall(text):
+        parts = [part.lower() for part in WORD_PATTERN.findall(identifier)]
+        if len(parts) > 1:
+            terms.append(identifier.lower().strip("_"))
+        terms.extend(parts)
+    return [term for term in terms if len(term) > 1 and term not in STOP_WORDS]
+
+
+class BM25Index:
+    """An inverted index of files scored with Okapi BM25."""
+
+    def __init__(
+        self,
+        postings: dict[str, dict[str, int]] | None = None,
+        doc_lengths: dict[str, int] | None = None,
+    ):
+        self.postings = postings or {}
+        self.doc_lengths = doc_lengths or {}
+
+    def add_document(self, path: str, text: str):
+        """Index a file by its path and content."""
+        self.remove_document(path)
+        terms = tokenize(path) + tokenize(text)
+        for term, freq in Counter(terms).items():
+            self.postings.setdefault(term, {})[path] = freq
+        self.doc_lengths[path] = len(terms)
+
+    def remove_document(self, path: str):
+        """Remove a file from the index."""
+        if self.doc_lengths.pop(path, None) is None:
+            return
+        for term in list(self.postings):
+            docs = self.postings[term]
+            if docs.pop(path, None) is not None and not docs:
+                del self.postings[term]
+
+    def search(self, query: str, top_k: int) -> list[tuple[str, float]]:
+        """Return the top_k files with the highest scores for the query."""
+        n_docs = len(self.doc_lengths)
+        if not n_docs:
+            return []
+        avg_length = sum(self.doc_lengths.values()) / n_docs or 1
+
+        scores: Counter = Counter()
+        for term in set(tokenize(query)):
+            docs = self.postings.get(term)
+            if not docs:
+                continue
+            idf = math.log(1 + (n_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+            for path, freq in docs.items():
+                length_norm = 1 - B + B * self.doc_lengths[path] / avg_length
+                scores[path] += idf * freq * (K1 + 1) / (freq +
+                                                         K1 * length_norm)
+        return scores.most_common(top_k)
+
+    def save(self, index_path: str):
+        """Save the index as a JSON file."""
+        os.makedirs(os.path.dirname(index_path), exist_ok=True)
+        tmp_path = f"{index_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as file_object:
+            json.dump(
+                {
+                    "postings": self.postings,
+                    "doc_lengths": self.doc_lengths,
+                },
+                file_object,
+            )
+        os.replace(tmp_path, index_path)
+
+    @classmethod
+    def load(cls, index_path: str) -> "BM25Index | None":
+        """Load an index saved by save, or return None if there is none."""
+        try:
+            with open(index_path) as file_object:
+                return cls(**json.load(file_object))
+        except (FileNotFoundError, json.JSONDecodeError, TypeError):
+            return None
+
+
+def get_index_path(repo: str, code_lang: str) -> str:
+    """Get the path of the index file of a repository."""
+    return safe_join(config.get("cache_path", ".cache"), "bm25", repo,
+                     f"{code_lang}.json")
+
+
+def add_documents(
+    index: BM25Index,
+    repo: str,
+    code_lang: str,
+    file_paths: list[str] | None = None,
+):
+    """Index target files of a repository, or only file_paths if given."""
+    blob_shas = logic_utils.get_clean_blob_shas(repo)
+    cache = file_cache.get_file_cache()
+    files = list(
+        logic_utils.enumerate_repo_files(repo, code_lang, file_paths))
+    contents = logic_utils.load_file_contents(cache, files, blob_shas)
+    for filename, _ in files:
+        if filename in contents:
+            index.add_document(filename, contents[filename].content)
+    cache.commit()
+
+
+def build_index(repo: str, code_lang: str) -> BM25Index:
+    """Build the index from all target files of a repository."""
+    index = BM25Index()
+    add_documents(index, repo, code_lang)
+    log(f"Built BM25 index of {repo}", files=len(index.doc_lengths))
+    return index
+
+
+def update_index(
+    index: BM25Index,
+    repo: str,
+    code_lang: str,
+    changes: index_manifest.ChangeSet,
+):
+    """Apply the changed files to the index."""
+    for path in changes.deleted:
+        index.remove_document(path)
+    add_documents(index, repo, code_lang, changes.added + changes.modified)
+
+
+def get_repository_index(repo: str, code_lang: str) -> BM25Index | None:
+    """Get the index of the current HEAD, refreshing it when it is stale."""
+    index_path = get_index_path(repo, code_lang)
+
+    def rebuild():
+        nonlocal index
+        index = build_index(repo, code_lang)
+        index.save(index_path)
+
+    def update(changes: index_manifest.ChangeSet):
+        update_index(index, repo, code_lang, changes)
+        index.save(index_path)
+
+    with index_manifest.get_lock(repo, code_lang, INDEX_NAME):
+        index = BM25Index.load(index_path)
+        if not index_manifest.refresh(repo, code_lang, INDEX_NAME, rebuild,
+                                      update, index is None):
+            return None
+    return index
+
+
+def generate_query_from_issue(issue: schemas.Issue) -> str:
+    """Generate a search query from the title, body and comments of an issue."""
+    return "\n".join([
+        issue.title,
+        issue.body,
+        *(comment.body for comment in issue.comments),
+    ])
+
+
+def search_relevant_files(
+    repo: str,
+    code_lang: str,
+    issue: schemas.Issue,
+    top_k: int | None = None,
+) -> list[str] | None:
+    """Search files relevant to an issue.
+
+    Returns:
+        list[str] | None: Relative paths of the relevant files in descending
+        order of relevance, or None if all files should be used.
+    """
+    index = get_repository_index(repo, code_lang)
+    if index is None:
+        return None
+
+    if top_k is None:
+        top_k = config.get("retrieval_top_k", DEFAULT_TOP_K)
+    results = index.search(generate_query_from_issue(issue), top_k)
+    if not results:
+        log("No files relevant to the issue are found, all files are used.",
+            level="info")
+        return None
+    log(f"Files relevant to issue #{issue.id}: {[path for path, _ in results]}")
+    return [path for path, _ in results]
@@ -0,0 +1,160 @@
+"""A module to split source files into chunks addressed by stable IDs.
+
+Python files are split into top-level functions and classes, and TeX files
+into sections. The IDs are derived from the path and the names, such as
+'pkg/mod.py::def:main' or 'paper.tex::section:Introduction', so that they
+survive edits elsewhere in the file. Lines between functions and classes
+form 'module' chunks numbered in order of appearance.
+"""
+
+import ast
+import dataclasses
+import os
+import re
+
+TEX_SECTION_PATTERN = re.compile(
+    r"^\s*\\(part|chapter|section|subsection|subsubsection)\*?\{(.*?)\}")
+# Lines are split as the Python tokenizer does, unlike str.splitlines which
+# also splits on form feeds and other separators.
+LINE_PATTERN = re.compile(r"[^\r\n]*(?:\r\n|\r|\n)|[^\r\n]+\Z")
+COMMENT_PREFIXES = {".tex": "%"}
+
+
+@dataclasses.dataclass(frozen=True)
+class Chunk:
+    """A range of lines of a file."""
+
+    id: str
+    path: str
+    start_line: int
+    end_line: int
+    offset: int
+    text: str
+
+    @property
+    def label(self) -> str:
+        """A comment line naming the chunk and its lines in a message."""
+        prefix = COMMENT_PREFIXES.get(os.path.splitext(self.path)[1], "#")
+        return (f"{prefix} chunk {self.id} "
+                f"(lines {self.start_line}-{self.end_line})\n")
+
+
+def split_lines(source: str) -> list[str]:
+    """Split source into lines, keeping the line endings."""
+    return LINE_PATTERN.findall(source)
+
+
+def make_chunks(path: str, lines: list[str],
+                ranges: list[tuple[str, int, int]]) -> list[Chunk]:
+    """Make chunks from named 1-based inclusive line ranges.
+
+    Duplicate names get a '#2', '#3' ... suffix in order of appearance.
+    """
+    offsets = [0]
+    for line in lines:
+        offsets.append(offsets[-1] + len(line))
+
+    chunks = []
+    counts: dict[str, int] = {}
+    for name, start_line, end_line in ranges:
+        counts[name] = counts.get(name, 0) + 1
+        if counts[name] > 1:
+            name = f"{name}#{counts[name]}"
+        chunks.append(
+            Chunk(f"{path}::{name}", path, start_line, end_line,
+                  offsets[start_line - 1],
+                  "".join(lines[start_line - 1:end_line])))
+    return chunks
+
+
+def fill_module_ranges(
+        ranges: list[tuple[str, int, int]],
+        n_lines: int) -> list[tuple[str, int, int]]:
+    """Add 'module:<n>' ranges for the lines that are not in any range."""
+    filled = []
+    next_line = 1
+    n_module = 0
+    for name, start_line, end_line in ranges:
+        if start_line > next_line:
+            n_module += 1
+            filled.append((f"module:{n_module}", next_line, start_line - 1))
+        filled.append((name, start_line, end_line))
+        next_line = end_line + 1
+    if next_line <= n_lines:
+        n_module += 1
+        filled.append((f"module:{n_module}", next_line, n_lines))
+    return filled
+
+
+def chunk_python(path: str, source: str) -> list[Chunk] | None:
+    """Split a Python file into top-level function and class chunks.
+
+    Returns None if the source cannot be parsed.
+    """
+    try:
+        module = ast.parse(source)
+    except (SyntaxError, ValueError):
+        return None
+
+    ranges = []
+    for node in module.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            kind = "def"
+        elif isinstance(node, ast.ClassDef):
+            kind = "class"
+        else:
+            continue
+        start_line = node.lineno
+        if node.decorator_list:
+            start_line = node.decorator_list[0].lineno
+        ranges.append((f"{kind}:{node.name}", start_line, node.end_lineno))
+
+    lines = split_lines(source)
+    return make_chunks(path, lines, fill_module_ranges(ranges, len(lines)))
+
+
+def chunk_tex(path: str, source: str) -> list[Chunk]:
+    """Split a TeX file into section chunks.
+
+    Lines before the first section form the 'preamble' chunk.
+    """
+    lines = split_lines(source)
+    ranges = []
+    name = "preamble"
+    start_line = 1
+    for line_number, line in enumerate(lines, start=1):
+        match = TEX_SECTION_PATTERN.match(line)
+        if match is None:
+            continue
+        if line_number > start_line:
+            ranges.append((name, start_line, line_number - 1))
+        name = f"{match.group(1)}:{match.group(2).strip()}"
+        start_line = line_number
+    if start_line <= len(lines):
+        ranges.append((name, start_line, len(lines)))
+    return make_chunks(path, lines, ranges)
+
+
+def chunk_file(path: str, source: str) -> list[Chunk]:
+    """Split a file into chunks.
+
+    Files of other languages, and Python files that cannot be parsed, form a
+    single 'file' chunk.
+    """
+    chunks = None
+    if path.endswith(".py"):
+        chunks = chunk_python(path, source)
+    elif path.endswith(".tex"):
+        chunks = chunk_tex(path, source)
+    if chunks is None:
+        lines = split_lines(source)
+        chunks = make_chunks(path, lines, [("file", 1, len(lines))])
+    return chunks
+
+
+def find_chunk(chunks: list[Chunk], chunk_id: str) -> Chunk | None:
+    """Find a chunk by its ID, with or without the path part."""
+    for chunk in chunks:
+        if chunk_id in (chunk.id, chunk.id.partition("::")[2]):
+            return chunk
+    return None
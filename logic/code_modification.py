@@ -8,7 +8,8 @@ import schemas
 import services.llm
 from utils.logging_utils import log
 
-from . import logic_exceptions, logic_utils
+from . import (bm25_index, chunker, context_packer, logic_exceptions,
+               logic_utils, prompt_layout, repo_context)
 
 
 @dataclasses.dataclass
@@ -18,6 +19,73 @@ class CodeModification:
     file_path: str
     before_code: str
     after_code: str
+    chunk_id: str | None = None
+
+
+MODIFICATION_KEYS = ("file_path", "before_code", "after_code")
+
+
+def make_modification_validator(repo: str):
+    """
+    生成中のCodeModificationのJSONをフィールドごとに検証する関数を作る
+
+    file_pathが存在しないファイルを指している場合や、before_codeがファイルに
+    含まれていない場合は、生成の完了を待たずにLLMJSONValidationExceptionを
+    発生させてストリームを中断する。
+    """
+    fields: dict[str, str] = {}
+
+    def validate(key: str, value):
+        if key not in MODIFICATION_KEYS:
+            return
+        if not isinstance(value, str):
+            raise services.llm.llm_exceptions.LLMJSONValidationException(
+                f"{key} must be a string.")
+        if key == "file_path":
+            try:
+                file_path = logic_utils.get_file_path(repo, value)
+            except ValueError as err:
+                log(f"Generated modification targets a path outside the "
+                    f"repository: {value}",
+                    level="warning")
+                raise services.llm.llm_exceptions.LLMJSONValidationException(
+                    f"{value} is outside the repository.") from err
+            if not os.path.isfile(file_path):
+                log(f"Generated modification targets a missing file: {value}",
+                    level="warning")
+                raise services.llm.llm_exceptions.LLMJSONValidationException(
+                    f"{value} does not exist.")
+        fields[key] = value
+        if key != "after_code" and "file_path" in fields and (
+                "before_code" in fields):
+            file_path = logic_utils.get_file_path(repo, fields["file_path"])
+            if fields["before_code"] not in logic_utils.get_file_content(
+                    file_path):
+                log(f"Generated before_code is not in {fields['file_path']}",
+                    level="warning")
+                raise services.llm.llm_exceptions.LLMJSONValidationException(
+                    f"before_code is not found in {fields['file_path']}.")
+
+    return validate
+
+
+def get_target_range(content: str,
+                     modification: CodeModification) -> tuple[int, int]:
+    """
+    before_codeを探す範囲を文字オフセットで取得する
+
+    chunk_idが指定されている場合はそのチャンクの範囲、指定されていないか
+    チャンクが見つからない場合はファイル全体の範囲を返す。
+    """
+    if modification.chunk_id:
+        chunks = chunker.chunk_file(modification.file_path, content)
+        chunk = chunker.find_chunk(chunks, modification.chunk_id)
+        if chunk is not None:
+            return chunk.offset, chunk.offset + len(chunk.text)
+        log(f"Chunk {modification.chunk_id} is not found, "
+            "the whole file is searched.",
+            level="warning")
+    return 0, len(content)
 
 
 def apply_modification(repo_name: str, modification: CodeModification) -> bool:
@@ -55,11 +123,15 @@ def apply_modification(repo_name: str, modification: CodeModification) -> bool:
         before_code = logic_utils.get_file_content(file_path, newline="")
 
         # 正規表現を使用して正確な置換を行う
+        # chunk_idが指定されている場合はそのチャンク内だけを置換する
+        start, end = get_target_range(before_code, modification)
         pattern = re.compile(re.escape(modification.before_code))
-        if not pattern.search(before_code):
+        if not pattern.search(before_code, start, end):
             raise logic_exceptions.CodeNotModifiedError("対象のコードが見つかりませんでした")
 
-        after_code = pattern.sub(modification.after_code, before_code, count=1)
+        after_code = before_code[:start] + pattern.sub(
+            modification.after_code, before_code[start:end],
+            count=1) + before_code[end:]
 
         # 変更がない場合もエラーを発生させる
         if before_code == after_code:
@@ -68,18 +140,20 @@ def apply_modification(repo_name: str, modification: CodeModification) -> bool:
         after_code = modification.after_code
 
     logic_utils.write_to_file(file_path, after_code, newline="")
+    repo_context.invalidate_contexts(repo_name)
     return True
 
 
+@services.llm.usage_ledger.stage("generate_modification_from_issue")
 def generate_modification_from_issue(
     repo: str,
     issue: schemas.Issue,
     code_lang: str,
+    context_mode: str = "full",
 ):
     """Generate a modification from an issue"""
-    messages = logic_utils.generate_messages_from_files(repo, code_lang)
-    messages.extend(logic_utils.generate_messages_from_issue(issue))
-    messages.append({
+    issue_messages = logic_utils.generate_messages_from_issue(issue)
+    system_message = {
         "role":
         "system",
         "content":
@@ -87,17 +161,35 @@ def generate_modification_from_issue(
          "and issues. Do not duplicate output if the code has already been "
          "changed. The JSON modification includes keys such as 'file_path', "
          "'before_code', 'after_code'. 'before_code' is a part of file.\n"
+         "Optionally include 'chunk_id', the top-level function, class or "
+         "section that contains 'before_code', such as "
+         "'path/to/file::def:func1', 'path/to/file::class:Class1' or "
+         "'path/to/file::section:Title', so that 'before_code' only has to be "
+         "unique within it.\n"
          "e.g.\n```{file_path: 'path/to/file', before_code: 'def func1(aaa: "
          "int):\n\"\"\"Output an argment\"\"\"\nprint(aaa)\n', after_code: "
          "'def func1(aaa: int, bbb: int):\n\"\"\"Output two argments\"\"\"\n"
          "print(aaa)\nprint(bbb)\n'}```\n"),
-    })
+    }
+    file_paths = repo_context.get_context_files(repo, code_lang, issue)
+    messages = repo_context.get_file_messages(repo, code_lang, file_paths,
+                                              context_mode)
+    messages = context_packer.pack_messages(
+        messages,
+        "generate_modification_from_issue",
+        [*issue_messages, system_message],
+        query=bm25_index.generate_query_from_issue(issue),
+    )
+    messages = prompt_layout.layout_prompt(system_message["content"],
+                                           messages, issue_messages)
     openai_client = services.llm.get_openai_client()
-    generated_json = services.llm.generate_json(messages, openai_client)
+    generated_json = services.llm.generate_json(
+        messages, openai_client, make_modification_validator(repo))
     return CodeModification(
         file_path=generated_json["file_path"],
         before_code=generated_json["before_code"],
         after_code=generated_json["after_code"],
+        chunk_id=generated_json.get("chunk_id"),
     )
 
 
@@ -106,9 +198,11 @@ def verify_modification(repo: str, modification: CodeModification):
     repo_path = logic_utils.get_repo_path(repo)
     file_path = os.path.join(repo_path, modification.file_path)
     before_code = logic_utils.get_file_content(file_path)
-    return modification.before_code in before_code
+    start, end = get_target_range(before_code, modification)
+    return modification.before_code in before_code[start:end]
 
 
+@services.llm.usage_ledger.stage("generate_commit_message")
 def generate_commit_message(repo, issue, modification: CodeModification):
     """Generate a commit message from an issue and a modification."""
     log(f"Generate commit message from issue and modification: {repo} {issue.id}"
@@ -120,12 +214,10 @@ def generate_commit_message(repo, issue, modification: CodeModification):
         "content":
         f"Before:\n{modification.before_code}\nAfter:\n{modification.after_code}",
     })
-    messages.append({
-        "role":
-        "system",
-        "content":
-        "Output commit message from the issue and the modification.",
-    })
+    messages = prompt_layout.layout_prompt(
+        "Output commit message from the issue and the modification.", [],
+        messages,
+        instruction_last=True)
     openai_client = services.llm.get_openai_client()
     commit_message: str = services.llm.generate_text(messages, openai_client)
 
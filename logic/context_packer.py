@@ -0,0 +1,186 @@
+"""A module to pack file messages into a per-action token budget."""
+
+from typing import Mapping, Sequence
+
+from config import config
+from utils.logging_utils import log
+from utils.token_utils import (MESSAGE_OVERHEAD_TOKENS, count_message_tokens,
+                               count_tokens)
+
+from . import bm25_index, chunker
+from .logic_utils import TRUNCATION_MARKER
+
+DEFAULT_TOKEN_BUDGET = 60000
+# Files are not truncated to fewer tokens than this, since tiny excerpts
+# rarely help the model.
+MIN_TRUNCATED_TOKENS = 256
+CODE_BLOCK_END = "```\n"
+CODE_BLOCK_START = "```"
+OUTLINE_SUFFIX = " (outline)"
+
+
+def get_token_budget(action: str) -> int:
+    """Get the token budget of the prompt for an action."""
+    budgets = config.get("token_budgets", {})
+    return budgets.get(action, budgets.get("default", DEFAULT_TOKEN_BUDGET))
+
+
+def parse_file_message(message: Mapping[str, str]) -> tuple[str, str] | None:
+    """Split a file message into its filename and source.
+
+    Returns None if the message is not a file message.
+    """
+    content = message["content"]
+    if not (content.startswith(CODE_BLOCK_START)
+            and content.endswith(CODE_BLOCK_END)):
+        return None
+    body = content[len(CODE_BLOCK_START):-len(CODE_BLOCK_END)]
+    filename, _, source = body.partition("\n")
+    return filename, source
+
+
+def get_omitted_label(chunk: chunker.Chunk) -> str:
+    """Get the line that replaces a chunk that does not fit."""
+    return chunk.label.replace("\n", " omitted\n")
+
+
+def truncate_by_chunks(
+    message: Mapping[str, str],
+    max_tokens: int,
+    query: str | None = None,
+) -> dict[str, str] | None:
+    """Truncate a file message to the whole chunks that fit into max_tokens.
+
+    Chunks are taken in descending order of BM25 score for the query, or in
+    order when no query is given, and are rendered in their original order
+    with a label line each. Chunks that do not fit are replaced with a label
+    line saying so.
+
+    Returns None if the file has a single chunk or no chunk fits.
+    """
+    parsed = parse_file_message(message)
+    if parsed is None or parsed[0].endswith(OUTLINE_SUFFIX):
+        return None
+    filename, source = parsed
+    chunks = chunker.chunk_file(filename, source)
+    if len(chunks) < 2:
+        return None
+
+    order = list(range(len(chunks)))
+    if query:
+        index = bm25_index.BM25Index()
+        for chunk in chunks:
+            index.add_document(chunk.id, chunk.text)
+        scores = dict(index.search(query, len(chunks)))
+        order.sort(key=lambda idx: -scores.get(chunks[idx].id, 0.0))
+
+    omitted_labels = [get_omitted_label(chunk) for chunk in chunks]
+    available = (max_tokens - MESSAGE_OVERHEAD_TOKENS -
+                 count_tokens(f"{CODE_BLOCK_START}{filename}\n" +
+                              CODE_BLOCK_END) -
+                 sum(map(count_tokens, omitted_labels)))
+    kept = set()
+    for idx in order:
+        # A kept chunk replaces its omitted label.
+        tokens = (count_tokens(chunks[idx].label + chunks[idx].text) -
+                  count_tokens(omitted_labels[idx]))
+        if tokens <= available:
+            kept.add(idx)
+            available -= tokens
+    if not kept:
+        return None
+
+    body = "".join(chunk.label + chunk.text if idx in kept else
+                   omitted_labels[idx] for idx, chunk in enumerate(chunks))
+    content = f"{CODE_BLOCK_START}{filename}\n{body}{CODE_BLOCK_END}"
+    return {**message, "content": content}
+
+
+def truncate_message(
+    message: Mapping[str, str],
+    max_tokens: int,
+    query: str | None = None,
+) -> dict[str, str]:
+    """Truncate a file message to fit into max_tokens.
+
+    Files are truncated to whole chunks when possible, and by whole lines
+    otherwise.
+    """
+    truncated = truncate_by_chunks(message, max_tokens, query)
+    if truncated is not None:
+        return truncated
+
+    content = message["content"]
+    suffix = TRUNCATION_MARKER
+    if content.endswith(CODE_BLOCK_END):
+        content = content[:-len(CODE_BLOCK_END)]
+        suffix += CODE_BLOCK_END
+
+    available = max_tokens - MESSAGE_OVERHEAD_TOKENS - count_tokens(suffix)
+    lines = []
+    for line in content.splitlines(keepends=True):
+        line_tokens = count_tokens(line)
+        if line_tokens > available:
+            break
+        lines.append(line)
+        available -= line_tokens
+    return {**message, "content": "".join(lines) + suffix}
+
+
+def pack_messages(
+    messages: Sequence[Mapping[str, str]],
+    action: str,
+    reserved_messages: list[dict[str, str]] | None = None,
+    priorities: list[float] | None = None,
+    query: str | None = None,
+) -> list[Mapping[str, str]]:
+    """Pick file messages that fit into the token budget of an action.
+
+    Messages are taken whole in descending order of priority (earlier
+    messages first when no priorities are given). The remaining budget is
+    then filled with the highest priority message that did not fit, truncated
+    by lines. The packed messages keep their original order.
+
+    Args:
+        messages: File messages generated by generate_messages_from_files.
+        action: The action whose token budget is used.
+        reserved_messages: Other messages of the prompt, such as the issue and
+            the system instruction, which are always sent.
+        priorities: Priority of each message. Higher is more important.
+        query: Text such as an issue, used to pick the chunks of a truncated
+            file.
+
+    Returns:
+        list[Mapping[str, str]]: A new list of the messages that fit into
+        the budget.
+    """
+    budget = get_token_budget(action)
+    remaining = budget - count_message_tokens(reserved_messages or [])
+    if priorities is None:
+        priorities = [0.0] * len(messages)
+    order = sorted(range(len(messages)), key=lambda idx: -priorities[idx])
+
+    packed: dict[int, Mapping[str, str]] = {}
+    skipped = []
+    for idx in order:
+        tokens = count_message_tokens([messages[idx]])
+        if tokens <= remaining:
+            packed[idx] = messages[idx]
+            remaining -= tokens
+        else:
+            skipped.append(idx)
+
+    truncated = 0
+    if skipped and remaining >= MIN_TRUNCATED_TOKENS:
+        packed[skipped[0]] = truncate_message(messages[skipped[0]], remaining,
+                                              query)
+        truncated = 1
+
+    log(
+        f"Packed context for {action}",
+        files=len(packed),
+        dropped=len(messages) - len(packed),
+        truncated=truncated,
+        budget=budget,
+    )
+    return [packed[idx] for idx in sorted(packed)]
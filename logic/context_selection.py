@@ -0,0 +1,23 @@
+"""A module to select the files sent to the LLM as context for an issue."""
+
+import schemas
+
+from . import bm25_index, import_graph
+
+
+def select_context_files(
+    repo: str,
+    code_lang: str,
+    issue: schemas.Issue,
+) -> list[str] | None:
+    """Select the files relevant to an issue and the files around them.
+
+    The files found by the BM25 index are expanded with their neighborhood
+    in the import graph, keeping the most relevant files first.
+
+    Returns:
+        list[str] | None: Relative paths of the files, or None if all files
+        should be used.
+    """
+    file_paths = bm25_index.search_relevant_files(repo, code_lang, issue)
+    return import_graph.expand_file_paths(repo, code_lang, file_paths)
@@ -0,0 +1,148 @@
+"""Persistent content-addressed cache for repository files."""
+
+import os
+import sqlite3
+import threading
+import time
+
+from config import config
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+class FileCache:
+    """An on-disk cache of file-derived values keyed by git blob SHA.
+
+    Each entry is addressed by a blob SHA and a key such as ``"content"`` or
+    ``"message:<path>"``. Entries are evicted in least recently used order
+    once their total size exceeds ``max_bytes``.
+
+    Stored values and access times are kept in memory until ``commit()``,
+    which writes them in one short transaction, so that processes sharing
+    the cache do not hold its write lock while they load files. The
+    database is in WAL mode, so reads do not wait for a writer.
+    """
+
+    def __init__(self, db_path: str, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn: sqlite3.Connection | None = None
+        # Values and last access times not written to the database yet.
+        self._pending: dict[tuple[str, str], tuple[str, float]] = {}
+        self._accessed: dict[tuple[str, str], float] = {}
+
+    def _connect(self) -> sqlite3.Connection:
+        """Open the cache database on first use."""
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(self.db_path,
+                                         timeout=30,
+                                         check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS entries ("
+                               "sha TEXT NOT NULL, "
+                               "key TEXT NOT NULL, "
+                               "value TEXT NOT NULL, "
+                               "size INTEGER NOT NULL, "
+                               "last_access REAL NOT NULL, "
+                               "PRIMARY KEY (sha, key))")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS entries_last_access "
+                               "ON entries (last_access)")
+        return self._conn
+
+    def get(self, sha: str, key: str) -> str | None:
+        """Return the cached value, or None if it is not cached."""
+        with self._lock:
+            now = time.time()
+            if (sha, key) in self._pending:
+                value = self._pending[(sha, key)][0]
+                self._pending[(sha, key)] = (value, now)
+                self.hits += 1
+                return value
+            row = self._connect().execute(
+                "SELECT value FROM entries WHERE sha = ? AND key = ?",
+                (sha, key),
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._accessed[(sha, key)] = now
+            return row[0]
+
+    def put(self, sha: str, key: str, value: str):
+        """Store a value for the blob on the next commit."""
+        with self._lock:
+            self._pending[(sha, key)] = (value, time.time())
+            self._accessed.pop((sha, key), None)
+
+    def commit(self):
+        """Persist pending changes and evict entries over the size bound."""
+        with self._lock:
+            if not self._pending and not self._accessed:
+                return
+            conn = self._connect()
+            with conn:
+                conn.executemany(
+                    "UPDATE entries SET last_access = ? "
+                    "WHERE sha = ? AND key = ?",
+                    [(last_access, sha, key) for (sha, key), last_access in
+                     self._accessed.items()],
+                )
+                conn.executemany(
+                    "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)",
+                    [(sha, key, value, len(value.encode()), last_access)
+                     for (sha, key), (value,
+                                      last_access) in self._pending.items()],
+                )
+                if self._pending:
+                    self._evict()
+            self._pending.clear()
+            self._accessed.clear()
+
+    def _evict(self):
+        """Delete least recently used entries until the cache fits."""
+        conn = self._connect()
+        total = conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        rows = conn.execute(
+            "SELECT sha, key, size FROM entries ORDER BY last_access")
+        evicted = []
+        for sha, key, size in rows:
+            if total <= self.max_bytes:
+                break
+            evicted.append((sha, key))
+            total -= size
+        conn.executemany("DELETE FROM entries WHERE sha = ? AND key = ?",
+                         evicted)
+
+    def stats(self) -> dict[str, int]:
+        """Return hit/miss counters and the current size of the cache."""
+        with self._lock:
+            entries, size = self._connect().execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries"
+            ).fetchone()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": entries,
+            "bytes": size,
+        }
+
+
+_file_caches: dict[str, FileCache] = {}
+
+
+def get_file_cache() -> FileCache:
+    """Return the process-wide file cache for the configured cache path."""
+    db_path = os.path.join(config.get("cache_path", ".cache"),
+                           "file_cache.sqlite3")
+    if db_path not in _file_caches:
+        _file_caches[db_path] = FileCache(
+            db_path,
+            config.get("file_cache_max_bytes", DEFAULT_MAX_BYTES),
+        )
+    return _file_caches[db_path]
@@ -0,0 +1,190 @@
+"""A module to load repository files in parallel.
+
+Files are read on a thread pool so that the I/O latency of slow file systems
+such as NFS overlaps. The first bytes of each file are sniffed to skip binary
+files, files larger than config["max_file_bytes"] are skipped, and only the
+first config["max_decode_bytes"] bytes of a file are read and decoded. Files
+larger than config["mmap_threshold_bytes"] are memory-mapped.
+"""
+
+import dataclasses
+import functools
+import mmap
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from config import config
+from utils.logging_utils import log
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+SNIFF_BYTES = 8 * 1024
+BATCH_SIZE = 64
+DEFAULT_WORKERS = 8
+DEFAULT_MAX_FILE_BYTES = 4 * 1024 * 1024
+DEFAULT_MMAP_THRESHOLD_BYTES = 1024 * 1024
+DEFAULT_MAX_DECODE_BYTES = 256 * 1024
+
+
+@dataclasses.dataclass
+class LoadedFile:
+    """The decoded content of a file."""
+
+    content: str
+    size: int
+    truncated: bool = False
+
+
+@dataclasses.dataclass
+class LoadStats:
+    """Throughput of a load_files call."""
+
+    files: int = 0
+    skipped: int = 0
+    bytes: int = 0
+    seconds: float = 0.0
+
+    @property
+    def files_per_second(self) -> float:
+        """Loaded files per second."""
+        return self.files / self.seconds if self.seconds else 0.0
+
+    @property
+    def mb_per_second(self) -> float:
+        """Loaded megabytes per second."""
+        return self.bytes / 1024 / 1024 / self.seconds if self.seconds else 0.0
+
+
+def get_peak_rss_mb() -> float | None:
+    """Get the peak resident set size of the process in megabytes."""
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS.
+    divisor = 1024 * 1024 if os.uname().sysname == "Darwin" else 1024
+    return max_rss / divisor
+
+
+def is_binary(head: bytes) -> bool:
+    """Check if the first bytes of a file look like a binary file."""
+    return b"\0" in head
+
+
+def decode(data: bytes, truncated: bool) -> str | None:
+    """Decode file content as UTF-8 with universal newlines.
+
+    A truncated head may end in the middle of a character, so the incomplete
+    character is dropped. Returns None if the content is not UTF-8.
+    """
+    try:
+        text = data.decode("utf-8", errors="ignore" if truncated else "strict")
+    except UnicodeDecodeError:
+        return None
+    return text.replace("\r\n", "\n").replace("\r", "\n")
+
+
+def read_file(file_path: str, max_file_bytes: int, mmap_threshold_bytes: int,
+              max_decode_bytes: int) -> LoadedFile | None:
+    """Read and decode a file, or return None if it should be skipped."""
+    # The file is read through its descriptor because mmap needs one anyway.
+    fd = os.open(file_path, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+    try:
+        size = os.fstat(fd).st_size
+        if size > max_file_bytes:
+            log(f"Skipped oversized file: {file_path}", size=size)
+            return None
+        truncated = size > max_decode_bytes
+        if size > mmap_threshold_bytes:
+            with mmap.mmap(fd, 0, access=mmap.ACCESS_READ) as mapped:
+                if is_binary(mapped[:SNIFF_BYTES]):
+                    return None
+                data = mapped[:max_decode_bytes]
+        else:
+            read_size = min(size, max_decode_bytes)
+            data = os.read(fd, read_size)
+            while len(data) < read_size:
+                chunk = os.read(fd, read_size - len(data))
+                if not chunk:
+                    break
+                data += chunk
+            if is_binary(data[:SNIFF_BYTES]):
+                return None
+    finally:
+        os.close(fd)
+
+    content = decode(data, truncated)
+    if content is None:
+        log(f"Skipped non UTF-8 file: {file_path}")
+        return None
+    return LoadedFile(content, size, truncated)
+
+
+def load_batch(file_paths: list[str],
+               limits: tuple[int, int, int]) -> list[LoadedFile | None]:
+    """Load a batch of files, with None for files that are skipped.
+
+    limits are the arguments of read_file after file_path.
+    """
+    loaded_files = []
+    for file_path in file_paths:
+        try:
+            loaded_files.append(read_file(file_path, *limits))
+        except OSError as err:
+            log(f"Failed to read {file_path}: {err}", level="warning")
+            loaded_files.append(None)
+    return loaded_files
+
+
+def load_files(file_paths: list[str]) -> list[LoadedFile | None]:
+    """Load files in parallel.
+
+    Returns:
+        list[LoadedFile | None]: The loaded files in the order of file_paths,
+        with None for skipped files.
+    """
+    if not file_paths:
+        return []
+
+    start = time.perf_counter()
+    limits = (
+        config.get("max_file_bytes", DEFAULT_MAX_FILE_BYTES),
+        config.get("mmap_threshold_bytes", DEFAULT_MMAP_THRESHOLD_BYTES),
+        config.get("max_decode_bytes", DEFAULT_MAX_DECODE_BYTES),
+    )
+    workers = min(config.get("file_loader_workers", DEFAULT_WORKERS),
+                  len(file_paths))
+    # Files are submitted in batches because the overhead of a task is
+    # comparable to reading a small file from the page cache, while small
+    # loads are still spread over all workers.
+    batch_size = max(1, min(BATCH_SIZE, len(file_paths) // (workers * 4)))
+    batches = [
+        file_paths[idx:idx + batch_size]
+        for idx in range(0, len(file_paths), batch_size)
+    ]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        loaded_files = [
+            loaded_file for batch in executor.map(
+                functools.partial(load_batch, limits=limits), batches)
+            for loaded_file in batch
+        ]
+
+    stats = LoadStats(seconds=time.perf_counter() - start)
+    for loaded_file in loaded_files:
+        if loaded_file is None:
+            stats.skipped += 1
+        else:
+            stats.files += 1
+            stats.bytes += loaded_file.size
+    log(
+        "Loaded files",
+        files=stats.files,
+        skipped=stats.skipped,
+        files_per_second=f"{stats.files_per_second:.0f}",
+        mb_per_second=f"{stats.mb_per_second:.1f}",
+        peak_rss_mb=f"{get_peak_rss_mb() or 0:.1f}",
+    )
+    return loaded_files
@@ -0,0 +1,230 @@
+"""A module to expand context files along the import graph of a repository."""
+
+import ast
+import json
+import os
+import threading
+import time
+from collections import deque
+
+from config import config
+from utils.logging_utils import log
+from utils.path_utils import safe_join
+
+from . import file_cache, index_manifest, logic_utils
+
+INDEX_NAME = "import_graph"
+DEFAULT_HOPS = 1
+
+
+def get_module_name(path: str) -> str:
+    """Get the dotted module name of a relative path such as 'pkg/mod.py'."""
+    module_path = path[:-len(".py")] if path.endswith(".py") else path
+    parts = module_path.split("/")
+    if parts[-1] == "__init__":
+        parts = parts[:-1]
+    return ".".join(parts)
+
+
+def parse_imports(path: str, source: str) -> list[list[str]]:
+    """Parse the imports of a module.
+
+    Each import is a list of candidate module names, the most specific
+    first, because 'from pkg import name' may import either the module
+    'pkg.name' or an attribute of 'pkg'.
+    """
+    try:
+        module = ast.parse(source)
+    except (SyntaxError, ValueError):
+        return []
+
+    package = get_module_name(path).split(".")
+    if not path.endswith("__init__.py"):
+        package = package[:-1]
+
+    imports = []
+    for node in ast.walk(module):
+        if isinstance(node, ast.Import):
+            imports.extend([alias.name] for alias in node.names)
+        elif isinstance(node, ast.ImportFrom):
+            base = node.module.split(".") if node.module else []
+            if node.level:
+                base = package[:max(0,
+                                    len(package) - node.level + 1)] + base
+            imports.extend([".".join(base + [alias.name]), ".".join(base)]
+                           for alias in node.names)
+    return imports
+
+
+class ImportGraph:
+    """A module import graph of the Python files of a repository."""
+
+    def __init__(self, imports: dict[str, list[list[str]]] | None = None):
+        self.imports = imports or {}
+        self.edges: dict[str, set[str]] = {}
+        self.reverse_edges: dict[str, set[str]] = {}
+        self.resolve()
+
+    def resolve(self):
+        """Resolve the parsed imports to files of the repository.
+
+        An import also matches a module by the trailing part of its name, so
+        that imports of 'pkg.mod' resolve to 'src/pkg/mod.py'.
+        """
+        modules: dict[str, list[str]] = {}
+        for path in self.imports:
+            parts = get_module_name(path).split(".")
+            for idx in range(len(parts)):
+                modules.setdefault(".".join(parts[idx:]), []).append(path)
+
+        self.edges = {path: set() for path in self.imports}
+        self.reverse_edges = {path: set() for path in self.imports}
+        for path, imports in self.imports.items():
+            for candidates in imports:
+                for name in candidates:
+                    targets = modules.get(name)
+                    if targets:
+                        # Prefer the exact module name over suffix matches.
+                        target = min(targets, key=len)
+                        if target != path:
+                            self.edges[path].add(target)
+                            self.reverse_edges[target].add(path)
+                        break
+
+    def neighborhood(self, seeds: list[str], hops: int) -> list[str]:
+        """Get the files within hops of the seeds in either direction.
+
+        Returns:
+            list[str]: The seeds followed by the other files ordered by
+            distance and path.
+        """
+        distances = {seed: 0 for seed in seeds if seed in self.edges}
+        queue = deque(distances)
+        while queue:
+            path = queue.popleft()
+            if distances[path] == hops:
+                continue
+            for neighbor in sorted(self.edges[path] | self.reverse_edges[path]):
+                if neighbor not in distances:
+                    distances[neighbor] = distances[path] + 1
+                    queue.append(neighbor)
+        neighbors = sorted((path for path in distances if path not in seeds),
+                           key=lambda path: (distances[path], path))
+        return [*seeds, *neighbors]
+
+    def save(self, graph_path: str):
+        """Save the parsed imports as a JSON file."""
+        os.makedirs(os.path.dirname(graph_path), exist_ok=True)
+        tmp_path = f"{graph_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as file_object:
+            json.dump(self.imports, file_object)
+        os.replace(tmp_path, graph_path)
+
+    @classmethod
+    def load(cls, graph_path: str) -> "ImportGraph | None":
+        """Load a graph saved by save, or return None if there is none."""
+        try:
+            with open(graph_path) as file_object:
+                return cls(json.load(file_object))
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+
+def get_graph_path(repo: str) -> str:
+    """Get the path of the import graph file of a repository."""
+    return safe_join(config.get("cache_path", ".cache"), INDEX_NAME, repo,
+                     "python.json")
+
+
+def parse_file_imports(
+    repo: str,
+    file_paths: list[str] | None = None,
+) -> dict[str, list[list[str]]]:
+    """Parse the imports of Python files, caching them per blob."""
+    blob_shas = logic_utils.get_clean_blob_shas(repo)
+    cache = file_cache.get_file_cache()
+    imports = {}
+    missing = []
+    for filename, file_path in logic_utils.enumerate_repo_files(
+            repo, "python", file_paths):
+        path = filename.replace(os.sep, "/")
+        blob_sha = blob_shas.get(path)
+        cached = cache.get(blob_sha, "imports") if blob_sha else None
+        if cached is None:
+            missing.append((filename, file_path))
+        else:
+            imports[path] = json.loads(cached)
+
+    contents = logic_utils.load_file_contents(cache, missing, blob_shas)
+    for filename, _ in missing:
+        path = filename.replace(os.sep, "/")
+        loaded_file = contents.get(filename)
+        imports[path] = parse_imports(
+            path, loaded_file.content) if loaded_file else []
+        blob_sha = blob_shas.get(path)
+        if blob_sha and loaded_file and not loaded_file.truncated:
+            cache.put(blob_sha, "imports", json.dumps(imports[path]))
+    cache.commit()
+    return imports
+
+
+def build_graph(repo: str) -> ImportGraph:
+    """Build the import graph from all Python files of a repository."""
+    start = time.perf_counter()
+    graph = ImportGraph(parse_file_imports(repo))
+    log(
+        f"Built import graph of {repo}",
+        modules=len(graph.edges),
+        edges=sum(map(len, graph.edges.values())),
+        seconds=f"{time.perf_counter() - start:.3f}",
+    )
+    return graph
+
+
+def get_repository_graph(repo: str) -> ImportGraph | None:
+    """Get the import graph of the current HEAD, refreshing it when stale."""
+    graph_path = get_graph_path(repo)
+
+    def rebuild():
+        nonlocal graph
+        graph = build_graph(repo)
+        graph.save(graph_path)
+
+    def update(changes: index_manifest.ChangeSet):
+        for path in changes.deleted:
+            graph.imports.pop(path, None)
+        graph.imports.update(
+            parse_file_imports(repo, changes.added + changes.modified))
+        graph.resolve()
+        graph.save(graph_path)
+
+    with index_manifest.get_lock(repo, "python", INDEX_NAME):
+        graph = ImportGraph.load(graph_path)
+        if not index_manifest.refresh(repo, "python", INDEX_NAME, rebuild,
+                                      update, graph is None):
+            return None
+    return graph
+
+
+def expand_file_paths(
+    repo: str,
+    code_lang: str,
+    file_paths: list[str] | None,
+    hops: int | None = None,
+) -> list[str] | None:
+    """Expand seed files with the files they import and are imported by.
+
+    Only Python repositories have an import graph. Other file_paths are
+    returned as they are.
+    """
+    if code_lang != "python" or not file_paths:
+        return file_paths
+    graph = get_repository_graph(repo)
+    if graph is None:
+        return file_paths
+
+    if hops is None:
+        hops = config.get("import_graph_hops", DEFAULT_HOPS)
+    expanded = graph.neighborhood(file_paths, hops)
+    log(f"Expanded context files along imports: {expanded}")
+    return expanded
@@ -0,0 +1,156 @@
+"""A module to keep per-repository derived data in sync with HEAD.
+
+The manifest records the HEAD that each derived index was last built from,
+per repository and code_lang. When HEAD moves, only the files added,
+modified or deleted between the two commits are applied to the index.
+An index is loaded, refreshed and saved under the lock of get_lock, so that
+parallel jobs do not overwrite each other's updates.
+"""
+
+import dataclasses
+import json
+import os
+import threading
+from typing import Callable
+
+import services.github
+from config import config
+from services.github import exceptions
+from utils.lock_utils import FileLock
+from utils.logging_utils import log
+
+from . import logic_utils
+
+
+@dataclasses.dataclass
+class ChangeSet:
+    """Target files changed between two commits."""
+
+    added: list[str] = dataclasses.field(default_factory=list)
+    modified: list[str] = dataclasses.field(default_factory=list)
+    deleted: list[str] = dataclasses.field(default_factory=list)
+
+
+def get_manifest_path() -> str:
+    """Get the path of the manifest file."""
+    return os.path.join(config.get("cache_path", ".cache"),
+                        "index_manifest.json")
+
+
+def get_lock(repo: str, code_lang: str, index_name: str) -> FileLock:
+    """Get the lock of an index, to hold from loading it until it is saved."""
+    return FileLock(
+        os.path.join(config.get("cache_path", ".cache"), "locks", repo,
+                     f"{code_lang}.{index_name}.lock"))
+
+
+def load_manifest() -> dict[str, dict[str, dict[str, str]]]:
+    """Load the manifest as {repo: {code_lang: {index_name: head}}}."""
+    try:
+        with open(get_manifest_path()) as file_object:
+            return json.load(file_object)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def save_manifest(manifest: dict[str, dict[str, dict[str, str]]]):
+    """Save the manifest atomically."""
+    manifest_path = get_manifest_path()
+    os.makedirs(os.path.dirname(manifest_path), exist_ok=True)
+    tmp_path = f"{manifest_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w") as file_object:
+        json.dump(manifest, file_object, indent=2)
+    os.replace(tmp_path, manifest_path)
+
+
+def get_indexed_head(repo: str, code_lang: str, index_name: str) -> str | None:
+    """Get the HEAD the index was last built from."""
+    return load_manifest().get(repo, {}).get(code_lang, {}).get(index_name)
+
+
+def set_indexed_head(repo: str, code_lang: str, index_name: str, head: str):
+    """Record the HEAD the index was built from."""
+    # The manifest is shared by all the indexes.
+    with FileLock(f"{get_manifest_path()}.lock"):
+        manifest = load_manifest()
+        manifest.setdefault(repo, {}).setdefault(code_lang,
+                                                 {})[index_name] = head
+        save_manifest(manifest)
+
+
+def get_changes(repo: str, code_lang: str, old_head: str,
+                new_head: str) -> ChangeSet | None:
+    """Get the target files changed between two commits.
+
+    Returns None when the diff is not available, for example when the old
+    commit no longer exists after a force push.
+    """
+    try:
+        name_statuses = services.github.diff_name_status(
+            repo, old_head, new_head)
+    except (exceptions.CommandExecutionException, OSError) as err:
+        log(f"Failed to diff {old_head}..{new_head}: {err}", level="warning")
+        return None
+
+    changes = ChangeSet()
+    for status, path in name_statuses:
+        if not logic_utils.is_target_path(path, code_lang):
+            continue
+        if status.startswith("A"):
+            changes.added.append(path)
+        elif status.startswith("D"):
+            changes.deleted.append(path)
+        else:
+            changes.modified.append(path)
+    return changes
+
+
+def refresh(
+    repo: str,
+    code_lang: str,
+    index_name: str,
+    rebuild: Callable[[], None],
+    update: Callable[[ChangeSet], None],
+    force_rebuild: bool = False,
+) -> bool:
+    """Bring a derived index up to date with HEAD.
+
+    The caller holds the lock of get_lock from before the index is loaded.
+
+    Args:
+        repo: The repository name.
+        code_lang: The language of the indexed files.
+        index_name: The name of the index in the manifest.
+        rebuild: Called to build the index from scratch.
+        update: Called with the changed files to update the index.
+        force_rebuild: Rebuild regardless of the manifest, for example when
+            the stored index is missing.
+
+    Returns:
+        bool: False if HEAD is not available and the index cannot be used.
+    """
+    try:
+        head = services.github.get_head_sha(repo)
+    except (exceptions.CommandExecutionException, OSError) as err:
+        log(f"Failed to get HEAD of {repo}, {index_name} is not used: {err}",
+            level="warning")
+        return False
+
+    indexed_head = get_indexed_head(repo, code_lang, index_name)
+    if indexed_head == head and not force_rebuild:
+        return True
+
+    changes = None
+    if indexed_head is not None and not force_rebuild:
+        changes = get_changes(repo, code_lang, indexed_head, head)
+    if changes is None:
+        log(f"Rebuilding {index_name} of {repo} at {head}")
+        rebuild()
+    else:
+        log(f"Updating {index_name} of {repo} to {head}",
+            added=len(changes.added),
+            modified=len(changes.modified),
+            deleted=len(changes.deleted))
+        update(changes)
+    set_indexed_head(repo, code_lang, index_name, head)
+    return True
@@ -1,11 +1,50 @@
 """Utility functions for logic operations."""
 
 import os
+from typing import Iterator
 
 import schemas
+import services.github
 from config import config
+from services.github import exceptions
+from utils import github_utils
+from utils.logging_utils import log
 from utils.path_utils import safe_join, safe_open
 
+from . import file_cache, file_loader, outline
+
+# Ends the content of a file that is sent only in part.
+TRUNCATION_MARKER = "... (truncated)\n"
+
+EXTENSION_DICT = {
+    "python": [".py"],
+    "tex": [".tex"],
+}
+CONTEXT_MODES = ["full", "outline"]
+
+
+def list_git_file_paths(repo: str, code_lang: str) -> list[str] | None:
+    """List target files of the repository from the git index.
+
+    Gitignored files are skipped without walking their directories.
+    Untracked files that are not ignored are also included if
+    config["include_untracked_files"] is set.
+
+    Returns:
+        list[str] | None: Relative paths of the files, or None if the
+        repository is not a git repository.
+    """
+    try:
+        return services.github.list_files(
+            repo,
+            config.get("include_untracked_files", False),
+            [f"*{extension}" for extension in EXTENSION_DICT[code_lang]],
+        )
+    except (exceptions.CommandExecutionException, OSError) as err:
+        log(f"Failed to list files with git, walking the directory: {err}",
+            level="warning")
+        return None
+
 
 def enumerate_target_file_paths(repo_path: str, target_extension: list[str]):
     """Enumerate target files in the repository."""
@@ -15,11 +54,11 @@ def enumerate_target_file_paths(repo_path: str, target_extension: list[str]):
 
 
 def enumerate_file_paths(repo_path: str):
-    """Enumerate all files in the repository."""
+    """Enumerate all files in the repository in a deterministic order."""
     for root, dirs, files in os.walk(repo_path):
         # Limit the directories to explore
-        dirs[:] = list(filter(is_target_dir, dirs))
-        for file_name in files:
+        dirs[:] = sorted(filter(is_target_dir, dirs))
+        for file_name in sorted(files):
             yield os.path.join(root, file_name)
 
 
@@ -34,6 +73,13 @@ def is_target_file(file_name: str, target_extension: list[str]):
     return file_name.endswith(tuple(target_extension))
 
 
+def is_target_path(path: str, code_lang: str):
+    """Check if a relative path is a target file outside excluded directories."""
+    *dir_names, file_name = path.split("/")
+    return all(map(is_target_dir, dir_names)) and is_target_file(
+        file_name, EXTENSION_DICT[code_lang])
+
+
 def get_file_content(file_path: str, newline: str | None = None):
     """Get the content of a file."""
     with open(file_path, "r", newline=newline) as file_object:
@@ -46,8 +92,12 @@ def get_file_path(repo: str, file_name: str):
 
 
 def get_repo_path(repo: str):
-    """リポジトリパスを取得します"""
-    return safe_join(config["repository_path"], repo)
+    """リポジトリパスを取得します
+
+    ジョブがworktreeで実行されている場合は、そのworktreeのパスを返します。
+    """
+    return github_utils.get_worktree_path(repo) or safe_join(
+        config["repository_path"], repo)
 
 
 def write_to_file(file_path: str, content: str, newline: str | None = None):
@@ -71,26 +121,197 @@ def generate_messages_from_issue(issue: schemas.Issue):
     return messages
 
 
-def generate_messages_from_files(repo: str, code_lang: str):
-    """Generate LLM messages from files"""
+def get_clean_blob_shas(repo: str) -> dict[str, str]:
+    """Get blob SHAs of files whose working tree content matches HEAD."""
+    try:
+        blob_shas = services.github.list_blob_shas(repo)
+        modified_paths = services.github.list_modified_paths(repo)
+    except (exceptions.CommandExecutionException, OSError) as err:
+        log(f"Blob SHAs are not available, files are read directly: {err}",
+            level="warning")
+        return {}
+    for path in modified_paths:
+        blob_shas.pop(path, None)
+    return blob_shas
 
-    extension_dict = {
-        "python": [".py"],
-        "tex": [".tex"],
-    }
-    target_extension = extension_dict[code_lang]
 
-    messages = []
+def render_file_message(filename: str,
+                        content: str,
+                        truncated: bool = False) -> str:
+    """Render the content of a file as an LLM message.
+
+    The head of a truncated file is followed by TRUNCATION_MARKER, so that
+    it is not taken for the whole file.
+    """
+    if truncated:
+        if content and not content.endswith("\n"):
+            content += "\n"
+        content += TRUNCATION_MARKER
+    return f"```{filename}\n{content}```\n"
+
+
+def load_file_contents(
+    cache: file_cache.FileCache,
+    files: list[tuple[str, str]],
+    blob_shas: dict[str, str],
+) -> dict[str, file_loader.LoadedFile]:
+    """Load the contents of files, using the cache when the blob is known.
+
+    Files missing from the cache are loaded in parallel. Binary, oversized
+    and unreadable files are left out of the result.
+
+    Args:
+        cache: The file cache.
+        files: Pairs of the relative and full path of the files.
+        blob_shas: Blob SHAs of files whose content matches HEAD.
+
+    Returns:
+        dict[str, file_loader.LoadedFile]: The contents keyed by relative
+        path.
+    """
+    contents = {}
+    missing = []
+    for filename, file_path in files:
+        blob_sha = blob_shas.get(filename.replace(os.sep, "/"))
+        content = cache.get(blob_sha, "content") if blob_sha else None
+        if content is None:
+            missing.append((filename, file_path, blob_sha))
+        else:
+            contents[filename] = file_loader.LoadedFile(content, len(content))
+
+    loaded_files = file_loader.load_files(
+        [file_path for _, file_path, _ in missing])
+    for (filename, _, blob_sha), loaded_file in zip(missing, loaded_files):
+        if loaded_file is None:
+            continue
+        contents[filename] = loaded_file
+        # Truncated heads of large files are not the content of the blob.
+        if blob_sha and not loaded_file.truncated:
+            cache.put(blob_sha, "content", loaded_file.content)
+    return contents
+
+
+def enumerate_repo_files(
+    repo: str,
+    code_lang: str,
+    file_paths: list[str] | None = None,
+) -> Iterator[tuple[str, str]]:
+    """Enumerate pairs of the relative and full path of target files.
+
+    When file_paths is given, only those files are enumerated in that order.
+    """
     repo_path = get_repo_path(repo)
+    if file_paths is not None:
+        for filename in file_paths:
+            yield filename, safe_join(repo_path, filename)
+        return
 
-    for file_path in enumerate_target_file_paths(repo_path, target_extension):
-        with open(file_path, "r") as file_object:
-            content = file_object.read()
-        filename = file_path[len(repo_path) + 1:]
-        messages.append({
-            "role": "user",
-            "content": f"```{filename}\n{content}```\n"
-        })
+    git_file_paths = list_git_file_paths(repo, code_lang)
+    if git_file_paths is None:
+        target_extension = EXTENSION_DICT[code_lang]
+        for file_path in enumerate_target_file_paths(repo_path,
+                                                     target_extension):
+            yield file_path[len(repo_path) + 1:], file_path
+        return
+
+    # Files are filtered by extension with git pathspecs, so only their
+    # directories are checked here, once per directory.
+    is_target_dir_path: dict[str, bool] = {}
+    for filename in git_file_paths:
+        dir_path = filename.rpartition("/")[0]
+        if dir_path not in is_target_dir_path:
+            is_target_dir_path[dir_path] = all(
+                map(is_target_dir, dir_path.split("/"))) if dir_path else True
+        if is_target_dir_path[dir_path]:
+            yield filename, f"{repo_path}{os.sep}{filename}"
+
+
+def generate_messages_from_files(
+    repo: str,
+    code_lang: str,
+    file_paths: list[str] | None = None,
+    context_mode: str = "full",
+):
+    """Generate LLM messages from files
+
+    Args:
+        repo: The repository name.
+        code_lang: The language of the target files.
+        file_paths: Relative paths of the files to use, such as the result of
+            search_relevant_files. All target files are used if None.
+        context_mode: "full" sends the source of the files. "outline" sends
+            the source of file_paths only, followed by the outlines of all
+            other files. "outline" is available for python only.
+    """
+    outline_mode = context_mode == "outline"
+    if outline_mode and code_lang != "python":
+        log(f"Outline context mode is not available for {code_lang}.",
+            level="warning")
+        outline_mode = False
+
+    if outline_mode:
+        file_paths = file_paths or []
+    files = list(enumerate_repo_files(repo, code_lang, file_paths))
+    full_paths = {filename for filename, _ in files}
+    if outline_mode:
+        files.extend((filename, file_path)
+                     for filename, file_path in enumerate_repo_files(
+                         repo, code_lang) if filename not in full_paths)
+
+    blob_shas = get_clean_blob_shas(repo)
+    cache = file_cache.get_file_cache()
+
+    # Messages and outlines are cached per blob, so the files are loaded
+    # only when they are not.
+    rendered = {}
+    missing = []
+    for filename, file_path in files:
+        blob_sha = blob_shas.get(filename.replace(os.sep, "/"))
+        if filename in full_paths:
+            cached = cache.get(blob_sha,
+                               f"message:{filename}") if blob_sha else None
+        else:
+            cached = cache.get(blob_sha, "outline") if blob_sha else None
+            if cached is not None:
+                cached = render_file_message(f"{filename} (outline)", cached)
+        if cached is None:
+            missing.append((filename, file_path))
+        else:
+            rendered[filename] = cached
+
+    contents = load_file_contents(cache, missing, blob_shas)
+    for filename, _ in missing:
+        if filename not in contents:
+            continue
+        content = contents[filename].content
+        truncated = contents[filename].truncated
+        blob_sha = blob_shas.get(filename.replace(os.sep, "/"))
+        if truncated:
+            blob_sha = None
+        if filename in full_paths:
+            rendered[filename] = render_file_message(filename, content,
+                                                     truncated)
+            if blob_sha:
+                cache.put(blob_sha, f"message:{filename}", rendered[filename])
+            continue
+        # Files that cannot be parsed are sent in full.
+        outline_text = outline.generate_outline(content)
+        if outline_text is None:
+            rendered[filename] = render_file_message(filename, content,
+                                                     truncated)
+        else:
+            rendered[filename] = render_file_message(f"{filename} (outline)",
+                                                     outline_text, truncated)
+            if blob_sha:
+                cache.put(blob_sha, "outline", outline_text)
+
+    messages = [{
+        "role": "user",
+        "content": rendered[filename]
+    } for filename, _ in files if filename in rendered]
+    if blob_shas:
+        cache.commit()
+        log("File cache stats", **cache.stats())
     return messages
 
 
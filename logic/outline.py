@@ -0,0 +1,64 @@
+"""A module to generate outlines of Python source code."""
+
+import ast
+import copy
+
+ELLIPSIS = ast.Expr(value=ast.Constant(value=Ellipsis))
+# Assigned values longer than this are replaced with an ellipsis.
+MAX_VALUE_LENGTH = 60
+
+
+def get_docstring_body(node: ast.AST) -> list[ast.stmt]:
+    """Get the docstring statement of a node as a list."""
+    body = getattr(node, "body", [])
+    if ast.get_docstring(node, clean=False) is not None:
+        return [body[0]]
+    return []
+
+
+def outline_node(node: ast.stmt) -> ast.stmt | None:
+    """Reduce a statement to its signature and docstring.
+
+    Functions keep their decorators, arguments and return annotations, and
+    classes keep the outlines of their members. Assignments keep short
+    values only. Other statements are dropped.
+    """
+    if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+        outlined = copy.copy(node)
+        outlined.body = get_docstring_body(node) + [ELLIPSIS]
+        return outlined
+    if isinstance(node, ast.ClassDef):
+        members = [
+            outlined for outlined in map(outline_node, node.body)
+            if outlined is not None
+        ]
+        outlined = copy.copy(node)
+        outlined.body = get_docstring_body(node) + (members or [ELLIPSIS])
+        return outlined
+    if isinstance(node, (ast.Assign, ast.AnnAssign)):
+        outlined = copy.copy(node)
+        if node.value is not None and len(ast.unparse(
+                node.value)) > MAX_VALUE_LENGTH:
+            outlined.value = ast.Constant(value=Ellipsis)
+        return outlined
+    return None
+
+
+def generate_outline(source: str) -> str | None:
+    """Generate the outline of a Python module.
+
+    The outline consists of the module docstring, top-level assignments and
+    the signatures and docstrings of classes and functions.
+
+    Returns:
+        str | None: The outline, or None if the source cannot be parsed.
+    """
+    try:
+        module = ast.parse(source)
+    except (SyntaxError, ValueError):
+        return None
+    body = get_docstring_body(module) + [
+        outlined for outlined in map(outline_node, module.body)
+        if outlined is not None
+    ]
+    return ast.unparse(ast.Module(body=body, type_ignores=[])) + "\n"
@@ -0,0 +1,77 @@
+"""A module to lay out prompts so that consecutive calls share a prefix.
+
+LLM providers cache the longest common prefix of prompts. The static
+instruction comes first, then the file messages sorted by path, and then the
+parts that vary between calls, such as the issue and its comments. Calls
+against the same snapshot of a repository then share everything up to the
+variable part, which is logged as a fingerprint per call. Instructions that
+refer to the content above them are placed last instead.
+"""
+
+import hashlib
+import json
+from typing import Mapping, Sequence
+
+from utils.logging_utils import log
+from utils.token_utils import count_message_tokens
+
+from . import context_packer
+
+
+def sort_file_messages(
+        messages: Sequence[Mapping[str, str]]) -> list[Mapping[str, str]]:
+    """Sort file messages by path.
+
+    Other messages follow the file messages in their original order.
+    """
+
+    def get_key(message: Mapping[str, str]) -> tuple[int, str]:
+        parsed = context_packer.parse_file_message(message)
+        if parsed is None:
+            return 1, ""
+        return 0, parsed[0]
+
+    return sorted(messages, key=get_key)
+
+
+def get_prefix_fingerprint(messages: Sequence[Mapping[str, str]]) -> str:
+    """Hash messages, so that equal prompt prefixes have equal fingerprints."""
+    canonical = json.dumps([dict(message) for message in messages],
+                           ensure_ascii=False,
+                           separators=(",", ":"),
+                           sort_keys=True)
+    return hashlib.sha256(canonical.encode()).hexdigest()[:16]
+
+
+def layout_prompt(
+    system_instruction: str,
+    messages: Sequence[Mapping[str, str]],
+    variable_messages: Sequence[Mapping[str, str]] = (),
+    instruction_last: bool = False,
+) -> list[Mapping[str, str]]:
+    """Lay out a prompt as the system instruction, files, then the rest.
+
+    Args:
+        system_instruction: The instruction of the call.
+        messages: File messages, and other messages that do not change
+            between calls on the same repository.
+        variable_messages: Messages that change between calls, such as the
+            issue.
+        instruction_last: Place the instruction after variable_messages, for
+            an instruction about the content before it.
+
+    Returns:
+        list[Mapping[str, str]]: A new list of the messages.
+    """
+    instruction = {"role": "system", "content": system_instruction}
+    prefix = [*([] if instruction_last else [instruction]),
+              *sort_file_messages(messages)]
+    log(
+        "Prompt prefix",
+        fingerprint=get_prefix_fingerprint(prefix),
+        messages=len(prefix),
+        tokens=count_message_tokens(prefix),
+    )
+    if instruction_last:
+        return [*prefix, *variable_messages, instruction]
+    return [*prefix, *variable_messages]
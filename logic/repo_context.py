@@ -0,0 +1,115 @@
+"""A module to share the repository context across the stages of a run.
+
+The context of a repository is built once per (repo, HEAD, code_lang) and
+working tree, and reused by every router and logic function of the process.
+Jobs running in worktrees of the same repository have separate contexts. Contexts of a
+repository are dropped when services.github changes its working tree, such
+as on checkout, pull or commit, and when a modification is applied.
+
+Messages are handed out as tuples of read-only mappings, so callers that
+append their own messages have to build new lists instead of mutating the
+shared context.
+"""
+
+import dataclasses
+import threading
+import types
+from typing import Mapping, Sequence
+
+import schemas
+import services.github
+from services.github import exceptions
+from utils.logging_utils import log
+
+from . import context_selection, logic_utils
+
+Messages = tuple[Mapping[str, str], ...]
+
+
+@dataclasses.dataclass
+class RepoContext:
+    """Derived data of a repository at a HEAD."""
+
+    repo: str
+    head: str
+    code_lang: str
+    file_messages: dict[tuple, Messages] = dataclasses.field(
+        default_factory=dict)
+    context_files: dict[tuple, tuple[str, ...] | None] = dataclasses.field(
+        default_factory=dict)
+
+
+_contexts: dict[tuple[str, str, str, str], RepoContext] = {}
+_lock = threading.Lock()
+
+
+def freeze_messages(messages: Sequence[Mapping[str, str]]) -> Messages:
+    """Make a read-only copy of messages."""
+    return tuple(types.MappingProxyType(dict(message)) for message in messages)
+
+
+def get_context(repo: str, code_lang: str) -> RepoContext | None:
+    """Get the context of the current HEAD of a repository.
+
+    Returns None if HEAD is not available, in which case nothing is shared.
+    """
+    try:
+        head = services.github.get_head_sha(repo)
+    except (exceptions.CommandExecutionException, OSError):
+        return None
+    with _lock:
+        return _contexts.setdefault(
+            (repo, head, code_lang, logic_utils.get_repo_path(repo)),
+            RepoContext(repo, head, code_lang))
+
+
+def invalidate_contexts(repo: str | None = None):
+    """Drop the contexts of a repository, or of all repositories if None."""
+    with _lock:
+        for key in list(_contexts):
+            if repo is None or key[0] == repo:
+                del _contexts[key]
+
+
+def get_file_messages(
+    repo: str,
+    code_lang: str,
+    file_paths: list[str] | None = None,
+    context_mode: str = "full",
+) -> Messages:
+    """Get the messages of generate_messages_from_files, built once per HEAD."""
+    context = get_context(repo, code_lang)
+    key = (None if file_paths is None else tuple(file_paths), context_mode)
+    if context is not None and key in context.file_messages:
+        log(f"Reusing file messages of {repo} at {context.head}")
+        return context.file_messages[key]
+
+    messages = freeze_messages(
+        logic_utils.generate_messages_from_files(repo, code_lang, file_paths,
+                                                 context_mode))
+    if context is not None:
+        context.file_messages[key] = messages
+    return messages
+
+
+def get_context_files(
+    repo: str,
+    code_lang: str,
+    issue: schemas.Issue,
+) -> list[str] | None:
+    """Get the files of select_context_files, selected once per HEAD."""
+    context = get_context(repo, code_lang)
+    key = (issue.id, issue.title, issue.body,
+           tuple(comment.body for comment in issue.comments))
+    if context is None or key not in context.context_files:
+        file_paths = context_selection.select_context_files(
+            repo, code_lang, issue)
+        if context is None:
+            return file_paths
+        context.context_files[key] = None if file_paths is None else tuple(
+            file_paths)
+    file_paths = context.context_files[key]
+    return None if file_paths is None else list(file_paths)
+
+
+services.github.add_working_tree_listener(invalidate_contexts)
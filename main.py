@@ -7,11 +7,14 @@ from argparse import ArgumentParser, ArgumentTypeError
 
 # ローカルモジュールのインポート
 import logging_config  # noqa: F401
+from config import config
+from services.llm import usage_ledger
 from utils.logging_utils import log
 from routers import (
     add_issue,
     generate_code_from_issue,
     generate_code_from_issue_and_reply,
+    generate_code_from_issues_and_reply,
     generate_readme,
     grow_grass,
     update_issue,
@@ -21,16 +24,21 @@ from routers import (
 actions_needing_issue_id = {
     "generate_code_from_issue": True,
     "generate_code_from_issue_and_reply": True,
+    "generate_code_from_issues_and_reply": False,
     "update_issue": True,
     "add_issue": False,
     "generate_readme": False,
     "grow_grass": False,
+    "usage_report": False,
 }
+# Actions that take the list of issue_ids instead
+actions_needing_issue_ids = {"generate_code_from_issues_and_reply"}
 
 action_functions = {
     "add_issue": add_issue,
     "generate_code_from_issue": generate_code_from_issue,
     "generate_code_from_issue_and_reply": generate_code_from_issue_and_reply,
+    "generate_code_from_issues_and_reply": generate_code_from_issues_and_reply,
     "generate_readme": generate_readme,
     "grow_grass": grow_grass,
     "update_issue": update_issue,
@@ -50,6 +58,17 @@ def parse_git_repo(value: str) -> str:
     return value
 
 
+def parse_positive_int(value: str) -> int:
+    """Parse an argument that must be a positive integer"""
+    try:
+        number = int(value)
+    except ValueError as err:
+        raise ArgumentTypeError(f"{value} is not an integer.") from err
+    if number < 1:
+        raise ArgumentTypeError(f"{value} is not a positive integer.")
+    return number
+
+
 def parse_arguments(args=None):
     """Parse command line arguments"""
     parser = ArgumentParser(
@@ -61,12 +80,22 @@ def parse_arguments(args=None):
             "add_issue",
             "generate_code_from_issue",
             "generate_code_from_issue_and_reply",
+            "generate_code_from_issues_and_reply",
             "generate_readme",
             "grow_grass",
             "update_issue",
+            "usage_report",
         ],
     )
     parser.add_argument("--issue-id", type=int, help="ID of the GitHub issue")
+    parser.add_argument("--issue-ids",
+                        type=int,
+                        nargs="+",
+                        help="IDs of the GitHub issues handled in parallel")
+    parser.add_argument(
+        "--workers",
+        type=parse_positive_int,
+        help="Number of issues handled at once (default: worktree_pool_size)")
     parser.add_argument(
         "--repo",
         help="Target GitHub repository in the format 'owner/repo'",
@@ -77,12 +106,33 @@ def parse_arguments(args=None):
     parser.add_argument("--code-lang",
                         help="Target code language",
                         default="python")
+    parser.add_argument(
+        "--context-mode",
+        help=("How the code is sent to the AI: the full source, or an outline "
+              "of signatures and docstrings except for the edit targets"),
+        choices=["full", "outline"],
+        default="full",
+    )
+    parser.add_argument(
+        "--no-llm-cache",
+        help="Always call the AI instead of reusing cached responses",
+        action="store_true",
+    )
     parsed_args = parser.parse_args(args)
 
+    if parsed_args.context_mode == "outline" and parsed_args.code_lang != "python":
+        parser.error(
+            "--context-mode outline is available for --code-lang python only."
+        )
+
     if actions_needing_issue_id[
             parsed_args.action] and not parsed_args.issue_id:
         raise MissingIssueIDError(
             "'issue_id' is required for the selected action.")
+    if (parsed_args.action in actions_needing_issue_ids
+            and not parsed_args.issue_ids):
+        raise MissingIssueIDError(
+            "'issue_ids' is required for the selected action.")
 
     return parsed_args
 
@@ -112,11 +162,23 @@ def main(args=None):
         log(f"引数解析中に予期せぬエラーが発生しました: {err}", level="error")
         sys.exit(1)
 
+    if args.action == "usage_report":
+        print(usage_ledger.format_report(usage_ledger.read_records()))
+        return
+
+    if args.no_llm_cache:
+        config["llm_cache_bypass"] = True
+
     try:
         _args = [args.repo, args.branch, args.code_lang]
+        _kwargs = {"context_mode": args.context_mode}
         if actions_needing_issue_id[args.action]:
             _args.insert(0, args.issue_id)
-        action_functions[args.action](*_args)
+        if args.action in actions_needing_issue_ids:
+            _args.insert(0, args.issue_ids)
+            _kwargs["workers"] = args.workers
+        with usage_ledger.labels(action=args.action):
+            action_functions[args.action](*_args, **_kwargs)
     except AttributeError as err:
         log(f"アクションが実装されていません: {err}", level="error")
         sys.exit(1)
@@ -14,15 +14,17 @@ from utils.logging_utils import log
 from .code_generator import (
     generate_code_from_issue,
     generate_code_from_issue_and_reply,
+    generate_code_from_issues_and_reply,
     generate_readme,
 )
-from .routers_utils import send_messages_to_system
+from .routers_utils import print_token, send_messages_to_system
 
 
 def add_issue(
     repo: str,
     branch: str = "main",
     code_lang: str = "python",
+    context_mode: str = "full",
 ):
     """Add an issue to the repository."""
 
@@ -72,18 +74,35 @@ def add_issue(
             "Invalid repository format. The expected format is 'owner/repo'.")
 
     services.github.setup_repository(repo, branch)
-    messages = logic.generate_messages_from_files(repo, code_lang)
-    issue_body = send_messages_to_system(
+    messages = logic.get_file_messages(repo,
+                                       code_lang,
+                                       context_mode=context_mode)
+    messages = logic.pack_messages(
         messages,
-        prompt_generating_issue,
-    )
-    issue_title = send_messages_to_system(
+        "add_issue",
         [{
-            "role": "assistant",
-            "content": issue_body
+            "role": "system",
+            "content": prompt_generating_issue
         }],
-        prompt_summarizing_issue,
     )
+    # A cached response would file the same issue again for an unchanged
+    # tree.
+    with services.llm.response_cache.bypassed():
+        with services.llm.usage_ledger.stage("generate_issue_body"):
+            issue_body = send_messages_to_system(
+                messages,
+                prompt_generating_issue,
+            )
+        with services.llm.usage_ledger.stage("generate_issue_title"):
+            issue_title = send_messages_to_system(
+                [],
+                prompt_summarizing_issue,
+                variable_messages=[{
+                    "role": "assistant",
+                    "content": issue_body
+                }],
+                instruction_last=True,
+            )
     issue_title = issue_title.strip().strip('"`').strip("'")
     services.github.create_issue(repo, issue_title, issue_body)
 
@@ -94,11 +113,13 @@ def validate_repo_name(repo: str) -> bool:
     return re.match(pattern, repo) is not None
 
 
+@services.llm.usage_ledger.stage("update_issue")
 def update_issue(
     issue_id: int,
     repo: str,
     branch: str = "main",
     code_lang: str = "python",
+    context_mode: str = "full",
 ):
     """Update an issue with a comment."""
 
@@ -109,15 +130,33 @@ def update_issue(
         log(f"Failed to retrieve issue with ID: {issue_id}", level="error")
         return
 
-    messages = logic.generate_messages_from_files(repo, code_lang)
-    messages.extend(logic.generate_messages_from_issue(issue))
+    system_instruction = (
+        "You are a programmer of the highest caliber."
+        "Please read the code of the existing program "
+        "and make additional comments on the issue.")
+    issue_messages = logic.generate_messages_from_issue(issue)
+    file_paths = logic.get_context_files(repo, code_lang, issue)
+    messages = logic.get_file_messages(repo, code_lang, file_paths,
+                                       context_mode)
+    messages = logic.pack_messages(
+        messages,
+        "update_issue",
+        [*issue_messages, {
+            "role": "system",
+            "content": system_instruction
+        }],
+        query=logic.generate_query_from_issue(issue),
+    )
     generated_text = send_messages_to_system(
         messages,
-        "You are a programmer of the highest caliber.Please read the code of the existing program and make additional comments on the issue.",
+        system_instruction,
+        on_token=print_token,
+        variable_messages=issue_messages,
     )
     services.github.reply_issue(repo, issue.id, generated_text)
 
 
+@services.llm.usage_ledger.stage("summarize_issue")
 def summarize_issue(
     issue_id: int,
     repo: str,
@@ -133,20 +172,38 @@ def summarize_issue(
         )
         return False
 
-    messages = logic.generate_messages_from_issue(issue)
+    issue_messages = logic.generate_messages_from_issue(issue)
 
     # Message to the system for summarization instruction
     system_instruction = (
         "Please summarize the following issue and its discussion succinctly.")
 
-    issue.summary = send_messages_to_system(messages, system_instruction)
+    issue.summary = send_messages_to_system(
+        [], system_instruction, variable_messages=issue_messages)
 
     # Persist the summary back to the issue as a comment
     return services.github.reply_issue(repo, issue.id,
                                        f"Summary:\n{issue.summary}")
 
 
-def grow_grass(repo: str, branch: str = "main", code_lang: str = "python"):
+def choose_random_issue_id(repo: str) -> int | None:
+    """オープンなissueから1つを等確率に選ぶ
+
+    一覧を保持せずに選べるよう、issueを順に読みながらリザーバサンプリングします。
+    """
+    chosen: int | None = None
+    for count, issue in enumerate(services.github.iter_issues(repo), 1):
+        if random.randrange(count) == 0:
+            chosen = issue.id
+    return chosen
+
+
+def grow_grass(
+    repo: str,
+    branch: str = "main",
+    code_lang: str = "python",
+    context_mode: str = "full",
+):
     """Grow grass on GitHub contributions graph."""
     # 最後のコミットの日付を取得する
     last_commit_datetime = services.github.get_datetime_of_last_commit(
@@ -156,13 +213,13 @@ def grow_grass(repo: str, branch: str = "main", code_lang: str = "python"):
     if last_commit_datetime.date() == datetime.now().date():
         return
 
-    issue_ids: list[int] = services.github.list_issue_ids(repo)
-    random_id: int = random.randint(0, len(issue_ids) - 1)
-    try:
-        generate_code_from_issue_and_reply(issue_ids[random_id], repo, branch,
-                                           code_lang)
-        return
-    except Exception as err:
-        logger.error(err)
+    issue_id = choose_random_issue_id(repo)
+    if issue_id is not None:
+        try:
+            generate_code_from_issue_and_reply(issue_id, repo, branch,
+                                              code_lang, context_mode)
+            return
+        except Exception as err:
+            logger.error(err)
     # add_issueする
-    add_issue(repo, branch, code_lang)
+    add_issue(repo, branch, code_lang, context_mode)
@@ -1,5 +1,7 @@
 """Router for the API."""
 
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
 from typing import Union
 
 import logic
@@ -9,14 +11,16 @@ import services.llm
 from logic import logic_exceptions, logic_utils
 from utils.logging_utils import log
 
-from .routers_utils import send_messages_to_system
+from .routers_utils import print_token, send_messages_to_system
 
 
+@services.llm.usage_ledger.stage("generate_code_from_issue")
 def generate_code_from_issue(
     issue_id: int,
     repo: str,
     branch: str = "main",
     code_lang: str = "python",
+    context_mode: str = "full",
 ) -> Union[str, None]:
     """Generate code from an issue and return the generated code.
 
@@ -32,22 +36,37 @@ def generate_code_from_issue(
     # Get the issue
     issue = services.github.get_issue_by_id(repo, issue_id)
 
-    messages = logic.generate_messages_from_files(repo, code_lang)
-    messages.extend(logic.generate_messages_from_issue(issue))
+    system_instruction = ("You are a programmer of the highest caliber."
+                          "Please read the code of the existing program "
+                          "and rewrite any one based on the issue.")
+    issue_messages = logic.generate_messages_from_issue(issue)
+    file_paths = logic.get_context_files(repo, code_lang, issue)
+    messages = logic.get_file_messages(repo, code_lang, file_paths,
+                                       context_mode)
+    messages = logic.pack_messages(
+        messages,
+        "generate_code_from_issue",
+        [*issue_messages, {
+            "role": "system",
+            "content": system_instruction
+        }],
+        query=logic.generate_query_from_issue(issue),
+    )
     generated_text = send_messages_to_system(
         messages,
-        ("You are a programmer of the highest caliber."
-         "Please read the code of the existing program "
-         "and rewrite any one based on the issue."),
+        system_instruction,
+        on_token=print_token,
+        variable_messages=issue_messages,
     )
-    print(generated_text)
     return generated_text
 
 
+@services.llm.usage_ledger.stage("generate_readme")
 def generate_readme(
     repo: str,
     branch: str = "main",
     code_lang: str = "python",
+    context_mode: str = "full",
 ) -> bool:
     """Generate README.md documentation for the entire program."""
 
@@ -64,14 +83,30 @@ def generate_readme(
         )
         raise
 
-    readme_message = f"```Current README.md\n{readme_content}```"
-    messages = logic.generate_messages_from_files(repo, code_lang)
-    messages.append({"role": "user", "content": readme_message})
+    system_instruction = (
+        "You are a programmer of the highest caliber."
+        "Please read the code of the existing program and generate README.md."
+    )
+    readme_message = {
+        "role": "user",
+        "content": f"```Current README.md\n{readme_content}```"
+    }
+    messages = logic.get_file_messages(repo,
+                                       code_lang,
+                                       context_mode=context_mode)
+    messages = logic.pack_messages(
+        messages,
+        "generate_readme",
+        [readme_message, {
+            "role": "system",
+            "content": system_instruction
+        }],
+    )
     generated_text = send_messages_to_system(
         messages,
-        ("You are a programmer of the highest caliber."
-         "Please read the code of the existing program and generate README.md."
-         ),
+        system_instruction,
+        on_token=print_token,
+        variable_messages=[readme_message],
     )
 
     # Checkout to the a new branch
@@ -109,17 +144,83 @@ def generate_code_from_issue_and_reply(
     repo: str,
     branch: str = "main",
     code_lang: str = "python",
+    context_mode: str = "full",
 ):
-    """Generate code from an issue and reply the generated code to the repository."""
-    new_branch = None
-    try:
-        # リポジトリのセットアップ
+    """Generate code from an issue and reply the generated code to the repository.
+
+    The code is generated in a worktree of its own, so that the clone of the
+    repository stays on branch.
+    """
+    setup_repository_for_jobs(repo, branch)
+    with services.github.worktree(repo, branch):
+        reply_issue_with_code(issue_id, repo, branch, code_lang, context_mode)
+
+
+def generate_code_from_issues_and_reply(
+    issue_ids: list[int],
+    repo: str,
+    branch: str = "main",
+    code_lang: str = "python",
+    context_mode: str = "full",
+    workers: int | None = None,
+) -> dict[int, bool]:
+    """Generate code from issues in parallel and reply to each of them.
+
+    Each issue is handled by a worker thread in a worktree of its own, taken
+    from the worktree pool of the repository. By default there are as many
+    workers as the worktrees of the pool.
+
+    Returns:
+    - dict[int, bool]: Whether each issue was handled successfully.
+    """
+    setup_repository_for_jobs(repo, branch)
+
+    def job(issue_id: int):
+        with services.github.worktree(repo, branch):
+            reply_issue_with_code(issue_id, repo, branch, code_lang,
+                                  context_mode)
+
+    pool = services.github.worktrees.get_worktree_pool(repo)
+    if workers is None:
+        workers = pool.size
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # Each job runs in a copy of the context, such as the usage labels.
+        futures = {
+            issue_id: executor.submit(contextvars.copy_context().run, job,
+                                      issue_id)
+            for issue_id in dict.fromkeys(issue_ids)
+        }
+    results = {}
+    for issue_id, future in futures.items():
         try:
-            services.github.setup_repository(repo, branch)
+            future.result()
+            results[issue_id] = True
         except Exception as err:
-            log(f"リポジトリのセットアップに失敗しました: {err}", level="error")
-            raise
+            log(f"Issue #{issue_id} の処理に失敗しました: {err}", level="error")
+            results[issue_id] = False
+    return results
+
+
+def setup_repository_for_jobs(repo: str, branch: str):
+    """Update the clone that the worktrees of the jobs are checked out from."""
+    try:
+        services.github.setup_repository(repo, branch)
+    except Exception as err:
+        log(f"リポジトリのセットアップに失敗しました: {err}", level="error")
+        raise
 
+
+def reply_issue_with_code(
+    issue_id: int,
+    repo: str,
+    branch: str,
+    code_lang: str,
+    context_mode: str,
+):
+    """Generate code from an issue in the current working tree, push it to a
+    new branch and reply to the issue."""
+    new_branch = None
+    try:
         # 新しいブランチの作成
         new_branch = f"update-issue-#{issue_id}"
         if new_branch != branch:
@@ -142,7 +243,7 @@ def generate_code_from_issue_and_reply(
         # コード修正の生成と検証
         try:
             modification = logic.generate_modification_from_issue(
-                repo, issue, code_lang)
+                repo, issue, code_lang, context_mode)
             is_valid = logic.verify_modification(repo, modification)
             if not is_valid:
                 raise ValueError(f"無効な修正です: {modification}")
@@ -189,7 +290,8 @@ def generate_code_from_issue_and_reply(
         # ブランチのクリーンアップ
         if new_branch and branch != new_branch:
             try:
-                services.github.checkout_branch(repo, branch)
+                # branchはクローンでチェックアウトされているため、切り離した状態に戻す
+                services.github.checkout_detached(repo, branch)
                 services.github.delete_branch(repo, new_branch)
             except Exception as err:
                 log(f"ブランチのクリーンアップに失敗しました: {err}", level="error")
@@ -1,11 +1,35 @@
 """routers_utils.py: This module contains utility functions for the routers module."""
 
+import logic
 import services.llm
 
 
-def send_messages_to_system(messages, system_instruction):
-    """Send messages to AI system for code generation."""
-    messages.append({"role": "system", "content": system_instruction})
+def print_token(token: str):
+    """Print a streamed piece of the generated text as soon as it arrives."""
+    print(token, end="", flush=True)
+
+
+def send_messages_to_system(messages,
+                            system_instruction,
+                            on_token=None,
+                            variable_messages=(),
+                            instruction_last=False):
+    """Send messages to AI system for code generation.
+
+    The prompt is laid out as the system instruction, messages and then
+    variable_messages, such as the issue, so that calls on the same
+    repository share a prefix. With instruction_last, the instruction comes
+    after variable_messages instead. messages is not modified, since it may
+    be shared with other stages. If on_token is given, the response is
+    streamed to it.
+    """
+    messages = logic.layout_prompt(system_instruction, messages,
+                                   variable_messages, instruction_last)
     openai_client = services.llm.get_openai_client()
-    generated_text = services.llm.generate_text(messages, openai_client)
+    if on_token is None:
+        return services.llm.generate_text(messages, openai_client)
+    generated_text = services.llm.generate_text(messages,
+                                                openai_client,
+                                                on_token=on_token)
+    print()
     return generated_text
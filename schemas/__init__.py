@@ -24,3 +24,15 @@ class Issue:
     body: str
     comments: List[IssueComment] = field(default_factory=list)
     summary: str = ""
+
+
+@dataclass
+class IssueSummary:
+    """Data structure for an issue in a listing, without its body"""
+
+    id: int
+    title: str
+    state: str
+    labels: List[str] = field(default_factory=list)
+    updated_at: str = ""
+    comments: int = 0
@@ -1,18 +1,49 @@
 """GitHub API service."""
 
+import contextlib
+import functools
 import os
 import subprocess
 from datetime import datetime
-from typing import List
+from typing import Callable, Iterator, List
 
 from config import config
-from schemas import Issue, IssueComment
-from services.github import exceptions
+from schemas import Issue, IssueSummary
+from services.github import backends, exceptions, worktrees
 from utils import github_utils
 from utils.logging_utils import log
 
 DEFAULT_PATH = os.getenv('REPOSITORY_PATH', config["repository_path"])
 
+_working_tree_listeners: list[Callable[[str], None]] = []
+
+
+def add_working_tree_listener(listener: Callable[[str], None]):
+    """作業ツリーが変更されたときにリポジトリ名で呼ばれる関数を登録します。"""
+    _working_tree_listeners.append(listener)
+
+
+def notify_working_tree_changed(repo: str):
+    """作業ツリーの変更を登録された関数に通知します。"""
+    for listener in _working_tree_listeners:
+        listener(repo)
+
+
+def changes_working_tree(func):
+    """作業ツリーを変更する操作の後に変更を通知するデコレータ
+
+    操作が失敗しても作業ツリーが変わっている可能性があるため、常に通知します。
+    """
+
+    @functools.wraps(func)
+    def wrapper(repo: str, *args, **kwargs):
+        try:
+            return func(repo, *args, **kwargs)
+        finally:
+            notify_working_tree_changed(repo)
+
+    return wrapper
+
 
 def setup_repository(repo: str, branch_name: str = "main"):
     """リポジトリを特定のブランチに設定します。
@@ -53,6 +84,7 @@ def setup_repository(repo: str, branch_name: str = "main"):
         raise
 
 
+@changes_working_tree
 def clone_repository(repo: str) -> bool:
     """Clone the repository."""
     github_utils.make_owner_dir(DEFAULT_PATH, repo)
@@ -67,6 +99,7 @@ def clone_repository(repo: str) -> bool:
             f"Invalid repository: {repo}") from err
 
 
+@changes_working_tree
 def pull_repository(repo: str) -> bool:
     """リポジトリをpullする"""
     try:
@@ -82,164 +115,91 @@ def pull_repository(repo: str) -> bool:
 
 def create_issue(repo: str, title: str, body: str) -> bool:
     """Create a new issue on GitHub."""
-    return github_utils.exec_git_command_and_response_bool(
-        repo,
-        ["gh", "issue", "create", "-t", title, "-b", body],
-    )
+    return backends.get_backend().call("create_issue", repo, title, body)
 
 
 def list_issue_ids(repo: str) -> List[int]:
-    """issue idを取得する"""
+    """オープンなissueのidをすべて取得する"""
+    return backends.get_backend().call("list_issue_ids", repo)
 
-    res = github_utils.exec_git_command(
-        repo,
-        ["gh", "issue", "list"],
-        capture_output=True,
-    )
-    if not res:
-        return []
 
-    issue_rows = res.stdout.decode().split("\n")
-    return list(
-        map(lambda line: int(line.split("\t")[0]),
-            filter(lambda x: x, issue_rows)))
+def iter_issues(
+    repo: str,
+    state: str = "open",
+    labels: List[str] | None = None,
+    since: datetime | str | None = None,
+) -> Iterator[IssueSummary]:
+    """issueの一覧をページごとに取得しながら順に返す
+
+    一覧全体をメモリに保持しないため、issueの多いリポジトリでも一定のメモリで処理できます。
+    stateは'open'、'closed'または'all'、labelsはすべてのラベルを持つissue、
+    sinceはその日時以降に更新されたissueに絞り込みます。
+    """
+    yield from backends.get_backend().iter_issues(repo, state, labels, since)
 
 
 def get_issue_by_id(repo: str, issue_id: int) -> Issue:
-    """idからissueを取得する"""
-
-    issue = get_issue_body(repo, issue_id)
-    comments = get_issue_comments(repo, issue_id)
-    issue.comments = comments
-    return issue
+    """idからissueをコメントと共に取得する
 
+    本文とコメントは1回の呼び出しで取得します。
+    """
+    return backends.get_backend().call("get_issue", repo, issue_id)
 
-def get_issue_body_content(repo: str, issue_id: int) -> str:
-    """issueの本文を取得する"""
-    try:
-        res = github_utils.exec_git_command(
-            repo,
-            ["gh", "issue", "view", str(issue_id)],
-            capture_output=True,
-        )
-    except exceptions.GitHubRepoNotFoundException as err:
-        raise exceptions.GitHubRepoNotFoundException(
-            f"Invalid repository: {repo}") from err
-    return res.stdout.decode()
 
+def get_issues_bulk(repo: str, issue_ids: List[int]) -> List[Issue]:
+    """複数のissueをコメントと共に取得する
 
-def parse_issue_body(issue_id: int, issue_body: str) -> Issue:
-    """issueの本文をパースする"""
-    body_attrs = ["title"]
-    parsed_body = parse_github_text(issue_body, body_attrs)[0]
-    issue = Issue(id=issue_id, comments=[], **parsed_body)
-    return issue
+    issueごとに取得する代わりに、GraphQLでまとめて取得します。
+    """
+    return backends.get_backend().call("get_issues", repo, issue_ids)
 
 
-def get_issue_body(repo: str, issue_id: int) -> Issue:
-    """issueの本文を取得する"""
-    issue_body = get_issue_body_content(repo, issue_id)
-    return parse_issue_body(issue_id, issue_body)
+def reply_issue(repo: str, issue_id: int, body: str) -> bool:
+    """issueに返信する"""
+    return backends.get_backend().call("reply_issue", repo, issue_id, body)
 
 
-def get_issue_comments_content(repo: str, issue_id: int) -> str:
-    """issueのコメントを取得する"""
-    res = github_utils.exec_git_command(
+@changes_working_tree
+def checkout_branch(repo: str, branch_name: str) -> bool:
+    """ブランチをチェックアウトする"""
+    return github_utils.exec_git_command_and_response_bool(
         repo,
-        ["gh", "issue", "view", str(issue_id), "-c"],
-        capture_output=True,
+        ["git", "checkout", branch_name],
     )
-    return res.stdout.decode()
-
-
-def parse_issue_comments(issue_comments: str) -> List[IssueComment]:
-    """issueのコメントをパースする"""
-    comment_attrs = [
-        "author",
-        "association",
-        "edited",
-        "status",
-    ]
-    if not issue_comments:
-        return []
-    parsed_comments = parse_github_text(issue_comments, comment_attrs)
-    comments: List[IssueComment] = [
-        IssueComment(**comment) for comment in parsed_comments
-    ]
-    return comments
-
-
-def parse_github_text(target_text: str,
-                      attrs: list[str]) -> list[dict[str, str]]:
-    """Parse the text of a GitHub issue or pull request."""
-    items: list[dict[str, str]] = []
-    fields = split_text_by_borderlines(target_text)
-    for idx, field_body in enumerate(fields):
-        if idx % 2 == 0:
-            # attribute field
-            parse_attribute_field(items, field_body, attrs)
-        else:
-            # body field
-            parse_body_field(items, field_body)
-    return items
-
-
-def parse_attribute_field(items: list[dict[str, str]], field_body: str,
-                          attrs: list[str]):
-    """Parse the attribute field."""
-    item = make_dict_from_field_body(field_body, attrs)
-    if item:
-        items.append(item)
-
-
-def parse_body_field(items: list[dict[str, str]], field_body: str):
-    """Parse the body field."""
-    if items:
-        items[-1]["body"] = field_body
-
 
-def make_dict_from_field_body(
-    field_body: str,
-    attrs: list[str],
-) -> dict[str, str]:
-    """Make a dictionary from the field body."""
-    item = {}
-    for line in field_body.splitlines():
-        key_value = line.split(":\t")
-        if len(key_value) == 2 and key_value[0] in attrs:
-            item[key_value[0]] = key_value[1].strip()
-    return item
 
-
-def split_text_by_borderlines(text: str) -> List[str]:
-    """Split the text by borderlines."""
-    # A borderline starts with "--".
-    return text.split("\n--\n")
-
-
-def get_issue_comments(repo: str, issue_id: int) -> List[IssueComment]:
-    """issueのコメントを取得する"""
-    issue_comments = get_issue_comments_content(repo, issue_id)
-    return parse_issue_comments(issue_comments)
-
-
-def reply_issue(repo: str, issue_id: int, body: str) -> bool:
-    """issueに返信する"""
+@changes_working_tree
+def checkout_detached(repo: str, ref: str) -> bool:
+    """refをブランチに属さない状態でチェックアウトし、未コミットの変更を破棄する"""
     return github_utils.exec_git_command_and_response_bool(
         repo,
-        ["gh", "issue", "comment",
-         str(issue_id), "-b", body],
+        ["git", "checkout", "--detach", "--force", ref],
+        capture_output=True,
     )
 
 
-def checkout_branch(repo: str, branch_name: str) -> bool:
-    """ブランチをチェックアウトする"""
-    return github_utils.exec_git_command_and_response_bool(
-        repo,
-        ["git", "checkout", branch_name],
-    )
+@contextlib.contextmanager
+def worktree(repo: str, base: str) -> Iterator[str]:
+    """ブロック内の操作をリポジトリのworktreeで実行する
+
+    プールから空いているworktreeを取得し、baseをチェックアウトして前のジョブの変更と
+    未追跡のファイルを取り除きます。
+    ブロック内ではリポジトリへのgit操作とファイル操作をそのworktreeで行います。
+    ブロックを抜けるとworktreeはプールに戻され、次のジョブで再利用されます。
+    """
+    pool = worktrees.get_worktree_pool(repo)
+    path = pool.acquire()
+    try:
+        with github_utils.use_worktree(repo, path):
+            checkout_detached(repo, base)
+            github_utils.exec_git_command(repo, ["git", "clean", "-fd"],
+                                          capture_output=True)
+            yield path
+    finally:
+        pool.release(path)
 
 
+@changes_working_tree
 def checkout_new_branch(repo: str, branch_name: str) -> bool:
     """新しいブランチを作成する"""
     try:
@@ -253,6 +213,7 @@ def checkout_new_branch(repo: str, branch_name: str) -> bool:
             f"Branch already exists: {branch_name}") from err
 
 
+@changes_working_tree
 def commit(repo: str, message: str) -> bool:
     """コミットする"""
     return github_utils.exec_git_command_and_response_bool(
@@ -312,11 +273,10 @@ def pull_request(
     title: str,
     body: str,
 ) -> bool:
-    """プルリクエストを作成する"""
-    return github_utils.exec_git_command_and_response_bool(
-        repo,
-        ["gh", "pr", "-B", to_branch, "-b", body, "-t", title],
-    )
+    """現在のブランチからto_branchへのプルリクエストを作成する"""
+    return backends.get_backend().call("create_pull_request", repo,
+                                       to_branch, get_branch(repo), title,
+                                       body)
 
 
 def get_branch(repo: str) -> str:
@@ -329,6 +289,79 @@ def get_branch(repo: str) -> str:
     return res.stdout.decode().strip()
 
 
+def list_files(
+    repo: str,
+    include_untracked: bool = False,
+    pathspecs: list[str] | None = None,
+) -> list[str]:
+    """gitで管理されているファイルのパスを取得する
+
+    インデックスを読むだけで作業ツリーを走査しないため、include_untrackedがTrueの場合のみ
+    .gitignoreで除外されていない未追跡のファイルを探索して含める。
+    pathspecsを指定した場合、一致するファイルのみを取得する。
+    """
+    command = ["git", "ls-files", "-z", "--cached"]
+    if include_untracked:
+        command.extend(["--others", "--exclude-standard"])
+    if pathspecs:
+        command.extend(["--", *pathspecs])
+    res = github_utils.exec_git_command(repo, command, capture_output=True)
+    return sorted(path for path in res.stdout.decode().split("\0") if path)
+
+
+def get_head_sha(repo: str) -> str:
+    """HEADのコミットSHAを取得する"""
+    res = github_utils.exec_git_command(
+        repo,
+        ["git", "rev-parse", "HEAD"],
+        capture_output=True,
+    )
+    return res.stdout.decode().strip()
+
+
+def list_blob_shas(repo: str) -> dict[str, str]:
+    """HEADに含まれるファイルのパスとblob SHAの対応を取得する"""
+    res = github_utils.exec_git_command(
+        repo,
+        ["git", "ls-tree", "-r", "-z", "HEAD"],
+        capture_output=True,
+    )
+    blob_shas: dict[str, str] = {}
+    for record in res.stdout.decode().split("\0"):
+        if not record:
+            continue
+        meta, path = record.split("\t", 1)
+        _, object_type, sha = meta.split()
+        if object_type == "blob":
+            blob_shas[path] = sha
+    return blob_shas
+
+
+def diff_name_status(repo: str, old_sha: str,
+                     new_sha: str) -> list[tuple[str, str]]:
+    """2つのコミット間で変更されたファイルのステータスとパスを取得する"""
+    res = github_utils.exec_git_command(
+        repo,
+        [
+            "git", "diff", "--relative", "--no-renames", "--name-status",
+            "-z", f"{old_sha}..{new_sha}"
+        ],
+        capture_output=True,
+    )
+    fields = [field for field in res.stdout.decode().split("\0") if field]
+    return list(zip(fields[0::2], fields[1::2]))
+
+
+def list_modified_paths(repo: str) -> set[str]:
+    """HEADから変更されているファイルのパスを取得する"""
+    res = github_utils.exec_git_command(
+        repo,
+        ["git", "diff", "--relative", "--name-only", "-z", "HEAD"],
+        capture_output=True,
+    )
+    return {path for path in res.stdout.decode().split("\0") if path}
+
+
 def get_default_branch(repo: str) -> str:
     """デフォルトブランチを取得する"""
     res = github_utils.exec_git_command(
@@ -0,0 +1,605 @@
+"""Backends performing the GitHub operations of services.github.
+
+GhBackend runs the GitHub CLI for each operation. RestBackend calls the
+GitHub REST API in-process over a pool of keep-alive connections, so that
+neither a process nor a TLS handshake is needed per operation. The backend
+is selected with config["github_backend"].
+"""
+
+import abc
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Iterator
+
+import httpx
+
+from config import config
+from schemas import Issue, IssueComment, IssueSummary
+from services.github import exceptions
+from utils import github_utils
+from utils.logging_utils import log
+
+DEFAULT_API_URL = "https://api.github.com"
+DEFAULT_TIMEOUT_SECONDS = 30
+DEFAULT_MAX_CONNECTIONS = 10
+DEFAULT_KEEPALIVE_EXPIRY_SECONDS = 60
+DEFAULT_GRAPHQL_MAX_NODES = 10000
+# Methods that can be sent again without changing the result.
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+# Transport errors raised before the request is sent.
+CONNECT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+# Fields of gh issue view --json needed to build an Issue.
+ISSUE_JSON_FIELDS = "number,title,body,comments"
+COMMENTS_PAGE_SIZE = 100
+ISSUES_PAGE_SIZE = 100
+# Reduce each issue of the REST API to the fields of an IssueSummary, one
+# JSON object per line. The issues API also returns pull requests.
+ISSUE_SUMMARY_JQ = (".[] | select(has(\"pull_request\") | not) | "
+                    "{number, title, state, labels: [.labels[] | {name}], "
+                    "updated_at, comments}")
+# The GraphQL comment fields have the names of gh issue view --json.
+COMMENT_GRAPHQL_FIELDS = ("author { login } authorAssociation body "
+                          "includesCreatedEdit isMinimized")
+
+
+class GitHubBackend(abc.ABC):
+    """Base class of the backends.
+
+    Subclasses implement the abstract operations. The latencies of the
+    operations are kept per operation name, so that the backends can be
+    compared with the same numbers.
+    """
+
+    name = ""
+
+    def __init__(self):
+        self.latencies: dict[str, list[float]] = {}
+        self._lock = threading.Lock()
+
+    def call(self, operation: str, *args, **kwargs):
+        """Perform an operation, recording its latency."""
+        start = time.perf_counter()
+        try:
+            return getattr(self, operation)(*args, **kwargs)
+        finally:
+            latency = time.perf_counter() - start
+            with self._lock:
+                self.latencies.setdefault(operation, []).append(latency)
+            log(f"GitHub {operation} via {self.name}: {latency:.3f} seconds",
+                level="debug")
+
+    def latency_stats(self) -> dict[str, dict[str, float]]:
+        """Return the count, total and mean latency of each operation."""
+        with self._lock:
+            return {
+                operation: {
+                    "calls": len(latencies),
+                    "total_seconds": sum(latencies),
+                    "mean_seconds": sum(latencies) / len(latencies),
+                }
+                for operation, latencies in self.latencies.items()
+            }
+
+    def close(self):
+        """Release the resources of the backend."""
+
+    @abc.abstractmethod
+    def create_issue(self, repo: str, title: str, body: str) -> bool:
+        """Create a new issue."""
+
+    @abc.abstractmethod
+    def iter_issues(
+        self,
+        repo: str,
+        state: str = "open",
+        labels: list[str] | None = None,
+        since: datetime | str | None = None,
+    ) -> Iterator[IssueSummary]:
+        """Yield the issues page by page, most recently created first.
+
+        Args:
+            state: 'open', 'closed' or 'all'.
+            labels: Only issues with all of these labels.
+            since: Only issues updated at or after this time.
+        """
+
+    def list_issue_ids(self, repo: str) -> list[int]:
+        """Return the ids of all the open issues."""
+        return [issue.id for issue in self.iter_issues(repo)]
+
+    @abc.abstractmethod
+    def get_issue(self, repo: str, issue_id: int) -> Issue:
+        """Return an issue with its comments."""
+
+    @abc.abstractmethod
+    def reply_issue(self, repo: str, issue_id: int, body: str) -> bool:
+        """Comment on an issue."""
+
+    @abc.abstractmethod
+    def create_pull_request(self, repo: str, base: str, head: str, title: str,
+                            body: str) -> bool:
+        """Create a pull request from head into base."""
+
+    @abc.abstractmethod
+    def graphql(self, repo: str, query: str,
+                variables: dict[str, str]) -> dict:
+        """Run a GraphQL query and return its data."""
+
+    def get_issues(self, repo: str, issue_ids: list[int]) -> list[Issue]:
+        """Return issues with their comments, with few GraphQL queries.
+
+        Each query fetches as many issues as fit in the node budget of
+        config["github_graphql_max_nodes"], with a page of comments each.
+        The following pages of comments of all the issues are fetched
+        together in the same way. Issues are returned in the order of
+        issue_ids. Issues that are not found, such as transferred issues or
+        pull requests, are left out.
+        """
+        owner, name = repo.split("/", 1)
+        issue_ids = list(dict.fromkeys(issue_ids))
+        issues: dict[int, Issue] = {}
+        # Issue id to the cursor of its next page of comments.
+        pending: dict[int, str | None] = dict.fromkeys(issue_ids)
+        while pending:
+            chunk = list(pending.items())[:get_graphql_chunk_size()]
+            data = self.graphql(repo, build_issues_query(chunk), {
+                "owner": owner,
+                "name": name
+            })
+            for issue_id, cursor in chunk:
+                node = data["repository"].get(f"issue{issue_id}")
+                if node is None:
+                    log(f"Issue #{issue_id} of {repo} was not found",
+                        level="warning")
+                    issues.pop(issue_id, None)
+                    del pending[issue_id]
+                    continue
+                if cursor is None:
+                    issues[issue_id] = Issue(id=node["number"],
+                                             title=node["title"],
+                                             body=node.get("body") or "")
+                comments = node["comments"]
+                issues[issue_id].comments.extend(
+                    parse_issue_comment(comment)
+                    for comment in comments["nodes"])
+                if comments["pageInfo"]["hasNextPage"]:
+                    pending[issue_id] = comments["pageInfo"]["endCursor"]
+                else:
+                    del pending[issue_id]
+        return [
+            issues[issue_id] for issue_id in issue_ids if issue_id in issues
+        ]
+
+
+class GhBackend(GitHubBackend):
+    """Perform the operations with the GitHub CLI.
+
+    Commands are retried only on GitHubConnectionException, which gh raises
+    when the host of GitHub cannot be resolved. A command that creates an
+    issue or a comment is then not sent twice.
+    """
+
+    name = "gh"
+
+    def create_issue(self, repo: str, title: str, body: str) -> bool:
+        return github_utils.exec_git_command_and_response_bool(
+            repo,
+            ["gh", "issue", "create", "-t", title, "-b", body],
+        )
+
+    def iter_issues(
+        self,
+        repo: str,
+        state: str = "open",
+        labels: list[str] | None = None,
+        since: datetime | str | None = None,
+    ) -> Iterator[IssueSummary]:
+        command = [
+            "gh", "api", "--method", "GET", "--paginate", f"repos/{repo}/issues"
+        ]
+        for key, value in get_issue_list_params(state, labels,
+                                                since).items():
+            command.extend(["-f", f"{key}={value}"])
+        command.extend(["--jq", ISSUE_SUMMARY_JQ])
+        for line in github_utils.stream_git_command(repo, command):
+            if line.strip():
+                yield parse_issue_summary(json.loads(line))
+
+    def get_issue(self, repo: str, issue_id: int) -> Issue:
+        try:
+            res = github_utils.exec_git_command(
+                repo,
+                [
+                    "gh", "issue", "view",
+                    str(issue_id), "--json", ISSUE_JSON_FIELDS
+                ],
+                capture_output=True,
+            )
+        except exceptions.GitHubRepoNotFoundException as err:
+            raise exceptions.GitHubRepoNotFoundException(
+                f"Invalid repository: {repo}") from err
+        return parse_issue_json(res.stdout.decode())
+
+    def reply_issue(self, repo: str, issue_id: int, body: str) -> bool:
+        return github_utils.exec_git_command_and_response_bool(
+            repo,
+            ["gh", "issue", "comment",
+             str(issue_id), "-b", body],
+        )
+
+    def create_pull_request(self, repo: str, base: str, head: str, title: str,
+                            body: str) -> bool:
+        return github_utils.exec_git_command_and_response_bool(
+            repo,
+            [
+                "gh", "pr", "create", "-B", base, "-H", head, "-b", body,
+                "-t", title
+            ],
+        )
+
+    def graphql(self, repo: str, query: str,
+                variables: dict[str, str]) -> dict:
+        command = ["gh", "api", "graphql", "-f", f"query={query}"]
+        for key, value in variables.items():
+            command.extend(["-f", f"{key}={value}"])
+        try:
+            output = github_utils.exec_git_command(repo,
+                                                   command,
+                                                   capture_output=True).stdout
+        except exceptions.CommandExecutionException as err:
+            # gh api fails when the response has errors, such as an issue
+            # that is not found, but still writes the response out.
+            output = getattr(err.__cause__, "stdout", None)
+            if not output:
+                raise
+        try:
+            response = json.loads(output.decode())
+        except json.JSONDecodeError as err:
+            raise exceptions.GitHubException(
+                f"Invalid GraphQL response: {err}") from err
+        return get_graphql_data(response)
+
+
+class RestBackend(GitHubBackend):
+    """Perform the operations with the GitHub REST API.
+
+    The requests of all threads share one httpx.Client, whose pool keeps
+    the connections to the API alive between operations. Connection errors
+    and 5xx responses raise GitHubConnectionException, which is retried by
+    github_utils.retry_policy. A POST that may have reached GitHub raises
+    GitHubUnconfirmedException instead, since sending it again could create
+    a duplicate issue or comment.
+    """
+
+    name = "rest"
+
+    def __init__(self, token: str, api_url: str = DEFAULT_API_URL):
+        super().__init__()
+        self.client = httpx.Client(
+            base_url=api_url,
+            headers={
+                "Accept": "application/vnd.github+json",
+                "Authorization": f"Bearer {token}",
+                "X-GitHub-Api-Version": "2022-11-28",
+            },
+            limits=httpx.Limits(
+                max_connections=config.get("github_max_connections",
+                                           DEFAULT_MAX_CONNECTIONS),
+                max_keepalive_connections=config.get(
+                    "github_max_connections", DEFAULT_MAX_CONNECTIONS),
+                keepalive_expiry=config.get(
+                    "github_keepalive_expiry_seconds",
+                    DEFAULT_KEEPALIVE_EXPIRY_SECONDS),
+            ),
+            timeout=config.get("github_timeout_seconds",
+                               DEFAULT_TIMEOUT_SECONDS),
+        )
+
+    def close(self):
+        self.client.close()
+
+    def request(self, method: str, path: str, **kwargs) -> httpx.Response:
+        """Send a request, retrying transient errors."""
+        return github_utils.retry_policy.call("github", self.send, method,
+                                              path, **kwargs)
+
+    def send(self,
+             method: str,
+             path: str,
+             idempotent: bool | None = None,
+             **kwargs) -> httpx.Response:
+        """Send a request once, raising the exception of a failure.
+
+        Only failures to connect of a request that is not idempotent raise
+        GitHubConnectionException. idempotent defaults to whether the method
+        is idempotent.
+        """
+        if idempotent is None:
+            idempotent = method in IDEMPOTENT_METHODS
+        transient = (exceptions.GitHubConnectionException if idempotent else
+                     exceptions.GitHubUnconfirmedException)
+        try:
+            response = self.client.request(method, path, **kwargs)
+        except CONNECT_ERRORS as err:
+            raise exceptions.GitHubConnectionException(
+                f"{method} {path} failed: {err}") from err
+        except httpx.TransportError as err:
+            raise transient(f"{method} {path} failed: {err}") from err
+        if response.status_code == 404:
+            raise exceptions.GitHubRepoNotFoundException(
+                f"{method} {path} was not found")
+        if response.status_code >= 500:
+            raise transient(
+                f"{method} {path} failed with {response.status_code}")
+        if response.status_code >= 400:
+            raise exceptions.GitHubException(
+                f"{method} {path} failed with {response.status_code}: "
+                f"{response.text[:200]}")
+        return response
+
+    def iter_pages(self, path: str, **params) -> Iterator[dict]:
+        """Yield the items of a paginated list, a page at a time."""
+        url: str | None = path
+        params = {"per_page": 100, **params}
+        while url:
+            response = self.request("GET", url, params=params)
+            yield from response.json()
+            url = response.links.get("next", {}).get("url")
+            # The next URL already contains the parameters.
+            params = {}
+
+    def get_pages(self, path: str, **params) -> list[dict]:
+        """Get all the items of a paginated list."""
+        return list(self.iter_pages(path, **params))
+
+    def create_issue(self, repo: str, title: str, body: str) -> bool:
+        self.request("POST",
+                     f"/repos/{repo}/issues",
+                     json={
+                         "title": title,
+                         "body": body
+                     })
+        return True
+
+    def iter_issues(
+        self,
+        repo: str,
+        state: str = "open",
+        labels: list[str] | None = None,
+        since: datetime | str | None = None,
+    ) -> Iterator[IssueSummary]:
+        for issue in self.iter_pages(
+                f"/repos/{repo}/issues",
+                **get_issue_list_params(state, labels, since)):
+            # The issues API also returns pull requests.
+            if "pull_request" not in issue:
+                yield parse_issue_summary(issue)
+
+    def get_issue(self, repo: str, issue_id: int) -> Issue:
+        issue = self.request("GET", f"/repos/{repo}/issues/{issue_id}").json()
+        comments = self.get_pages(
+            f"/repos/{repo}/issues/{issue_id}/comments")
+        return Issue(
+            id=issue["number"],
+            title=issue["title"],
+            body=issue.get("body") or "",
+            comments=[
+                IssueComment(
+                    author=(comment.get("user") or {}).get("login", ""),
+                    association=(comment.get("author_association")
+                                 or "none").lower(),
+                    edited=str(
+                        comment.get("created_at") !=
+                        comment.get("updated_at")).lower(),
+                    status="none",
+                    body=comment.get("body") or "",
+                ) for comment in comments
+            ],
+        )
+
+    def reply_issue(self, repo: str, issue_id: int, body: str) -> bool:
+        self.request("POST",
+                     f"/repos/{repo}/issues/{issue_id}/comments",
+                     json={"body": body})
+        return True
+
+    def create_pull_request(self, repo: str, base: str, head: str, title: str,
+                            body: str) -> bool:
+        self.request("POST",
+                     f"/repos/{repo}/pulls",
+                     json={
+                         "base": base,
+                         "head": head,
+                         "title": title,
+                         "body": body
+                     })
+        return True
+
+    def graphql(self, repo: str, query: str,
+                variables: dict[str, str]) -> dict:
+        # A query only reads, so it is retried like a GET.
+        response = self.request("POST",
+                                "/graphql",
+                                idempotent=True,
+                                json={
+                                    "query": query,
+                                    "variables": variables
+                                })
+        return get_graphql_data(response.json())
+
+
+def get_issue_list_params(state: str, labels: list[str] | None,
+                          since: datetime | str | None) -> dict[str, str]:
+    """Return the query parameters of the issues API for the filters."""
+    params = {"state": state, "per_page": str(ISSUES_PAGE_SIZE)}
+    if labels:
+        params["labels"] = ",".join(labels)
+    if since is not None:
+        params["since"] = (since.isoformat()
+                           if isinstance(since, datetime) else since)
+    return params
+
+
+def parse_issue_summary(issue: dict) -> IssueSummary:
+    """Convert an issue of the issues API to an IssueSummary."""
+    return IssueSummary(
+        id=issue["number"],
+        title=issue["title"],
+        state=issue["state"],
+        labels=[label["name"] for label in issue.get("labels") or []],
+        updated_at=issue.get("updated_at") or "",
+        comments=issue.get("comments") or 0,
+    )
+
+
+def get_graphql_chunk_size() -> int:
+    """Return how many issues fit in a GraphQL query.
+
+    An issue costs a node for itself and one for each comment of a page.
+    """
+    max_nodes = config.get("github_graphql_max_nodes",
+                           DEFAULT_GRAPHQL_MAX_NODES)
+    return max(1, max_nodes // (1 + COMMENTS_PAGE_SIZE))
+
+
+def build_issues_query(chunk: list[tuple[int, str | None]]) -> str:
+    """Build a GraphQL query of issues and a page of their comments.
+
+    chunk pairs each issue id with the cursor after which its comments
+    are fetched, or None to fetch the issue with its first comments.
+    """
+    aliases = []
+    for issue_id, cursor in chunk:
+        if cursor is None:
+            comments_args = f"first: {COMMENTS_PAGE_SIZE}"
+            issue_fields = "number title body "
+        else:
+            comments_args = (f"first: {COMMENTS_PAGE_SIZE}, "
+                             f"after: {json.dumps(cursor)}")
+            issue_fields = ""
+        aliases.append(
+            f"issue{int(issue_id)}: issue(number: {int(issue_id)}) {{ "
+            f"{issue_fields}comments({comments_args}) {{ "
+            "pageInfo { hasNextPage endCursor } "
+            f"nodes {{ {COMMENT_GRAPHQL_FIELDS} }} }} }}")
+    return ("query($owner: String!, $name: String!) {\n"
+            "  repository(owner: $owner, name: $name) {\n" +
+            "".join(f"    {alias}\n" for alias in aliases) + "  }\n}")
+
+
+def is_field_error(error: dict) -> bool:
+    """Return whether a GraphQL error is of a single field of the repository.
+
+    Such a field, such as an issue that is not found, is null in the data,
+    while the other fields are still returned.
+    """
+    path = error.get("path") or []
+    return len(path) == 2 and path[0] == "repository"
+
+
+def get_graphql_data(response: dict) -> dict:
+    """Return the data of a GraphQL response, raising its errors.
+
+    Errors of single fields of the repository are logged instead, and the
+    fields are left null.
+    """
+    errors = []
+    for error in response.get("errors") or []:
+        if is_field_error(error) and response.get("data"):
+            log(f"GraphQL error at {'.'.join(map(str, error['path']))}: "
+                f"{error.get('message', '')}",
+                level="warning")
+        else:
+            errors.append(error)
+    if errors:
+        message = "; ".join(error.get("message", "") for error in errors)
+        if any(error.get("type") == "NOT_FOUND" for error in errors):
+            raise exceptions.GitHubRepoNotFoundException(message)
+        raise exceptions.GitHubException(message)
+    return response["data"]
+
+
+def parse_issue_json(issue_json: str) -> Issue:
+    """gh issue view --jsonの出力をissueに変換する"""
+    try:
+        data = json.loads(issue_json)
+    except json.JSONDecodeError as err:
+        raise exceptions.GitHubException(
+            f"Invalid issue JSON: {err}") from err
+    return Issue(
+        id=data["number"],
+        title=data["title"],
+        body=data.get("body") or "",
+        comments=[
+            parse_issue_comment(comment)
+            for comment in data.get("comments") or []
+        ],
+    )
+
+
+def parse_issue_comment(comment: dict) -> IssueComment:
+    """gh issue view --jsonのコメントをIssueCommentに変換する
+
+    値はgh issue view -cのテキスト出力と同じ形式にそろえます。
+    """
+    return IssueComment(
+        author=(comment.get("author") or {}).get("login", ""),
+        association=(comment.get("authorAssociation") or "none").lower(),
+        edited=str(bool(comment.get("includesCreatedEdit"))).lower(),
+        status="hidden" if comment.get("isMinimized") else "none",
+        body=comment.get("body") or "",
+    )
+
+
+_backend: GitHubBackend | None = None
+_backend_settings: tuple[str, str, str | None] | None = None
+_backend_lock = threading.Lock()
+
+
+def get_token() -> str | None:
+    """Return the GitHub token of config or the environment."""
+    return (config.get("github_token") or os.getenv("GITHUB_TOKEN")
+            or os.getenv("GH_TOKEN"))
+
+
+def get_backend() -> GitHubBackend:
+    """Get the process-wide backend selected by config["github_backend"].
+
+    'gh' (default) uses the GitHub CLI and 'rest' the REST API. Without a
+    token for the REST API, the GitHub CLI is used instead.
+    """
+    global _backend, _backend_settings
+    name = config.get("github_backend", "gh")
+    api_url = config.get("github_api_url") or DEFAULT_API_URL
+    token = get_token()
+    settings = (name, api_url, token)
+    with _backend_lock:
+        if _backend is None or _backend_settings != settings:
+            if _backend is not None:
+                _backend.close()
+            if name == "rest" and token:
+                _backend = RestBackend(token, api_url)
+            else:
+                if name == "rest":
+                    log(("GITHUB_TOKEN is not set. "
+                         "Using the GitHub CLI instead of the REST API."),
+                        level="warning")
+                elif name != "gh":
+                    log(f"Unknown GitHub backend {name}. Using gh.",
+                        level="warning")
+                _backend = GhBackend()
+            _backend_settings = settings
+        return _backend
+
+
+def reset_backend():
+    """Discard the process-wide backend, for example after a fork."""
+    global _backend, _backend_settings
+    with _backend_lock:
+        if _backend is not None:
+            _backend.close()
+        _backend = None
+        _backend_settings = None
@@ -74,6 +74,13 @@ class GitHubConnectionException(GitHubException):
     message = "Could not resolve hostname github.com"
 
 
+class GitHubUnconfirmedException(GitHubException):
+    """Exception raised when a request that must not be repeated fails after
+    it may have been performed."""
+
+    message = "The request may have been performed."
+
+
 class GitHubRepoNotFoundException(GitHubException):
     """Exception raised for errors in the GitHub API connection."""
 
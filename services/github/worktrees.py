@@ -0,0 +1,192 @@
+"""Pools of git worktrees to run the jobs of a repository in parallel.
+
+Each job checks out its own worktree of the clone under DEFAULT_PATH. The
+worktrees share the object store of the clone, so they are cheap to create,
+and jobs of the same repository no longer touch each other's working tree
+or the clone. Worktrees are kept on disk under config["worktree_path"] and
+reused by later jobs and runs. A job holds a file lock next to its worktree,
+so that processes sharing config["worktree_path"] do not use the same one.
+"""
+
+import os
+import shutil
+import threading
+
+from config import config
+from services.github import exceptions
+from utils import github_utils
+from utils.lock_utils import FileLock
+from utils.logging_utils import log
+
+DEFAULT_POOL_SIZE = 4
+# Seconds between tries to lock a worktree used by other processes.
+LOCK_POLL_SECONDS = 0.5
+
+
+class WorktreePool:
+    """Up to size worktrees of a repository, handed out one job at a time."""
+
+    def __init__(self, repo: str, size: int, root: str):
+        self.repo = repo
+        self.size = size
+        self.root = os.path.abspath(root)
+        # Worktrees checked to be usable by this process.
+        self._ready: set[str] = set()
+        # Locks of the worktrees in use by the jobs of this process.
+        self._locks: dict[str, FileLock] = {}
+        self._condition = threading.Condition()
+
+    @property
+    def created(self) -> int:
+        """The number of worktrees created or checked by this pool."""
+        with self._condition:
+            return len(self._ready)
+
+    def get_path(self, index: int) -> str:
+        """Return the path of the index-th worktree."""
+        return os.path.join(self.root, self.repo, str(index))
+
+    def acquire(self) -> str:
+        """Lock a worktree that no job uses, creating it if needed.
+
+        Blocks while all the worktrees are in use, here or in other
+        processes.
+        """
+        with self._condition:
+            path = self._lock_free_worktree()
+            while path is None:
+                # Wake up on a release here, or poll for other processes.
+                self._condition.wait(LOCK_POLL_SECONDS)
+                path = self._lock_free_worktree()
+        try:
+            return self._prepare(path)
+        except BaseException:
+            self.release(path)
+            raise
+
+    def release(self, path: str):
+        """Unlock a worktree, returning it to the pool."""
+        with self._condition:
+            lock = self._locks.pop(path)
+            lock.release()
+            self._condition.notify()
+
+    def _lock_free_worktree(self) -> str | None:
+        """Lock the first worktree that is not in use, if any."""
+        for index in range(self.size):
+            path = self.get_path(index)
+            if path in self._locks:
+                continue
+            lock = FileLock(f"{path}.lock")
+            if lock.acquire(blocking=False):
+                self._locks[path] = lock
+                return path
+        return None
+
+    def _prepare(self, path: str) -> str:
+        """Make the locked path a worktree of the clone.
+
+        A worktree left by an earlier run is reused if the clone still
+        knows it. Otherwise the directory is replaced by a new worktree.
+        """
+        with self._condition:
+            if path in self._ready:
+                return path
+        if os.path.isfile(os.path.join(path, ".git")):
+            if self._repair(path):
+                log(f"Reusing worktree {path}", level="debug")
+                with self._condition:
+                    self._ready.add(path)
+                return path
+            log(f"Replacing stale worktree {path}", level="warning")
+        if os.path.exists(path):
+            shutil.rmtree(path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Forget the worktrees whose directories have been removed.
+        github_utils.exec_git_command(self.repo, ["git", "worktree", "prune"],
+                                      capture_output=True)
+        github_utils.exec_git_command(
+            self.repo,
+            ["git", "worktree", "add", "--detach", path],
+            capture_output=True,
+        )
+        log(f"Created worktree {path}", level="info")
+        with self._condition:
+            self._ready.add(path)
+        return path
+
+    def _repair(self, path: str) -> bool:
+        """Repair the links of a worktree and return whether it is usable.
+
+        It is usable if the clone lists it as a worktree that is not
+        prunable.
+        """
+        try:
+            github_utils.exec_git_command(
+                self.repo, ["git", "worktree", "repair", path],
+                capture_output=True)
+            res = github_utils.exec_git_command(
+                self.repo, ["git", "worktree", "list", "--porcelain"],
+                capture_output=True)
+        except exceptions.CommandExecutionException:
+            return False
+        real_path = os.path.realpath(path)
+        for entry in res.stdout.decode().split("\n\n"):
+            lines = entry.splitlines()
+            if (lines and lines[0].startswith("worktree ")
+                    and os.path.realpath(lines[0][len("worktree "):])
+                    == real_path):
+                return not any(
+                    line.startswith("prunable") for line in lines)
+        return False
+
+    def close(self):
+        """Remove the worktrees that no job uses from the disk."""
+        with self._condition:
+            paths = sorted(self._ready - set(self._locks))
+            self._ready.difference_update(paths)
+        for path in paths:
+            lock = FileLock(f"{path}.lock")
+            if not lock.acquire(blocking=False):
+                # A job of another process uses it.
+                continue
+            try:
+                github_utils.exec_git_command(
+                    self.repo,
+                    ["git", "worktree", "remove", "--force", path],
+                    capture_output=True,
+                )
+            finally:
+                lock.release()
+
+
+_pools: dict[str, WorktreePool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_worktree_pool(repo: str) -> WorktreePool:
+    """Get the process-wide worktree pool of a repository."""
+    with _pools_lock:
+        if repo not in _pools:
+            _pools[repo] = WorktreePool(
+                repo,
+                config.get("worktree_pool_size", DEFAULT_POOL_SIZE),
+                config.get("worktree_path") or os.path.join(
+                    config["repository_path"], ".worktrees"),
+            )
+        return _pools[repo]
+
+
+def close_worktree_pools():
+    """Remove the idle worktrees of all the pools and forget the pools."""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
+
+
+def reset_worktree_pools():
+    """Forget the pools, keeping their worktrees on disk."""
+    with _pools_lock:
+        _pools.clear()
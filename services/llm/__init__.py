@@ -1,27 +1,74 @@
 """Module for the LLM service."""
 
+import asyncio
+import contextlib
+import contextvars
 import json
 import os
-from typing import Dict, List
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Coroutine, Dict, Iterator, List, TypeVar
 
+import httpx
 import openai
 
 from config import config
 from utils.logging_utils import log
-from utils.retry_utils import retry_on_exception
+from utils.retry_utils import RetryPolicy, create_retry_policy
+from utils.token_utils import count_message_tokens, count_tokens
 
-from . import llm_exceptions
+from . import (client_pool, json_stream, llm_exceptions, rate_limiter,
+               response_cache, usage_ledger)
 
 MODEL_NAME = config["openai_model_name"]
+DEFAULT_MAX_CONCURRENCY = 4
+DEFAULT_TIMEOUT_SECONDS = 600
+DEFAULT_MAX_OUTPUT_TOKENS = 16000
+
+T = TypeVar("T")
+
+# Errors of the API that may succeed when retried. The types are taken at
+# import time, since tests replace the openai module.
+TRANSIENT_EXCEPTIONS = (
+    openai.APIConnectionError,
+    openai.RateLimitError,
+    openai.InternalServerError,
+    llm_exceptions.LLMTimeoutException,
+    # Raised while reading a stream, such as a dropped connection.
+    httpx.TransportError,
+)
+# Timeouts of the HTTP client, raised by the request or while streaming.
+TIMEOUT_EXCEPTIONS = (openai.APITimeoutError, httpx.TimeoutException)
+# Requests to the API.
+retry_policy = create_retry_policy(TRANSIENT_EXCEPTIONS)
+# Regeneration of invalid JSON responses, which is not a failure of the API.
+json_retry_policy = RetryPolicy((llm_exceptions.LLMJSONParseException, ),
+                                base_delay=0,
+                                failure_threshold=None)
+
+# Bounds the API calls of all the threads and event loops of the process.
+_semaphore: threading.BoundedSemaphore | None = None
+_semaphore_size: int | None = None
+_semaphore_lock = threading.Lock()
+
+_openai_client: openai.OpenAI | None = None
+_openai_client_settings: tuple[str, str | None] | None = None
+_openai_client_lock = threading.Lock()
 
 
 def get_openai_client(api_key: str = None) -> openai.OpenAI:
-    """Factory function to create and configure an OpenAI client."""
+    """Get the process-wide OpenAI client.
+
+    The client and its connection pool are created on first use, or when the
+    API key or the base URL changes, and are shared by all threads. The base
+    URL is taken from config["openai_base_url"] or OPENAI_BASE_URL, so that a
+    compatible server such as services.llm.stub_server can be used.
+    """
+    global _openai_client, _openai_client_settings
     try:
         if api_key is None:
             api_key = os.environ["OPENAI_API_KEY"]
-        openai.api_key = api_key
-        return openai
     except KeyError as err:
         log(
             ("OPENAI_API_KEY is not set in environment variables. "
@@ -32,43 +79,72 @@ def get_openai_client(api_key: str = None) -> openai.OpenAI:
             "API key must be provided as an argument or in the environment"
         ) from err
 
+    base_url = config.get("openai_base_url") or os.getenv("OPENAI_BASE_URL")
+    with _openai_client_lock:
+        if _openai_client is None or _openai_client_settings != (api_key,
+                                                                 base_url):
+            _openai_client = openai.OpenAI(
+                api_key=api_key,
+                base_url=base_url,
+                http_client=client_pool.create_http_client(),
+                # Retries are made by retry_policy.
+                max_retries=0,
+            )
+            _openai_client_settings = (api_key, base_url)
+        return _openai_client
+
+
+def reset_openai_client():
+    """Discard the process-wide OpenAI client, for example after a fork."""
+    global _openai_client, _openai_client_settings
+    with _openai_client_lock:
+        _openai_client = None
+        _openai_client_settings = None
+
 
-@retry_on_exception(llm_exceptions.LLMException, tries=3, delay=2, backoff=2)
 def generate_text(
     messages: List[Dict[str, str]],
     openai_client: openai.OpenAI,
+    on_token: Callable[[str], bool | None] | None = None,
 ) -> str:
     """Generates text using the OpenAI API.
 
     Args:
         messages (List[Dict[str, str]]): A list of message dictionaries to send to the API.
         openai_client (openai.OpenAI): An OpenAI client.
+        on_token (Callable[[str], bool | None], optional): Called with each
+        piece of text as it is streamed. Returning False aborts the stream.
 
     Returns:
         Union[str, None]: The generated text, or None if an error occurs.
     """
     return generate_response(messages,
                              openai_client,
-                             response_format={"type": "text"})
+                             response_format={"type": "text"},
+                             on_token=on_token)
 
 
-@llm_exceptions.retry_handler(3)
+@json_retry_policy.retrying("openai_json")
 def generate_json(
     messages: List[Dict[str, str]],
     openai_client: openai.OpenAI,
+    validate_field: Callable[[str, Any], None] | None = None,
 ) -> dict[str, str]:
     """Generates json using the OpenAI API.
 
     Args:
         messages (List[Dict[str, str]]): A list of message dictionaries to send to the API.
         openai_client (openai.OpenAI): An OpenAI client.
-        retry (int, optional): The number of times to retry the request. Defaults to 0.
+        validate_field (Callable[[str, Any], None], optional): If given, the
+        response is streamed and each top-level field is passed to it as soon
+        as it is complete. Raising LLMJSONValidationException aborts the
+        stream, and the request is retried.
 
     Returns:
         Union[str, None]: The generated json, or None if an error occurs.
 
     Raises:
-        ValueError: If the retry argument is negative.
+        LLMJSONParseException: If no valid JSON is generated after retries.
         RuntimeError: If the request fails after multiple retries.
     """
     log(f"Generating json with model: {MODEL_NAME}", level="info")
@@ -76,6 +152,7 @@ def generate_json(
         generated_json = generate_and_parse_json(
             messages,
             openai_client,
+            validate_field,
         )
         log(
             f"Text generated successfully: {json.dumps(generated_json)[:50]}...",
@@ -97,11 +174,49 @@ def generate_json(
 def generate_and_parse_json(
     messages: list[dict[str, str]],
     openai_client: openai.OpenAI,
+    validate_field: Callable[[str, Any], None] | None = None,
 ) -> dict:
     """Generates json using the OpenAI API and parses the response."""
-    generated_content = generate_response(
-        messages, openai_client, response_format={"type": "json_object"})
-    return parse_json_response(generated_content)
+    return run_sync(
+        agenerate_and_parse_json(messages, openai_client, validate_field))
+
+
+async def agenerate_and_parse_json(
+    messages: list[dict[str, str]],
+    openai_client: openai.OpenAI,
+    validate_field: Callable[[str, Any], None] | None = None,
+) -> dict:
+    """Async counterpart of generate_and_parse_json.
+
+    With validate_field, the response is parsed while it is streamed, so
+    that malformed or invalid output aborts the stream early. A stream
+    broken by a transient error is requested again from the start.
+    """
+    response_format = {"type": "json_object"}
+    parser = None
+    on_token = None
+    on_restart = None
+    if validate_field is not None:
+        parser = json_stream.IncrementalJSONParser(validate_field)
+        on_token = parser.feed
+        on_restart = parser.reset
+    try:
+        generated_content = await agenerate_response(
+            messages,
+            openai_client,
+            response_format=response_format,
+            on_token=on_token,
+            on_restart=on_restart)
+        if parser is not None:
+            return parser.close()
+        return parse_json_response(generated_content)
+    except llm_exceptions.LLMJSONParseException:
+        # Do not serve the invalid response again on retry.
+        if not response_cache.is_bypassed():
+            await asyncio.to_thread(
+                response_cache.get_response_cache().delete,
+                response_cache.make_key(MODEL_NAME, messages, response_format))
+        raise
 
 
 def parse_json_response(generated_content: str) -> dict:
@@ -121,6 +236,8 @@ def generate_response(
     messages: List[Dict[str, str]],
     openai_client: openai.OpenAI,
     response_format: Dict[str, str] = {"type": "text"},
+    timeout: float | None = None,
+    on_token: Callable[[str], bool | None] | None = None,
 ) -> str:
     """Generates a response using the OpenAI API.
 
@@ -129,27 +246,343 @@ def generate_response(
         openai_client (openai.OpenAI): An OpenAI client.
         response_format (Dict[str, str], optional): The format of the response.
         Can be {"type": "text"} or {"type": "json_object"}. Defaults to {"type": "text"}.
+        timeout (float, optional): Seconds to wait for data from the API, per
+        piece of a streamed response. Defaults to config["llm_timeout_seconds"].
+        on_token (Callable[[str], bool | None], optional): If given, the
+        response is streamed and on_token is called with each piece of text.
+        Returning False aborts the stream.
 
     Returns:
         str: The generated response
 
     Raises:
-        ValueError: If the retry argument is negative.
-        RuntimeError: If the request fails after multiple retries.
+        LLMTimeoutException: If the response does not arrive in time.
+        LLMStreamAbortedException: If the stream is aborted.
+        RuntimeError: If the request fails.
     """
-    log(f"Generating response with model: {MODEL_NAME}", level="info")
+    return run_sync(
+        agenerate_response(messages, openai_client, response_format, timeout,
+                           on_token))
+
+
+def stream_response(
+    messages: List[Dict[str, str]],
+    openai_client: openai.OpenAI,
+    response_format: Dict[str, str] = {"type": "text"},
+    timeout: float | None = None,
+) -> Iterator[str]:
+    """Generates a response using the OpenAI API, yielding text as it arrives.
+
+    Closing the generator closes the stream. The time to the first token and
+    the total latency are logged when the stream ends. timeout bounds the
+    wait for each piece of the stream, not the whole stream.
+    """
+    start = time.perf_counter()
+    first_token_seconds = None
+    n_chunks = 0
+    completed = False
+    stream = openai_client.chat.completions.create(
+        model=MODEL_NAME,
+        # Shared messages may be read-only mappings.
+        messages=[dict(message) for message in messages],
+        response_format=response_format,
+        stream=True,
+        timeout=timeout,
+    )
     try:
+        for chunk in stream:
+            if not chunk.choices or not chunk.choices[0].delta.content:
+                continue
+            if first_token_seconds is None:
+                first_token_seconds = time.perf_counter() - start
+            n_chunks += 1
+            yield chunk.choices[0].delta.content
+        completed = True
+    finally:
+        stream.close()
+        log(
+            "Streamed response",
+            ttft_seconds=f"{first_token_seconds or 0:.3f}",
+            total_seconds=f"{time.perf_counter() - start:.3f}",
+            chunks=n_chunks,
+            completed=completed,
+        )
+
+
+def consume_stream(
+    tokens: Iterator[str],
+    on_token: Callable[[str], bool | None],
+    cancelled: threading.Event | None = None,
+) -> str:
+    """Pass streamed text to on_token and return the whole text.
+
+    The stream is aborted when on_token returns False, when cancelled is set,
+    or when the text exceeds config["llm_max_output_tokens"].
+
+    Raises:
+        LLMStreamAbortedException: If the stream is aborted.
+    """
+    max_tokens = config.get("llm_max_output_tokens", DEFAULT_MAX_OUTPUT_TOKENS)
+    parts = []
+    n_tokens = 0
+    with contextlib.closing(tokens):
+        for token in tokens:
+            parts.append(token)
+            n_tokens += count_tokens(token)
+            if n_tokens > max_tokens:
+                raise llm_exceptions.LLMStreamAbortedException(
+                    f"The response exceeded {max_tokens} tokens.")
+            if on_token(token) is False or (cancelled is not None
+                                            and cancelled.is_set()):
+                raise llm_exceptions.LLMStreamAbortedException()
+    return "".join(parts)
+
+
+def request_completion(
+    messages: List[Dict[str, str]],
+    openai_client: openai.OpenAI,
+    response_format: Dict[str, str],
+    on_token: Callable[[str], bool | None] | None = None,
+    cancelled: threading.Event | None = None,
+    usage: usage_ledger.UsageRecord | None = None,
+    timeout: float | None = None,
+) -> str:
+    """Request a completion, streaming it to on_token if given.
+
+    Waits while config["llm_max_concurrency"] requests of the process are
+    running. timeout is passed to the HTTP client, which closes the request
+    when no data arrives in time. The token counts reported by the API are
+    set to usage. Streamed responses do not report them.
+
+    Raises:
+        LLMStreamAbortedException: If cancelled is set before the request.
+    """
+    with get_semaphore():
+        if cancelled is not None and cancelled.is_set():
+            raise llm_exceptions.LLMStreamAbortedException()
+        if on_token is not None:
+            return consume_stream(
+                stream_response(messages, openai_client, response_format,
+                                timeout), on_token, cancelled)
         response = openai_client.chat.completions.create(
             model=MODEL_NAME,
-            messages=messages,
+            # Shared messages may be read-only mappings.
+            messages=[dict(message) for message in messages],
             response_format=response_format,
+            timeout=timeout,
         )
-        generated_content = response.choices[0].message.content
-        log(
-            f"Response generated successfully: {generated_content[:50]}...",
+        reported = getattr(response, "usage", None)
+        if usage is not None and reported is not None:
+            usage.prompt_tokens = reported.prompt_tokens
+            usage.completion_tokens = reported.completion_tokens
+        return response.choices[0].message.content
+
+
+def run_sync(coroutine: Coroutine[Any, Any, T]) -> T:
+    """Run a coroutine to completion from synchronous code.
+
+    The coroutine runs on a separate thread when an event loop is already
+    running in the calling thread.
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coroutine)
+    # The context carries the labels of usage_ledger to the thread.
+    context = contextvars.copy_context()
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(context.run, asyncio.run, coroutine).result()
+
+
+def get_semaphore() -> threading.BoundedSemaphore:
+    """Get the semaphore bounding concurrent API calls of the process.
+
+    The semaphore is created again when config["llm_max_concurrency"]
+    changes.
+    """
+    global _semaphore, _semaphore_size
+    size = config.get("llm_max_concurrency", DEFAULT_MAX_CONCURRENCY)
+    with _semaphore_lock:
+        if _semaphore is None or _semaphore_size != size:
+            _semaphore = threading.BoundedSemaphore(size)
+            _semaphore_size = size
+        return _semaphore
+
+
+async def agenerate_response(
+    messages: List[Dict[str, str]],
+    openai_client: openai.OpenAI,
+    response_format: Dict[str, str] = {"type": "text"},
+    timeout: float | None = None,
+    on_token: Callable[[str], bool | None] | None = None,
+    on_restart: Callable[[], None] | None = None,
+) -> str:
+    """Async counterpart of generate_response.
+
+    Transient errors are retried by retry_policy, which fails fast while
+    the API is down. A stream broken after text was passed to on_token
+    raises LLMStreamAbortedException, unless on_restart is given: it is
+    then called to discard the text and the request is retried. Each call
+    is recorded in usage_ledger.
+    """
+    start = time.perf_counter()
+    usage = usage_ledger.UsageRecord(
+        model=MODEL_NAME,
+        prompt_tokens=count_message_tokens(messages),
+        completion_tokens=0,
+        latency_seconds=0.0,
+    )
+    # The cache database is accessed off the event loop, since a lock
+    # held by another process makes sqlite3 wait.
+    cache = None
+    if not response_cache.is_bypassed():
+        cache = response_cache.get_response_cache()
+        key = response_cache.make_key(MODEL_NAME, messages, response_format)
+        cached_content = await asyncio.to_thread(cache.get, key)
+        if cached_content is not None:
+            log("Response served from cache",
+                **await asyncio.to_thread(cache.stats))
+            usage.cached = True
+            usage.completion_tokens = count_tokens(cached_content)
+            usage.latency_seconds = time.perf_counter() - start
+            usage_ledger.record(usage)
+            if on_token is not None:
+                on_token(cached_content)
+            return cached_content
+
+    log(f"Generating response with model: {MODEL_NAME}", level="info")
+
+    attempts = 0
+
+    async def attempt() -> str:
+        nonlocal attempts
+        attempts += 1
+        if attempts > 1 and on_restart is not None:
+            on_restart()
+        return await arequest_completion(messages, openai_client,
+                                         response_format, timeout, on_token,
+                                         usage, on_restart is not None)
+
+    try:
+        generated_content = await retry_policy.acall("openai", attempt)
+    except Exception as err:
+        log("Failed to generate response",
+            level="error",
+            **retry_policy.metrics().get("openai", {}))
+        usage.error = type(err).__name__
+        raise
+    finally:
+        usage.retries = max(0, attempts - 1)
+        usage.latency_seconds = time.perf_counter() - start
+        usage_ledger.record(usage)
+
+    log(
+        f"Response generated successfully: {generated_content[:50]}...",
+        level="info",
+        **client_pool.connection_stats.as_dict(),
+    )
+    if cache is not None and generated_content is not None:
+        await asyncio.to_thread(
+            cache.put, key, generated_content,
+            sum(
+                len(message.get("content", "").encode())
+                for message in messages))
+    return generated_content
+
+
+async def arequest_completion(
+    messages: List[Dict[str, str]],
+    openai_client: openai.OpenAI,
+    response_format: Dict[str, str],
+    timeout: float | None = None,
+    on_token: Callable[[str], bool | None] | None = None,
+    usage: usage_ledger.UsageRecord | None = None,
+    restartable: bool = False,
+) -> str:
+    """Request a completion once.
+
+    Requests wait for the rate limiter shared by the processes on the host,
+    and at most config["llm_max_concurrency"] calls of the process run at
+    once. The blocking client runs on a worker thread and closes the request
+    itself when no data arrives within timeout, so a timed out request does
+    not keep running. A cancelled call stops waiting immediately, and a
+    streamed request is then aborted at its next token. A stream broken
+    after text was passed to on_token raises LLMStreamAbortedException,
+    unless restartable. The token counts of usage are updated from the
+    response.
+    """
+    if timeout is None:
+        timeout = config.get("llm_timeout_seconds", DEFAULT_TIMEOUT_SECONDS)
+    limiter = rate_limiter.get_rate_limiter()
+    wait_seconds = await limiter.aacquire(count_message_tokens(messages))
+    if wait_seconds > 0:
+        log(f"Waited {wait_seconds:.3f} seconds for the rate limit",
             level="info",
-        )
-        return generated_content
+            **await asyncio.to_thread(limiter.stats))
+    cancelled = threading.Event()
+    emitted = threading.Event()
+
+    def on_token_once(token: str) -> bool | None:
+        emitted.set()
+        return on_token(token)
+
+    try:
+        generated_content = await asyncio.to_thread(
+            request_completion, messages, openai_client, response_format,
+            on_token and on_token_once, cancelled, usage, timeout)
+    except TIMEOUT_EXCEPTIONS as err:
+        log(f"Response was not generated in {timeout} seconds", level="error")
+        error = llm_exceptions.LLMTimeoutException(
+            f"Response was not generated in {timeout} seconds")
+        if emitted.is_set() and not restartable:
+            raise llm_exceptions.LLMStreamAbortedException(str(error)) from err
+        raise error from err
+    except asyncio.CancelledError:
+        cancelled.set()
+        raise
+    except TRANSIENT_EXCEPTIONS as err:
+        log(f"Failed to generate response: {err}", level="error")
+        if emitted.is_set() and not restartable:
+            # The text passed to on_token cannot be taken back by a retry.
+            raise llm_exceptions.LLMStreamAbortedException(str(err)) from err
+        raise
     except RuntimeError as err:
         log(f"Failed to generate response: {err}", level="error")
         raise
+
+    if generated_content is not None:
+        await asyncio.to_thread(limiter.consume,
+                                count_tokens(generated_content))
+        if usage is not None and not usage.completion_tokens:
+            usage.completion_tokens = count_tokens(generated_content)
+    return generated_content
+
+
+async def agenerate_text(
+    messages: List[Dict[str, str]],
+    openai_client: openai.OpenAI,
+    timeout: float | None = None,
+) -> str:
+    """Async counterpart of generate_text."""
+    return await agenerate_response(messages,
+                                    openai_client,
+                                    response_format={"type": "text"},
+                                    timeout=timeout)
+
+
+@json_retry_policy.retrying("openai_json")
+async def agenerate_json(
+    messages: List[Dict[str, str]],
+    openai_client: openai.OpenAI,
+    validate_field: Callable[[str, Any], None] | None = None,
+) -> dict[str, str]:
+    """Async counterpart of generate_json."""
+    log(f"Generating json with model: {MODEL_NAME}", level="info")
+    try:
+        return await agenerate_and_parse_json(messages, openai_client,
+                                              validate_field)
+    except RuntimeError as err:
+        log(f"Failed to generate json: {err}: ", level="error")
+        raise llm_exceptions.UnknownLLMException(
+            f"An unknown error occurred while generating the response {err}"
+        ) from err
@@ -0,0 +1,75 @@
+"""A process-wide HTTP connection pool for the OpenAI client."""
+
+import threading
+
+import httpx
+
+from config import config
+
+DEFAULT_MAX_CONNECTIONS = 20
+DEFAULT_MAX_KEEPALIVE_CONNECTIONS = 10
+DEFAULT_KEEPALIVE_EXPIRY_SECONDS = 60
+DEFAULT_CONNECT_TIMEOUT_SECONDS = 10
+DEFAULT_TIMEOUT_SECONDS = 600
+
+
+class ConnectionStats:
+    """Counts of requests and of the connections opened for them.
+
+    Requests that do not open a connection reuse a kept-alive one.
+    """
+
+    def __init__(self):
+        self.requests = 0
+        self.new_connections = 0
+        self.tls_handshakes = 0
+        self._lock = threading.Lock()
+
+    def on_request(self, request: httpx.Request):
+        """Count a request and trace the connection it uses."""
+        request.extensions["trace"] = self.on_trace
+        with self._lock:
+            self.requests += 1
+
+    def on_trace(self, event_name: str, info: dict):
+        """Count the connection events of httpcore."""
+        del info
+        with self._lock:
+            if event_name == "connection.connect_tcp.complete":
+                self.new_connections += 1
+            elif event_name == "connection.start_tls.complete":
+                self.tls_handshakes += 1
+
+    def as_dict(self) -> dict[str, int]:
+        """Return the counts, including the number of reused connections."""
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "new_connections": self.new_connections,
+                "reused_connections": self.requests - self.new_connections,
+                "tls_handshakes": self.tls_handshakes,
+            }
+
+
+connection_stats = ConnectionStats()
+
+
+def create_http_client(stats: ConnectionStats = connection_stats) -> httpx.Client:
+    """Create an HTTP client with keep-alive connections bounded by config."""
+    return httpx.Client(
+        limits=httpx.Limits(
+            max_connections=config.get("llm_max_connections",
+                                       DEFAULT_MAX_CONNECTIONS),
+            max_keepalive_connections=config.get(
+                "llm_max_keepalive_connections",
+                DEFAULT_MAX_KEEPALIVE_CONNECTIONS),
+            keepalive_expiry=config.get("llm_keepalive_expiry_seconds",
+                                        DEFAULT_KEEPALIVE_EXPIRY_SECONDS),
+        ),
+        timeout=httpx.Timeout(
+            config.get("llm_timeout_seconds", DEFAULT_TIMEOUT_SECONDS),
+            connect=config.get("llm_connect_timeout_seconds",
+                               DEFAULT_CONNECT_TIMEOUT_SECONDS),
+        ),
+        event_hooks={"request": [stats.on_request]},
+    )
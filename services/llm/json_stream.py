@@ -0,0 +1,137 @@
+"""Incremental parser of a JSON object streamed by the LLM."""
+
+import json
+from typing import Any, Callable
+
+from . import llm_exceptions
+
+# Whitespace allowed between JSON tokens.
+WHITESPACE = " \t\n\r"
+
+
+class IncrementalJSONParser:
+    """Parse a JSON object while its text is streamed.
+
+    Each top-level field is passed to ``on_field`` as soon as its value is
+    complete, so that a generation can be validated and aborted before the
+    rest of it arrives. Text that cannot be part of a JSON object raises
+    LLMJSONParseException at the first offending character.
+    """
+
+    def __init__(
+        self,
+        on_field: Callable[[str, Any], None] | None = None,
+    ):
+        self.on_field = on_field
+        self.reset()
+
+    def reset(self):
+        """Forget the text fed so far, to parse a new response."""
+        self.fields: dict[str, Any] = {}
+        self._state = "start"
+        self._position = 0
+        self._buffer: list[str] = []
+        self._key = ""
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+
+    def feed(self, text: str):
+        """Parse the next piece of the text."""
+        for char in text:
+            self._feed_char(char)
+            self._position += 1
+
+    def close(self) -> dict[str, Any]:
+        """Finish parsing and return the object.
+
+        Raises:
+            LLMJSONParseException: If the object is incomplete.
+        """
+        if self._state != "end":
+            raise llm_exceptions.LLMJSONParseException(
+                "The JSON response ended unexpectedly.")
+        return self.fields
+
+    def _feed_char(self, char: str):
+        """Advance the state machine by a character."""
+        if self._state == "key":
+            self._feed_string(char)
+            if not self._in_string:
+                self._key = self._loads("".join(self._buffer))
+                self._state = "colon"
+        elif self._state == "value":
+            self._feed_value(char)
+        elif char in WHITESPACE:
+            pass
+        elif self._state == "start" and char == "{":
+            self._state = "first_key"
+        elif self._state in ("first_key", "next_key") and char == '"':
+            self._buffer = []
+            self._feed_string(char)
+            self._state = "key"
+        elif self._state == "colon" and char == ":":
+            self._buffer = []
+            self._depth = 0
+            self._state = "value"
+        elif self._state in ("first_key", "after_value") and char == "}":
+            self._state = "end"
+        elif self._state == "after_value" and char == ",":
+            self._state = "next_key"
+        else:
+            raise llm_exceptions.LLMJSONParseException(
+                f"Unexpected {char!r} at character {self._position} "
+                "of the JSON response.")
+
+    def _feed_string(self, char: str):
+        """Add a character of a string, tracking its end."""
+        self._buffer.append(char)
+        if not self._in_string:
+            self._in_string = True
+        elif self._escaped:
+            self._escaped = False
+        elif char == "\\":
+            self._escaped = True
+        elif char == '"':
+            self._in_string = False
+
+    def _feed_value(self, char: str):
+        """Add a character of a value, ending the value at its delimiter."""
+        if self._in_string:
+            self._feed_string(char)
+            if not self._in_string and self._depth == 0:
+                self._end_value()
+            return
+        if self._depth == 0 and char in ",}":
+            self._end_value()
+            self._feed_char(char)
+            return
+        if char == '"':
+            self._feed_string(char)
+            return
+        self._buffer.append(char)
+        if char in "[{":
+            self._depth += 1
+        elif char in "]}":
+            self._depth -= 1
+            if self._depth < 0:
+                raise llm_exceptions.LLMJSONParseException(
+                    f"Unexpected {char!r} at character {self._position} "
+                    "of the JSON response.")
+
+    def _end_value(self):
+        """Decode the current value and pass the field to on_field."""
+        value = self._loads("".join(self._buffer))
+        self._state = "after_value"
+        self.fields[self._key] = value
+        if self.on_field is not None:
+            self.on_field(self._key, value)
+
+    def _loads(self, text: str) -> Any:
+        """Decode a JSON value, raising LLMJSONParseException on errors."""
+        try:
+            return json.loads(text)
+        except json.JSONDecodeError as err:
+            raise llm_exceptions.LLMJSONParseException(
+                f"Invalid JSON value before character {self._position}: "
+                f"{err}") from err
@@ -1,7 +1,5 @@
 """Exceptions for the package."""
 
-import functools
-
 
 class LLMException(Exception):
     """Base exception raised for errors in the LLM package."""
@@ -30,36 +28,25 @@ class LLMJSONParseException(LLMException):
     message = "Failed to parse JSON response."
 
 
-def retry_wrapper(func, retry: int, args, kwargs):
-    """Retry a function call."""
-
-    for _ in range(retry + 1):
-        try:
-            return func(*args, **kwargs)
-        except LLMException as err:
-            original_err = err
-    raise original_err
+class LLMJSONValidationException(LLMJSONParseException):
+    """Exception raised when a JSON response does not have the expected fields."""
 
+    message = "The JSON response is invalid."
 
-def get_retry_decorator(retry: int):
-    """Get a retry decorator with a specified number of retries."""
 
-    def retry_decorator(func):
+class LLMTimeoutException(LLMException):
+    """Exception raised when the LLM does not respond in time."""
 
-        @functools.wraps(func)
-        def wrapper(*args, **kwargs):
-            return retry_wrapper(func, retry, args, kwargs)
+    message = "The response was not generated in time."
 
-        return wrapper
 
-    return retry_decorator
+class LLMStreamAbortedException(Exception):
+    """Exception raised when a streamed response is aborted.
 
+    It is not an LLMException, so that an aborted generation is not retried.
+    """
 
-def retry_handler(retry_or_func=0):
-    """Decorator to retry a function call."""
+    message = "The response stream was aborted."
 
-    if callable(retry_or_func):
-        func = retry_or_func
-        return retry_handler()(func)
-    retry = retry_or_func
-    return get_retry_decorator(retry)
+    def __init__(self, message: str = None):
+        super().__init__(message or self.message)
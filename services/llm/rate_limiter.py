@@ -0,0 +1,227 @@
+"""Rate limiter of LLM requests shared by the processes on a host.
+
+Requests per minute and tokens per minute are limited by two token buckets
+stored in SQLite, so that every process using the same cache path draws from
+the same budget. A request that does not fit waits until the buckets refill
+instead of failing with a rate limit error.
+"""
+
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Callable
+
+from config import config
+
+DEFAULT_REQUESTS_PER_MINUTE = 500
+DEFAULT_TOKENS_PER_MINUTE = 200000
+# Waiters not seen for this long belong to processes that have died.
+STALE_WAITER_SECONDS = 600
+
+
+class RateLimiter:
+    """Token buckets of requests and tokens per minute.
+
+    Each bucket holds up to a minute's worth of its rate and refills
+    continuously, so that bursts are allowed as long as the average rate is
+    kept. ``queue_depth`` counts the requests waiting in all processes.
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        requests_per_minute: float = DEFAULT_REQUESTS_PER_MINUTE,
+        tokens_per_minute: float = DEFAULT_TOKENS_PER_MINUTE,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.db_path = db_path
+        self.limits = {
+            "requests": float(requests_per_minute),
+            "tokens": float(tokens_per_minute),
+        }
+        self.clock = clock
+        self.acquired = 0
+        self.total_wait_seconds = 0.0
+        self.last_wait_seconds = 0.0
+        self._lock = threading.Lock()
+        self._conn: sqlite3.Connection | None = None
+
+    def _connect(self) -> sqlite3.Connection:
+        """Open the database on first use."""
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(self.db_path,
+                                         timeout=30,
+                                         isolation_level=None,
+                                         check_same_thread=False)
+            self._conn.execute("CREATE TABLE IF NOT EXISTS buckets ("
+                               "name TEXT PRIMARY KEY, "
+                               "level REAL NOT NULL, "
+                               "updated_at REAL NOT NULL)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS waiters ("
+                               "id TEXT PRIMARY KEY, "
+                               "seen_at REAL NOT NULL)")
+        return self._conn
+
+    def _refill(self, conn: sqlite3.Connection, now: float) -> dict[str, float]:
+        """Return the levels of the buckets refilled up to now."""
+        levels = {}
+        for name, limit in self.limits.items():
+            row = conn.execute(
+                "SELECT level, updated_at FROM buckets WHERE name = ?",
+                (name, )).fetchone()
+            if row is None:
+                levels[name] = limit
+            else:
+                elapsed = max(0.0, now - row[1])
+                levels[name] = min(limit, row[0] + elapsed * limit / 60)
+        return levels
+
+    def _save(self, conn: sqlite3.Connection, levels: dict[str, float],
+              now: float):
+        """Store the levels of the buckets."""
+        conn.executemany(
+            "INSERT OR REPLACE INTO buckets VALUES (?, ?, ?)",
+            [(name, level, now) for name, level in levels.items()],
+        )
+
+    def try_acquire(self, tokens: int, waiter_id: str | None = None) -> float:
+        """Take a request and tokens from the buckets if they fit.
+
+        A request larger than the bucket is clamped to the whole bucket.
+        If waiter_id is given and the request has to wait, it is counted in
+        the queue until remove_waiter is called.
+
+        Returns:
+            float: 0 if acquired, otherwise the seconds to wait before the
+            request fits.
+        """
+        cost = {
+            "requests": 1.0,
+            "tokens": min(float(tokens), self.limits["tokens"]),
+        }
+        with self._lock:
+            conn = self._connect()
+            now = self.clock()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                levels = self._refill(conn, now)
+                wait_seconds = max(
+                    (cost[name] - levels[name]) * 60 / self.limits[name]
+                    for name in self.limits)
+                if wait_seconds <= 0:
+                    self._save(conn, {
+                        name: levels[name] - cost[name]
+                        for name in self.limits
+                    }, now)
+                    self.acquired += 1
+                elif waiter_id is not None:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO waiters VALUES (?, ?)",
+                        (waiter_id, now))
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return max(0.0, wait_seconds)
+
+    def consume(self, tokens: int):
+        """Take tokens used beyond the estimate, such as the output.
+
+        The bucket may go below zero, so that later requests wait longer.
+        """
+        with self._lock:
+            conn = self._connect()
+            now = self.clock()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                levels = self._refill(conn, now)
+                levels["tokens"] -= tokens
+                self._save(conn, levels, now)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+    def remove_waiter(self, waiter_id: str):
+        """Remove a request from the queue."""
+        with self._lock:
+            self._connect().execute("DELETE FROM waiters WHERE id = ?",
+                                    (waiter_id, ))
+
+    def acquire(self, tokens: int) -> float:
+        """Wait until a request with tokens fits, and return the seconds waited."""
+        waiter_id = uuid.uuid4().hex
+        start = self.clock()
+        waited = False
+        try:
+            while (wait_seconds := self.try_acquire(tokens, waiter_id)) > 0:
+                waited = True
+                time.sleep(wait_seconds)
+        finally:
+            if waited:
+                self.remove_waiter(waiter_id)
+        return self._record_wait(self.clock() - start)
+
+    async def aacquire(self, tokens: int) -> float:
+        """Async counterpart of acquire.
+
+        The database is accessed on a worker thread, since waiting for the
+        lock of another process would block the event loop.
+        """
+        waiter_id = uuid.uuid4().hex
+        start = self.clock()
+        waited = False
+        try:
+            while (wait_seconds := await asyncio.to_thread(
+                    self.try_acquire, tokens, waiter_id)) > 0:
+                waited = True
+                await asyncio.sleep(wait_seconds)
+        finally:
+            if waited:
+                await asyncio.to_thread(self.remove_waiter, waiter_id)
+        return self._record_wait(self.clock() - start)
+
+    def _record_wait(self, wait_seconds: float) -> float:
+        """Record the wait of an acquired request."""
+        with self._lock:
+            self.last_wait_seconds = wait_seconds
+            self.total_wait_seconds += wait_seconds
+        return wait_seconds
+
+    def queue_depth(self) -> int:
+        """Return the number of requests waiting in all processes."""
+        with self._lock:
+            conn = self._connect()
+            conn.execute("DELETE FROM waiters WHERE seen_at < ?",
+                         (self.clock() - STALE_WAITER_SECONDS, ))
+            return conn.execute("SELECT COUNT(*) FROM waiters").fetchone()[0]
+
+    def stats(self) -> dict[str, float]:
+        """Return the queue depth and the wait times of this process."""
+        return {
+            "queue_depth": self.queue_depth(),
+            "acquired": self.acquired,
+            "last_wait_seconds": round(self.last_wait_seconds, 3),
+            "total_wait_seconds": round(self.total_wait_seconds, 3),
+        }
+
+
+_rate_limiters: dict[str, RateLimiter] = {}
+
+
+def get_rate_limiter() -> RateLimiter:
+    """Return the rate limiter shared by the processes using the cache path."""
+    db_path = os.path.join(config.get("cache_path", ".cache"),
+                           "llm_rate_limit.sqlite3")
+    if db_path not in _rate_limiters:
+        _rate_limiters[db_path] = RateLimiter(
+            db_path,
+            config.get("llm_requests_per_minute",
+                       DEFAULT_REQUESTS_PER_MINUTE),
+            config.get("llm_tokens_per_minute", DEFAULT_TOKENS_PER_MINUTE),
+        )
+    return _rate_limiters[db_path]
@@ -0,0 +1,188 @@
+"""Persistent cache of LLM responses keyed by the request content."""
+
+import contextlib
+import contextvars
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Iterator
+
+from config import config
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_TTL_SECONDS = 24 * 60 * 60
+
+_bypassed: contextvars.ContextVar[bool] = contextvars.ContextVar(
+    "llm_cache_bypassed", default=False)
+
+
+def make_key(model: str, messages: list[dict[str, str]],
+             response_format: dict[str, str]) -> str:
+    """Hash a request canonically, so that equal requests share a key."""
+    canonical = json.dumps(
+        {
+            "model": model,
+            "messages": [dict(message) for message in messages],
+            "response_format": response_format,
+        },
+        ensure_ascii=False,
+        separators=(",", ":"),
+        sort_keys=True,
+    )
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+class ResponseCache:
+    """An on-disk cache of LLM responses.
+
+    Entries expire ``ttl_seconds`` after they are stored, and are evicted in
+    least recently used order once their total size exceeds ``max_bytes``.
+    ``bytes_saved`` counts the request and response bytes of cache hits.
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        ttl_seconds: float = DEFAULT_TTL_SECONDS,
+    ):
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+        self._lock = threading.Lock()
+        self._conn: sqlite3.Connection | None = None
+
+    def _connect(self) -> sqlite3.Connection:
+        """Open the cache database on first use."""
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(self.db_path,
+                                         timeout=30,
+                                         check_same_thread=False)
+            self._conn.execute("CREATE TABLE IF NOT EXISTS responses ("
+                               "key TEXT PRIMARY KEY, "
+                               "response TEXT NOT NULL, "
+                               "request_size INTEGER NOT NULL, "
+                               "size INTEGER NOT NULL, "
+                               "created_at REAL NOT NULL, "
+                               "last_access REAL NOT NULL)")
+        return self._conn
+
+    def get(self, key: str) -> str | None:
+        """Return the cached response, or None if it is missing or expired."""
+        with self._lock:
+            conn = self._connect()
+            now = time.time()
+            row = conn.execute(
+                "SELECT response, request_size, size, created_at "
+                "FROM responses WHERE key = ?",
+                (key, ),
+            ).fetchone()
+            if row is not None and now - row[3] > self.ttl_seconds:
+                conn.execute("DELETE FROM responses WHERE key = ?", (key, ))
+                conn.commit()
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.bytes_saved += row[1] + row[2]
+            conn.execute("UPDATE responses SET last_access = ? WHERE key = ?",
+                         (now, key))
+            conn.commit()
+            return row[0]
+
+    def put(self, key: str, response: str, request_size: int = 0):
+        """Store a response and evict entries over the size bound."""
+        with self._lock:
+            conn = self._connect()
+            now = time.time()
+            conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                (key, response, request_size, len(
+                    response.encode()), now, now),
+            )
+            self._evict()
+            conn.commit()
+
+    def delete(self, key: str):
+        """Delete a response, for example one that turned out to be invalid."""
+        with self._lock:
+            conn = self._connect()
+            conn.execute("DELETE FROM responses WHERE key = ?", (key, ))
+            conn.commit()
+
+    def _evict(self):
+        """Delete expired entries, then least recently used ones to fit."""
+        conn = self._connect()
+        conn.execute("DELETE FROM responses WHERE created_at < ?",
+                     (time.time() - self.ttl_seconds, ))
+        total = conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        rows = conn.execute(
+            "SELECT key, size FROM responses ORDER BY last_access")
+        evicted = []
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            evicted.append((key, ))
+            total -= size
+        conn.executemany("DELETE FROM responses WHERE key = ?", evicted)
+
+    def stats(self) -> dict[str, int]:
+        """Return hit/miss counters, saved bytes and the size of the cache."""
+        with self._lock:
+            entries, size = self._connect().execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "bytes_saved": self.bytes_saved,
+            "entries": entries,
+            "bytes": size,
+        }
+
+
+_response_caches: dict[str, ResponseCache] = {}
+
+
+def is_bypassed() -> bool:
+    """Check if the cache is bypassed by config, LLM_CACHE_BYPASS or
+    bypassed()."""
+    return bool(
+        _bypassed.get() or config.get("llm_cache_bypass", False)
+        or os.getenv("LLM_CACHE_BYPASS"))
+
+
+@contextlib.contextmanager
+def bypassed() -> Iterator[None]:
+    """Bypass the cache for the LLM calls made inside the block.
+
+    For calls whose response has side effects that must not be repeated,
+    such as filing an issue. It can also be used as a decorator.
+    """
+    token = _bypassed.set(True)
+    try:
+        yield
+    finally:
+        _bypassed.reset(token)
+
+
+def get_response_cache() -> ResponseCache:
+    """Return the process-wide response cache for the configured cache path."""
+    db_path = os.path.join(config.get("cache_path", ".cache"),
+                           "llm_responses.sqlite3")
+    if db_path not in _response_caches:
+        _response_caches[db_path] = ResponseCache(
+            db_path,
+            config.get("llm_cache_max_bytes", DEFAULT_MAX_BYTES),
+            config.get("llm_cache_ttl_seconds", DEFAULT_TTL_SECONDS),
+        )
+    return _response_caches[db_path]
@@ -0,0 +1,359 @@
+"""A local stub of the OpenAI chat completions API.
+
+The server answers POST /v1/chat/completions like the API does, including
+the json_object response format and streaming, with configurable latency,
+injected errors and scripted responses. Point services.llm at it with the
+openai_base_url config or the OPENAI_BASE_URL environment variable to test
+retries, rate limiting and concurrency without network access:
+
+    python -m services.llm.stub_server --port 8080 \\
+        --latency lognormal:-1,0.5 --error-rate 429=0.1 --error-rate 500=0.05
+    OPENAI_BASE_URL=http://127.0.0.1:8080/v1 python main.py update_issue ...
+"""
+
+import dataclasses
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from argparse import ArgumentParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from utils.logging_utils import log
+
+ERROR_MESSAGES = {
+    429: "Rate limit reached.",
+    500: "The server had an error while processing your request.",
+}
+
+
+@dataclasses.dataclass
+class Latency:
+    """A distribution of latencies in seconds.
+
+    kind is 'fixed' (value), 'uniform' (low, high), 'normal' (mean,
+    stddev) or 'lognormal' (mu, sigma of the underlying normal).
+    """
+
+    kind: str = "fixed"
+    params: tuple[float, ...] = (0.0, )
+
+    @classmethod
+    def parse(cls, text: str) -> "Latency":
+        """Parse a latency such as '0.1', 'uniform:0.1,0.5'."""
+        kind, _, params = text.rpartition(":")
+        return cls(kind or "fixed",
+                   tuple(float(param) for param in params.split(",")))
+
+    def sample(self, rng: random.Random) -> float:
+        """Draw a latency, never below zero."""
+        if self.kind == "fixed":
+            value = self.params[0]
+        elif self.kind == "uniform":
+            value = rng.uniform(*self.params)
+        elif self.kind == "normal":
+            value = rng.gauss(*self.params)
+        elif self.kind == "lognormal":
+            value = rng.lognormvariate(*self.params)
+        else:
+            raise ValueError(f"Unknown latency distribution: {self.kind}")
+        return max(0.0, value)
+
+
+@dataclasses.dataclass
+class ScriptedResponse:
+    """A response returned for one request, in the order of the script.
+
+    status is an HTTP status, or 0 to hang up without responding like a
+    timeout. content is returned when status is 200.
+    """
+
+    content: str | None = None
+    status: int = 200
+    latency: float | None = None
+    retry_after: float | None = None
+
+
+@dataclasses.dataclass
+class StubOptions:
+    """The behavior of the stub server.
+
+    error_rates maps an HTTP status, or 0 for a timeout, to the probability
+    that a request fails with it. Without a script, the content echoes the
+    last message, wrapped in an object for the json_object format.
+    """
+
+    latency: Latency = dataclasses.field(default_factory=Latency)
+    token_latency: Latency = dataclasses.field(default_factory=Latency)
+    error_rates: dict[int, float] = dataclasses.field(default_factory=dict)
+    retry_after: float | None = None
+    timeout_seconds: float = 30.0
+    script: list[ScriptedResponse] = dataclasses.field(default_factory=list)
+    seed: int | None = None
+
+
+class StubServer(ThreadingHTTPServer):
+    """An HTTP server stubbing the OpenAI chat completions API."""
+
+    daemon_threads = True
+
+    def __init__(self,
+                 options: StubOptions | None = None,
+                 host: str = "127.0.0.1",
+                 port: int = 0):
+        super().__init__((host, port), StubRequestHandler)
+        self.options = options or StubOptions()
+        self.rng = random.Random(self.options.seed)
+        self.script = list(self.options.script)
+        self.requests: list[dict] = []
+        self.statuses: dict[int, int] = {}
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+
+    @property
+    def base_url(self) -> str:
+        """The base URL to pass to the OpenAI client."""
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def next_response(self, request: dict) -> ScriptedResponse:
+        """Decide the response to a request."""
+        with self._lock:
+            self.requests.append(request)
+            if self.script:
+                response = self.script.pop(0)
+            else:
+                response = ScriptedResponse()
+                draw = self.rng.random()
+                for status, rate in self.options.error_rates.items():
+                    if draw < rate:
+                        response.status = status
+                        break
+                    draw -= rate
+            if response.latency is None:
+                response.latency = self.options.latency.sample(self.rng)
+            if response.retry_after is None:
+                response.retry_after = self.options.retry_after
+            self.statuses[response.status] = self.statuses.get(
+                response.status, 0) + 1
+        if response.content is None:
+            response.content = get_default_content(request)
+        return response
+
+    def sample_token_latency(self) -> float:
+        """Draw the latency between streamed chunks."""
+        with self._lock:
+            return self.options.token_latency.sample(self.rng)
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self.serve_forever,
+                                        kwargs={"poll_interval": 0.05},
+                                        daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+        self.server_close()
+
+
+def get_default_content(request: dict) -> str:
+    """Echo the last message, as JSON for the json_object format."""
+    messages = request.get("messages") or [{}]
+    content = messages[-1].get("content") or ""
+    if request.get("response_format", {}).get("type") == "json_object":
+        return json.dumps({"content": content})
+    return content
+
+
+class StubRequestHandler(BaseHTTPRequestHandler):
+    """Handle requests to the stub server."""
+
+    protocol_version = "HTTP/1.1"
+    server: StubServer
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        """Answer a chat completion request."""
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.path.rstrip("/") != "/v1/chat/completions":
+            self.send_json(404, {"error": {"message": "Not found."}})
+            return
+        try:
+            request = json.loads(body)
+        except json.JSONDecodeError:
+            self.send_json(400, {"error": {"message": "Invalid JSON."}})
+            return
+
+        response = self.server.next_response(request)
+        time.sleep(response.latency)
+        if response.status == 0:
+            time.sleep(self.server.options.timeout_seconds)
+            self.close_connection = True
+            return
+        if response.status != 200:
+            headers = {}
+            if response.retry_after is not None:
+                headers["retry-after"] = str(response.retry_after)
+            self.send_json(
+                response.status, {
+                    "error": {
+                        "message":
+                        ERROR_MESSAGES.get(response.status, "Error."),
+                        "type": "stub_error",
+                    }
+                }, headers)
+            return
+        if request.get("stream"):
+            self.send_stream(request, response.content)
+        else:
+            self.send_json(200, make_completion(request, response.content))
+
+    def send_json(self,
+                  status: int,
+                  data: dict,
+                  headers: dict[str, str] | None = None):
+        """Send a JSON response."""
+        payload = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def send_stream(self, request: dict, content: str):
+        """Send the content word by word as server-sent events."""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        pieces = re.findall(r"\S+\s*|\s+", content) or [""]
+        for index, piece in enumerate(pieces):
+            if index:
+                time.sleep(self.server.sample_token_latency())
+            self.send_event(
+                make_chunk(request, completion_id, {"content": piece}, None))
+        self.send_event(make_chunk(request, completion_id, {}, "stop"))
+        self.send_event("[DONE]")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def send_event(self, data: dict | str):
+        """Send a server-sent event as an HTTP chunk."""
+        if not isinstance(data, str):
+            data = json.dumps(data)
+        event = f"data: {data}\n\n".encode()
+        self.wfile.write(f"{len(event):x}\r\n".encode() + event + b"\r\n")
+        self.wfile.flush()
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        """Log requests at the debug level."""
+        log(format % args, level="debug")
+
+
+def make_completion(request: dict, content: str) -> dict:
+    """Make a chat completion object."""
+    prompt_tokens = sum(
+        len(str(message.get("content", "")).split())
+        for message in request.get("messages", []))
+    completion_tokens = len(content.split())
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": request.get("model", "stub"),
+        "choices": [{
+            "index": 0,
+            "message": {
+                "role": "assistant",
+                "content": content
+            },
+            "finish_reason": "stop",
+        }],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        },
+    }
+
+
+def make_chunk(request: dict, completion_id: str, delta: dict,
+               finish_reason: str | None) -> dict:
+    """Make a chat completion chunk object."""
+    return {
+        "id": completion_id,
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": request.get("model", "stub"),
+        "choices": [{
+            "index": 0,
+            "delta": delta,
+            "finish_reason": finish_reason
+        }],
+    }
+
+
+def parse_error_rate(text: str) -> tuple[int, float]:
+    """Parse an error rate such as '429=0.1' or 'timeout=0.01'."""
+    status, _, rate = text.partition("=")
+    return (0 if status == "timeout" else int(status)), float(rate)
+
+
+def load_script(path: str) -> list[ScriptedResponse]:
+    """Load scripted responses from a JSON Lines file."""
+    with open(path, encoding="utf-8") as file_object:
+        return [
+            ScriptedResponse(**json.loads(line)) for line in file_object
+            if line.strip()
+        ]
+
+
+def main(args=None):
+    """Run the stub server until interrupted."""
+    parser = ArgumentParser(
+        description="Stub of the OpenAI chat completions API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency",
+                        type=Latency.parse,
+                        default=Latency(),
+                        help="e.g. 0.5, uniform:0.1,1 or lognormal:-1,0.5")
+    parser.add_argument("--token-latency",
+                        type=Latency.parse,
+                        default=Latency(),
+                        help="Latency between streamed chunks")
+    parser.add_argument("--error-rate",
+                        type=parse_error_rate,
+                        action="append",
+                        default=[],
+                        help="e.g. 429=0.1, 500=0.05 or timeout=0.01")
+    parser.add_argument("--retry-after", type=float)
+    parser.add_argument("--timeout-seconds", type=float, default=30.0)
+    parser.add_argument("--script",
+                        help="JSON Lines file of scripted responses")
+    parser.add_argument("--seed", type=int)
+    parsed = parser.parse_args(args)
+
+    options = StubOptions(
+        latency=parsed.latency,
+        token_latency=parsed.token_latency,
+        error_rates=dict(parsed.error_rate),
+        retry_after=parsed.retry_after,
+        timeout_seconds=parsed.timeout_seconds,
+        script=load_script(parsed.script) if parsed.script else [],
+        seed=parsed.seed,
+    )
+    with StubServer(options, parsed.host, parsed.port) as server:
+        log(f"Stub OpenAI API listening on {server.base_url}")
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+"""A ledger of the token usage and latency of each LLM call.
+
+Each call is appended as a JSON line to llm_usage.jsonl under the cache
+path, labeled with the action and the stage that made it. The labels are
+context variables, so that they follow the call through threads started with
+contextvars and asyncio tasks.
+"""
+
+import contextlib
+import contextvars
+import dataclasses
+import json
+import math
+import os
+import threading
+import time
+from typing import Iterator
+
+from config import config
+
+_action: contextvars.ContextVar[str | None] = contextvars.ContextVar(
+    "llm_usage_action", default=None)
+_stage: contextvars.ContextVar[str | None] = contextvars.ContextVar(
+    "llm_usage_stage", default=None)
+_lock = threading.Lock()
+
+PERCENTILES = (50, 90, 99)
+
+
+@dataclasses.dataclass
+class UsageRecord:
+    """The usage of an LLM call."""
+
+    model: str
+    prompt_tokens: int
+    completion_tokens: int
+    latency_seconds: float
+    retries: int = 0
+    cached: bool = False
+    error: str | None = None
+    action: str | None = None
+    stage: str | None = None
+    timestamp: float = dataclasses.field(default_factory=time.time)
+
+
+@contextlib.contextmanager
+def labels(action: str | None = None,
+           stage: str | None = None) -> Iterator[None]:
+    """Label the LLM calls made inside the block.
+
+    It can also be used as a decorator. Labels that are not given are kept.
+    """
+    tokens = []
+    if action is not None:
+        tokens.append((_action, _action.set(action)))
+    if stage is not None:
+        tokens.append((_stage, _stage.set(stage)))
+    try:
+        yield
+    finally:
+        for variable, token in reversed(tokens):
+            variable.reset(token)
+
+
+def stage(name: str):
+    """Label the LLM calls made inside the block or function with a stage."""
+    return labels(stage=name)
+
+
+def get_ledger_path() -> str:
+    """Return the path of the ledger under the cache path."""
+    return os.path.join(config.get("cache_path", ".cache"), "llm_usage.jsonl")
+
+
+def record(usage: UsageRecord, path: str | None = None):
+    """Append a call to the ledger, labeled with the current action and stage.
+
+    A line is written with a single append, so that processes sharing the
+    ledger do not interleave their records.
+    """
+    if usage.action is None:
+        usage.action = _action.get()
+    if usage.stage is None:
+        usage.stage = _stage.get()
+    path = path or get_ledger_path()
+    line = json.dumps(dataclasses.asdict(usage), ensure_ascii=False) + "\n"
+    with _lock:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line.encode())
+        finally:
+            os.close(fd)
+
+
+def read_records(path: str | None = None) -> list[UsageRecord]:
+    """Read the calls in the ledger, skipping broken lines."""
+    path = path or get_ledger_path()
+    if not os.path.exists(path):
+        return []
+    records = []
+    with open(path, encoding="utf-8") as file_object:
+        for line in file_object:
+            try:
+                records.append(UsageRecord(**json.loads(line)))
+            except (TypeError, ValueError):
+                continue
+    return records
+
+
+def percentile(values: list[float], rank: float) -> float:
+    """Return the nearest-rank percentile of values."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(rank / 100 * len(ordered)) - 1)]
+
+
+def summarize(records: list[UsageRecord]) -> dict[tuple[str, str], dict]:
+    """Aggregate the calls per action and stage."""
+    groups: dict[tuple[str, str], list[UsageRecord]] = {}
+    for usage in records:
+        key = (usage.action or "-", usage.stage or "-")
+        groups.setdefault(key, []).append(usage)
+
+    summary = {}
+    for key, group in sorted(groups.items()):
+        latencies = [usage.latency_seconds for usage in group]
+        summary[key] = {
+            "calls": len(group),
+            "cached": sum(usage.cached for usage in group),
+            "errors": sum(usage.error is not None for usage in group),
+            "retries": sum(usage.retries for usage in group),
+            "prompt_tokens": sum(usage.prompt_tokens for usage in group),
+            "completion_tokens": sum(usage.completion_tokens
+                                     for usage in group),
+            "latency_seconds": sum(latencies),
+            **{
+                f"p{rank}_seconds": percentile(latencies, rank)
+                for rank in PERCENTILES
+            },
+        }
+    return summary
+
+
+def format_report(records: list[UsageRecord]) -> str:
+    """Format the summary of the calls as a table with totals."""
+    columns = [
+        "calls", "cached", "errors", "retries", "prompt_tokens",
+        "completion_tokens", "latency_seconds",
+        *(f"p{rank}_seconds" for rank in PERCENTILES)
+    ]
+    summary = summarize(records)
+    rows = [["action", "stage", *columns]]
+    for (action, stage_name), values in summary.items():
+        rows.append([action, stage_name, *map(format_value, values.values())])
+    if summary:
+        totals = summarize([
+            dataclasses.replace(usage, action="total", stage="")
+            for usage in records
+        ])[("total", "-")]
+        rows.append(["total", "", *map(format_value, totals.values())])
+    widths = [max(len(row[idx]) for row in rows) for idx in range(len(rows[0]))]
+    return "\n".join("  ".join(
+        cell.ljust(width) if idx < 2 else cell.rjust(width)
+        for idx, (cell, width) in enumerate(zip(row, widths)))
+                     for row in rows)
+
+
+def format_value(value: float) -> str:
+    """Format a number of the report."""
+    if isinstance(value, float):
+        return f"{value:.3f}"
+    return str(value)
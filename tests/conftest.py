@@ -1,8 +1,63 @@
 """Pytest configuration file."""
 
+import contextlib
+import re
+import subprocess
+from types import SimpleNamespace
+
 import pytest
 
 import schemas
+import services.llm
+from config import config
+from logic import repo_context
+from services.github import backends, worktrees
+from utils import github_utils, retry_utils
+
+
+@pytest.fixture(autouse=True)
+def isolate_cache(mocker, tmp_path):
+    """Keep on-disk caches of each test inside its temporary directory."""
+    mocker.patch.dict(config, {"cache_path": str(tmp_path / "cache")})
+    repo_context.invalidate_contexts()
+    services.llm.reset_openai_client()
+    backends.reset_backend()
+    worktrees.reset_worktree_pools()
+
+
+@pytest.fixture(autouse=True)
+def no_retry_delay(mocker):
+    """Retry at once, and start each test with closed circuit breakers."""
+    mocker.patch.object(retry_utils.RetryPolicy, "get_delay", return_value=0)
+    for policy in (services.llm.retry_policy, services.llm.json_retry_policy,
+                   github_utils.retry_policy):
+        policy.reset()
+
+
+@pytest.fixture()
+def git_repo(mocker, tmp_path):
+    """Create a local git repository under a temporary repository path."""
+
+    def inner(files: dict[str, str], repo: str = "test_owner/test_repo"):
+        repository_path = tmp_path / "repos"
+        repo_path = repository_path / repo
+        repo_path.mkdir(parents=True, exist_ok=True)
+        for file_name, content in files.items():
+            (repo_path / file_name).parent.mkdir(parents=True, exist_ok=True)
+            (repo_path / file_name).write_text(content)
+        mocker.patch.dict(config, {"repository_path": str(repository_path)})
+        mocker.patch("utils.github_utils.DEFAULT_PATH", str(repository_path))
+        git = ["git", "-c", "user.name=test", "-c", "user.email=test@example.com"]
+        subprocess.run(["git", "init", "-q", "-b", "main"],
+                       cwd=repo_path,
+                       check=True)
+        subprocess.run(["git", "add", "-A"], cwd=repo_path, check=True)
+        subprocess.run([*git, "commit", "-q", "-m", "init"],
+                       cwd=repo_path,
+                       check=True)
+        return repo_path
+
+    return inner
 
 
 @pytest.fixture()
@@ -24,6 +79,8 @@ def setup_github():
         mocker.patch("services.github.reply_issue", return_value=True)
         mocker.patch("services.github.checkout_branch", return_value=True)
         mocker.patch("services.github.delete_branch", return_value=True)
+        mocker.patch("services.github.worktree",
+                     side_effect=lambda repo, base: contextlib.nullcontext())
 
     return inner
 
@@ -58,6 +115,26 @@ def setup_llm_detail():
     # client = OpenAI()
     # response = client.chat.completions.create(model, messages)
     # response.choices[0].message.content
+    # for chunk in client.chat.completions.create(..., stream=True):
+    #     chunk.choices[0].delta.content
+    class MockStream:
+        """Mock response stream yielding the content word by word."""
+
+        def __init__(self, content):
+            self.chunks = re.findall(r"\S+\s*", content)
+            self.closed = False
+
+        def __iter__(self):
+            for content in self.chunks:
+                if self.closed:
+                    return
+                delta = SimpleNamespace(content=content)
+                yield SimpleNamespace(choices=[SimpleNamespace(delta=delta)])
+
+        def close(self):
+            """Mock close function."""
+            self.closed = True
+
     class MockOpenAIObject:
         """Mock OpenAI class."""
 
@@ -70,18 +147,28 @@ def setup_llm_detail():
             self.content = "Hello, world!"
             self.model = None
             self.messages = None
+            self.streams = []
+
+        def OpenAI(self, **kwargs):  # pylint: disable=invalid-name
+            """Mock OpenAI client constructor."""
+            return self
 
         def create(
             self,
             model,
             messages,
             response_format={"type": "text"},
+            stream=False,
+            timeout=None,
         ):
             """Mock create function."""
             self.model = model
             self.messages = messages
             if response_format["type"] == "json_object":
                 self.content = '{"type": [{"content": "test"}]}'
+            if stream:
+                self.streams.append(MockStream(self.content))
+                return self.streams[-1]
             return self
 
         def __str__(self):
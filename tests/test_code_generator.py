@@ -1,4 +1,5 @@
 """Test module for code_generator.py."""
+import contextlib
 from unittest.mock import MagicMock
 
 import pytest
@@ -18,6 +19,9 @@ def test_generate_code_from_issue(mocker):
 
     mock_issue = MagicMock()
     mock_issue.id = issue_id
+    mock_issue.title = "テストタイトル"
+    mock_issue.body = "テスト本文"
+    mock_issue.comments = []
 
     class MockOpenAIClient:
         """Mock OpenAI client for testing."""
@@ -27,19 +31,31 @@ def test_generate_code_from_issue(mocker):
             self.completions = self
             self.choices = [self]
             self.message = self
+            self.delta = self
             self.content = "生成されたコード"
 
+        def OpenAI(self, **kwargs):  # pylint: disable=invalid-name
+            """Mock OpenAI client constructor."""
+            return self
+
         def create(self, *args, **kwargs):
             """Mock create method."""
             return self
 
+        def __iter__(self):
+            """Mock response stream with a single chunk."""
+            yield self
+
+        def close(self):
+            """Mock close method of the response stream."""
+
     mocker.patch.dict("os.environ", {"OPENAI_API_KEY": "test"})
     mocker.patch("services.llm.openai", new=MockOpenAIClient())
 
     mock_setup = mocker.patch('services.github.setup_repository')
     mock_get_issue = mocker.patch('services.github.get_issue_by_id',
                                   return_value=mock_issue)
-    mocker.patch('logic.generate_messages_from_files', return_value=[])
+    mocker.patch('logic.get_file_messages', return_value=[])
     mocker.patch('logic.generate_messages_from_issue', return_value=[])
 
     generated_code = generate_code_from_issue(issue_id, repo, branch,
@@ -64,12 +80,24 @@ def test_generate_readme_success(mocker):
             self.completions = self
             self.choices = [self]
             self.message = self
+            self.delta = self
             self.content = "生成されたREADME"
 
+        def OpenAI(self, **kwargs):  # pylint: disable=invalid-name
+            """Mock OpenAI client constructor."""
+            return self
+
         def create(self, *args, **kwargs):
             """Mock create method."""
             return self
 
+        def __iter__(self):
+            """Mock response stream with a single chunk."""
+            yield self
+
+        def close(self):
+            """Mock close method of the response stream."""
+
     mocker.patch.dict("os.environ", {"OPENAI_API_KEY": "test"})
     mocker.patch("services.llm.openai", new=MockOpenAIClient())
 
@@ -125,10 +153,21 @@ def test_generate_code_from_issue_and_reply_code_not_found(mocker):
             self.message = self
             self.content = "テスト応答"
 
+        def OpenAI(self, **kwargs):  # pylint: disable=invalid-name
+            """Mock OpenAI client constructor."""
+            return self
+
         def create(self, *args, **kwargs):
             """Mock create method."""
             return self
 
+        def __iter__(self):
+            """Mock response stream with a single chunk."""
+            yield self
+
+        def close(self):
+            """Mock close method of the response stream."""
+
     mocker.patch.dict("os.environ", {"OPENAI_API_KEY": "test-key"})
     mocker.patch("services.llm.openai", new=MockOpenAIClient())
 
@@ -140,7 +179,10 @@ def test_generate_code_from_issue_and_reply_code_not_found(mocker):
     mocker.patch("services.github.get_issue_by_id", return_value=mock_issue)
     mocker.patch("services.github.checkout_new_branch")
     mocker.patch("services.github.checkout_branch")
+    mocker.patch("services.github.checkout_detached")
     mocker.patch("services.github.delete_branch")
+    mocker.patch("services.github.worktree",
+                 side_effect=lambda repo, base: contextlib.nullcontext())
 
     # CodeModificationオブジェクトを使用
     mock_modification = logic.code_modification.CodeModification(
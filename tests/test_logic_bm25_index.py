@@ -0,0 +1,61 @@
+"""Test logic.bm25_index module."""
+
+import os
+
+import schemas
+from logic import bm25_index
+
+
+def test_tokenize():
+    """Test tokenize splits identifiers into parts."""
+    assert bm25_index.tokenize("def get_repo_path(repo): RepoPath") == [
+        "get_repo_path",
+        "get",
+        "repo",
+        "path",
+        "repo",
+        "repopath",
+        "repo",
+        "path",
+    ]
+
+
+def test_bm25_index_search():
+    """Test BM25Index ranks the most relevant file first."""
+    index = bm25_index.BM25Index()
+    index.add_document("services/github.py", "def clone_repository(): pass")
+    index.add_document("services/llm.py", "def generate_text(): pass")
+    index.add_document("main.py", "def main(): generate_text()")
+
+    results = index.search("Error of llm in generate text", 2)
+    assert [path for path, _ in results] == ["services/llm.py", "main.py"]
+
+    index.remove_document("services/llm.py")
+    assert [path for path, _ in index.search("generate", 2)] == ["main.py"]
+
+
+def test_search_relevant_files(git_repo, mocker):
+    """Test search_relevant_files builds the index once per HEAD."""
+    git_repo({
+        "services/github.py": "def clone_repository():\n    pass\n",
+        "services/llm.py": "def generate_text():\n    pass\n",
+    })
+    issue = schemas.Issue(id=1,
+                          title="generate_text fails",
+                          body="The LLM service raises an error.")
+    build_index = mocker.spy(bm25_index, "build_index")
+
+    assert bm25_index.search_relevant_files("test_owner/test_repo", "python",
+                                            issue) == ["services/llm.py"]
+    assert bm25_index.search_relevant_files("test_owner/test_repo", "python",
+                                            issue) == ["services/llm.py"]
+    assert build_index.call_count == 1
+    assert os.path.exists(
+        bm25_index.get_index_path("test_owner/test_repo", "python"))
+
+
+def test_search_relevant_files_without_repository():
+    """Test search_relevant_files falls back to all files."""
+    issue = schemas.Issue(id=1, title="test", body="test")
+    assert bm25_index.search_relevant_files("test_owner/not_found", "python",
+                                            issue) is None
@@ -0,0 +1,65 @@
+"""Test logic.chunker module."""
+
+from logic import chunker
+
+PYTHON_SOURCE = """import os
+
+
+@decorator
+def main():
+    return 1
+
+VALUE = 1
+
+
+class Main:
+    pass
+
+
+def main():
+    return 2
+"""
+
+
+def test_chunk_python():
+    """Test Python files are split into top-level definitions."""
+    chunks = chunker.chunk_file("pkg/mod.py", PYTHON_SOURCE)
+
+    assert [(chunk.id, chunk.start_line, chunk.end_line)
+            for chunk in chunks] == [
+                ("pkg/mod.py::module:1", 1, 3),
+                ("pkg/mod.py::def:main", 4, 6),
+                ("pkg/mod.py::module:2", 7, 10),
+                ("pkg/mod.py::class:Main", 11, 12),
+                ("pkg/mod.py::module:3", 13, 14),
+                ("pkg/mod.py::def:main#2", 15, 16),
+            ]
+    assert "".join(chunk.text for chunk in chunks) == PYTHON_SOURCE
+    for chunk in chunks:
+        assert PYTHON_SOURCE[chunk.offset:].startswith(chunk.text)
+
+
+def test_chunk_tex():
+    """Test TeX files are split into sections."""
+    source = ("\\documentclass{article}\n"
+              "\\section{Introduction}\n"
+              "Hello.\n"
+              "\\subsection*{Background}\n"
+              "World.\n")
+    chunks = chunker.chunk_file("paper.tex", source)
+
+    assert [chunk.id for chunk in chunks] == [
+        "paper.tex::preamble",
+        "paper.tex::section:Introduction",
+        "paper.tex::subsection:Background",
+    ]
+    assert chunks[1].label == (
+        "% chunk paper.tex::section:Introduction (lines 2-3)\n")
+
+
+def test_find_chunk():
+    """Test chunks are found with or without the path part of the ID."""
+    chunks = chunker.chunk_file("pkg/mod.py", PYTHON_SOURCE)
+    assert chunker.find_chunk(chunks, "pkg/mod.py::class:Main").start_line == 11
+    assert chunker.find_chunk(chunks, "def:main#2").start_line == 15
+    assert chunker.find_chunk(chunks, "def:missing") is None
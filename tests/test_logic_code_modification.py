@@ -0,0 +1,69 @@
+"""Test logic.code_modification module."""
+
+import pytest
+
+from logic import code_modification, logic_utils
+from services.llm import llm_exceptions
+
+SOURCE = """def first():
+    return None
+
+
+def second():
+    return None
+"""
+
+
+def test_apply_modification_within_chunk(git_repo):
+    """Test before_code is replaced only within the chunk of chunk_id."""
+    repo_path = git_repo({"main.py": SOURCE})
+    modification = code_modification.CodeModification(
+        file_path="main.py",
+        before_code="    return None",
+        after_code="    return 2",
+        chunk_id="main.py::def:second",
+    )
+
+    assert code_modification.verify_modification("test_owner/test_repo",
+                                                  modification)
+    code_modification.apply_modification("test_owner/test_repo", modification)
+
+    assert logic_utils.get_file_content(str(repo_path / "main.py")) == (
+        "def first():\n"
+        "    return None\n"
+        "\n"
+        "\n"
+        "def second():\n"
+        "    return 2\n")
+
+
+def test_modification_validator(git_repo):
+    """Test fields naming missing files or code are rejected early."""
+    git_repo({"main.py": SOURCE})
+    validate = code_modification.make_modification_validator(
+        "test_owner/test_repo")
+    validate("file_path", "main.py")
+    validate("before_code", "def second():")
+    validate("after_code", "def third():")
+
+    validate = code_modification.make_modification_validator(
+        "test_owner/test_repo")
+    with pytest.raises(llm_exceptions.LLMJSONValidationException):
+        validate("file_path", "missing.py")
+
+    validate = code_modification.make_modification_validator(
+        "test_owner/test_repo")
+    validate("before_code", "def third():")
+    with pytest.raises(llm_exceptions.LLMJSONValidationException):
+        validate("file_path", "main.py")
+
+
+@pytest.mark.parametrize("file_path", ["../x.py", "/etc/passwd"])
+def test_modification_validator_rejects_outside_paths(git_repo, file_path):
+    """Test file paths outside the repository are rejected."""
+    repo_path = git_repo({"main.py": SOURCE})
+    (repo_path.parent / "x.py").write_text(SOURCE)
+    validate = code_modification.make_modification_validator(
+        "test_owner/test_repo")
+    with pytest.raises(llm_exceptions.LLMJSONValidationException):
+        validate("file_path", file_path)
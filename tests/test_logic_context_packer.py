@@ -0,0 +1,75 @@
+"""Test logic.context_packer module."""
+
+from config import config
+from logic import context_packer
+
+
+def make_file_message(filename: str, lines: int) -> dict[str, str]:
+    """Make a file message with the given number of lines."""
+    content = "".join(f"line_{idx:04d} = {idx}\n" for idx in range(lines))
+    return {"role": "user", "content": f"```{filename}\n{content}```\n"}
+
+
+def test_get_token_budget(mocker):
+    """Test get_token_budget falls back to the default budget."""
+    mocker.patch.dict(config, {"token_budgets": {"default": 100, "add_issue": 50}})
+    assert context_packer.get_token_budget("add_issue") == 50
+    assert context_packer.get_token_budget("update_issue") == 100
+
+
+def test_pack_messages_within_budget(mocker):
+    """Test pack_messages keeps every message that fits."""
+    mocker.patch.dict(config, {"token_budgets": {"default": 10000}})
+    messages = [make_file_message("a.py", 10), make_file_message("b.py", 10)]
+    assert context_packer.pack_messages(messages, "add_issue") == messages
+
+
+def test_pack_messages_by_priority(mocker):
+    """Test pack_messages picks high priority messages and truncates one."""
+    mocker.patch.dict(config, {"token_budgets": {"default": 1000}})
+    messages = [
+        make_file_message("a.py", 200),
+        make_file_message("b.py", 100),
+        make_file_message("c.py", 10),
+    ]
+    packed = context_packer.pack_messages(messages,
+                                          "add_issue",
+                                          priorities=[0, 2, 1])
+
+    assert [message["content"].split("\n")[0] for message in packed] == [
+        "```a.py",
+        "```b.py",
+        "```c.py",
+    ]
+    assert packed[1] == messages[1]
+    assert packed[2] == messages[2]
+    assert packed[0]["content"].endswith(context_packer.TRUNCATION_MARKER +
+                                         "```\n")
+
+
+def test_pack_messages_reserved_messages(mocker):
+    """Test pack_messages subtracts reserved messages from the budget."""
+    mocker.patch.dict(config, {"token_budgets": {"default": 400}})
+    messages = [make_file_message("a.py", 10)]
+    reserved = [{"role": "user", "content": "x" * 1600}]
+    assert not context_packer.pack_messages(messages, "add_issue", reserved)
+
+
+def test_pack_messages_truncates_by_chunks(mocker):
+    """Test a truncated file keeps the whole chunks relevant to the query."""
+    mocker.patch.dict(config, {"token_budgets": {"default": 300}})
+    body = "".join(f"    value_{idx} = {idx}\n" for idx in range(40))
+    source = (f"def parse_config():\n{body}\n"
+              f"def render_page():\n{body}\n"
+              "def load_user():\n    return None\n")
+    messages = [{"role": "user", "content": f"```app.py\n{source}```\n"}]
+
+    packed = context_packer.pack_messages(messages,
+                                          "add_issue",
+                                          query="render the page")
+
+    content = packed[0]["content"]
+    assert "# chunk app.py::def:render_page (lines 43-83)\n" in content
+    assert "# chunk app.py::def:parse_config (lines 1-41) omitted\n" in content
+    assert "def load_user():" in content
+    assert content.endswith("```\n")
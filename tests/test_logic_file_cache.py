@@ -0,0 +1,75 @@
+"""Test logic.file_cache module."""
+
+import itertools
+
+import logic.logic_utils
+from logic import file_cache
+
+
+def test_file_cache_get_and_put(tmp_path):
+    """Test FileCache counts hits and misses."""
+    cache = file_cache.FileCache(str(tmp_path / "cache.sqlite3"))
+    assert cache.get("sha1", "content") is None
+    cache.put("sha1", "content", "print('hello')")
+    cache.commit()
+    assert cache.get("sha1", "content") == "print('hello')"
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+    assert cache.stats()["entries"] == 1
+
+
+def test_file_cache_evicts_least_recently_used(tmp_path, mocker):
+    """Test FileCache evicts entries over the size bound in LRU order."""
+    mocker.patch("logic.file_cache.time.time", side_effect=itertools.count())
+    cache = file_cache.FileCache(str(tmp_path / "cache.sqlite3"), max_bytes=8)
+    cache.put("sha1", "content", "aaaa")
+    cache.put("sha2", "content", "bbbb")
+    cache.get("sha1", "content")
+    cache.put("sha3", "content", "cccc")
+    cache.commit()
+    assert cache.get("sha1", "content") == "aaaa"
+    assert cache.get("sha2", "content") is None
+    assert cache.get("sha3", "content") == "cccc"
+
+
+def test_file_caches_share_a_database(tmp_path):
+    """Test a cache hit does not lock the database for other processes."""
+    db_path = str(tmp_path / "cache.sqlite3")
+    cache_a = file_cache.FileCache(db_path)
+    cache_a.put("sha1", "content", "aaaa")
+    cache_a.commit()
+    cache_b = file_cache.FileCache(db_path)
+    cache_b._connect().execute("PRAGMA busy_timeout = 0")
+
+    assert cache_a.get("sha1", "content") == "aaaa"
+    cache_a.put("sha2", "content", "bbbb")
+    assert cache_b.get("sha1", "content") == "aaaa"
+    cache_b.put("sha3", "content", "cccc")
+    cache_b.commit()
+    cache_a.commit()
+
+    assert cache_b.get("sha2", "content") == "bbbb"
+    assert cache_a.stats()["entries"] == 3
+
+
+def test_generate_messages_from_files_uses_cache(git_repo):
+    """Test generate_messages_from_files reuses cached messages."""
+    repo_path = git_repo({"main.py": "print(1)\n", "pkg/util.py": "x = 1\n"})
+    cache = file_cache.get_file_cache()
+
+    first = logic.logic_utils.generate_messages_from_files(
+        "test_owner/test_repo", "python")
+    assert cache.stats()["hits"] == 0
+
+    (repo_path / "main.py").write_text("print(2)\n")
+    second = logic.logic_utils.generate_messages_from_files(
+        "test_owner/test_repo", "python")
+
+    assert cache.stats()["hits"] == 1
+    assert sorted(message["content"] for message in first) == [
+        "```main.py\nprint(1)\n```\n",
+        "```pkg/util.py\nx = 1\n```\n",
+    ]
+    assert "```main.py\nprint(2)\n```\n" in [
+        message["content"] for message in second
+    ]
@@ -0,0 +1,59 @@
+"""Test logic.file_loader module."""
+
+from config import config
+from logic import file_loader
+
+
+def test_load_files_skips_binary_and_oversized_files(tmp_path, mocker):
+    """Test load_files keeps the order and skips files it cannot use."""
+    mocker.patch.dict(config, {"max_file_bytes": 1024})
+    (tmp_path / "a.py").write_bytes(b"print('a')\r\n")
+    (tmp_path / "b.bin").write_bytes(b"\x89PNG\0\0\0")
+    (tmp_path / "c.py").write_bytes(b"x" * 2048)
+    (tmp_path / "d.py").write_bytes("print('日本語')\n".encode())
+
+    loaded_files = file_loader.load_files([
+        str(tmp_path / name)
+        for name in ["a.py", "b.bin", "c.py", "d.py", "missing.py"]
+    ])
+
+    assert [loaded_file and loaded_file.content
+            for loaded_file in loaded_files] == [
+                "print('a')\n", None, None, "print('日本語')\n", None
+            ]
+
+
+def test_load_files_maps_large_files(tmp_path, mocker):
+    """Test large files are memory-mapped and only their head is decoded."""
+    mocker.patch.dict(config, {
+        "mmap_threshold_bytes": 16,
+        "max_decode_bytes": 32,
+    })
+    (tmp_path / "large.py").write_bytes(("あ" * 32).encode())
+    (tmp_path / "medium.py").write_bytes(b"y" * 24)
+
+    large, medium = file_loader.load_files(
+        [str(tmp_path / "large.py"),
+         str(tmp_path / "medium.py")])
+
+    # 32 bytes hold ten 3-byte characters and a partial one.
+    assert large.content == "あ" * 10
+    assert large.truncated
+    assert large.size == 96
+    assert medium.content == "y" * 24
+    assert not medium.truncated
+
+
+def test_load_files_limits_decode_below_mmap_threshold(tmp_path, mocker):
+    """Test files read without mmap are also cut at max_decode_bytes."""
+    mocker.patch.dict(config, {
+        "mmap_threshold_bytes": 64,
+        "max_decode_bytes": 32,
+    })
+    (tmp_path / "medium.py").write_bytes(b"z" * 48)
+
+    medium, = file_loader.load_files([str(tmp_path / "medium.py")])
+
+    assert medium.content == "z" * 32
+    assert medium.truncated
+    assert medium.size == 48
@@ -0,0 +1,56 @@
+"""Test logic.import_graph module."""
+
+from logic import import_graph
+
+
+def test_parse_imports():
+    """Test parse_imports resolves relative imports to candidates."""
+    source = ("import os\n"
+              "from services import github\n"
+              "from . import logic_utils\n"
+              "from ..utils.path_utils import safe_join\n")
+    assert import_graph.parse_imports("pkg/logic/mod.py", source) == [
+        ["os"],
+        ["services.github", "services"],
+        ["pkg.logic.logic_utils", "pkg.logic"],
+        ["pkg.utils.path_utils.safe_join", "pkg.utils.path_utils"],
+    ]
+
+
+def test_import_graph_neighborhood():
+    """Test neighborhood follows imports in both directions."""
+    graph = import_graph.ImportGraph({
+        "main.py": [["routers"]],
+        "routers/__init__.py": [["logic.code_modification", "logic"]],
+        "logic/__init__.py": [],
+        "logic/code_modification.py": [["utils.path_utils", "utils"]],
+        "src/utils/path_utils.py": [],
+    })
+    assert graph.edges["logic/code_modification.py"] == {
+        "src/utils/path_utils.py"
+    }
+    assert graph.neighborhood(["logic/code_modification.py"], 1) == [
+        "logic/code_modification.py",
+        "routers/__init__.py",
+        "src/utils/path_utils.py",
+    ]
+    assert graph.neighborhood(["logic/code_modification.py"],
+                              2)[-1] == "main.py"
+
+
+def test_expand_file_paths(git_repo):
+    """Test expand_file_paths adds the modules around the seeds."""
+    git_repo({
+        "main.py": "import app\n",
+        "app.py": "from lib import helper\n",
+        "lib/__init__.py": "",
+        "lib/helper.py": "VALUE = 1\n",
+    })
+    assert import_graph.expand_file_paths("test_owner/test_repo", "python",
+                                          ["app.py"]) == [
+                                              "app.py",
+                                              "lib/helper.py",
+                                              "main.py",
+                                          ]
+    assert import_graph.expand_file_paths("test_owner/test_repo", "tex",
+                                          ["app.py"]) == ["app.py"]
@@ -0,0 +1,113 @@
+"""Test logic.index_manifest module."""
+
+import subprocess
+import threading
+import time
+
+from logic import bm25_index, index_manifest
+
+GIT = ["git", "-c", "user.name=test", "-c", "user.email=test@example.com"]
+
+
+def commit_all(repo_path):
+    """Commit every change in the repository."""
+    subprocess.run(["git", "add", "-A"], cwd=repo_path, check=True)
+    subprocess.run([*GIT, "commit", "-q", "-m", "update"],
+                   cwd=repo_path,
+                   check=True)
+
+
+def test_refresh_applies_changes(git_repo, mocker):
+    """Test refresh rebuilds once and then applies only changed files."""
+    repo_path = git_repo({
+        "a.py": "a = 1\n",
+        "b.py": "b = 1\n",
+        "c.py": "c = 1\n",
+        "README.md": "readme\n",
+    })
+    rebuild = mocker.Mock()
+    update = mocker.Mock()
+
+    assert index_manifest.refresh("test_owner/test_repo", "python", "test",
+                                  rebuild, update)
+    assert index_manifest.refresh("test_owner/test_repo", "python", "test",
+                                  rebuild, update)
+    rebuild.assert_called_once()
+    update.assert_not_called()
+
+    (repo_path / "a.py").unlink()
+    (repo_path / "b.py").write_text("b = 2\n")
+    (repo_path / "d.py").write_text("d = 1\n")
+    (repo_path / "README.md").write_text("new readme\n")
+    commit_all(repo_path)
+
+    assert index_manifest.refresh("test_owner/test_repo", "python", "test",
+                                  rebuild, update)
+    rebuild.assert_called_once()
+    update.assert_called_once_with(
+        index_manifest.ChangeSet(added=["d.py"],
+                                 modified=["b.py"],
+                                 deleted=["a.py"]))
+
+
+def test_refresh_without_repository(mocker):
+    """Test refresh returns False when HEAD is not available."""
+    rebuild = mocker.Mock()
+    assert not index_manifest.refresh("test_owner/not_found", "python",
+                                      "test", rebuild, mocker.Mock())
+    rebuild.assert_not_called()
+
+
+def test_bm25_index_incremental_update(git_repo, mocker):
+    """Test the BM25 index is updated from the diff after a pull."""
+    repo_path = git_repo({
+        "clone.py": "def clone_repository():\n    pass\n",
+        "llm.py": "def generate_text():\n    pass\n",
+    })
+    build_index = mocker.spy(bm25_index, "build_index")
+    bm25_index.get_repository_index("test_owner/test_repo", "python")
+
+    (repo_path / "llm.py").unlink()
+    (repo_path / "chat.py").write_text("def generate_text():\n    pass\n")
+    commit_all(repo_path)
+
+    index = bm25_index.get_repository_index("test_owner/test_repo", "python")
+    assert build_index.call_count == 1
+    assert sorted(index.doc_lengths) == ["chat.py", "clone.py"]
+    assert [path for path, _ in index.search("generate_text", 1)] == [
+        "chat.py"
+    ]
+
+
+def test_parallel_refreshes_are_serialized(git_repo, mocker):
+    """Test jobs refreshing the same index do not rebuild it at once."""
+    git_repo({"clone.py": "def clone_repository():\n    pass\n"})
+    active = []
+    overlapped = threading.Event()
+    build_index = bm25_index.build_index
+
+    def slow_build_index(repo, code_lang):
+        active.append(repo)
+        if len(active) > 1:
+            overlapped.set()
+        time.sleep(0.1)
+        try:
+            return build_index(repo, code_lang)
+        finally:
+            active.remove(repo)
+
+    mock_build = mocker.patch("logic.bm25_index.build_index",
+                              side_effect=slow_build_index)
+    threads = [
+        threading.Thread(target=bm25_index.get_repository_index,
+                         args=("test_owner/test_repo", "python"))
+        for _ in range(2)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not overlapped.is_set()
+    # The second job finds the index saved by the first.
+    assert mock_build.call_count == 1
@@ -0,0 +1,69 @@
+"""Test logic.outline module."""
+
+import logic.logic_utils
+from logic import file_cache, outline
+
+SOURCE = '''"""Module docstring."""
+
+import os
+
+DEFAULT_PATH = "downloads"
+
+
+class Client:
+    """A client."""
+
+    timeout: int = 10
+
+    def get(self, path: str) -> str:
+        """Get a path."""
+        return os.path.join(DEFAULT_PATH, path)
+
+
+@staticmethod
+async def fetch(url, *, retry=3):
+    return url
+'''
+
+
+def test_generate_outline():
+    """Test generate_outline keeps signatures and docstrings only."""
+    assert outline.generate_outline(SOURCE) == '''"""Module docstring."""
+DEFAULT_PATH = 'downloads'
+
+class Client:
+    """A client."""
+    timeout: int = 10
+
+    def get(self, path: str) -> str:
+        """Get a path."""
+        ...
+
+@staticmethod
+async def fetch(url, *, retry=3):
+    ...
+'''
+
+
+def test_generate_outline_syntax_error():
+    """Test generate_outline returns None for invalid source."""
+    assert outline.generate_outline("def broken(:\n") is None
+
+
+def test_generate_messages_from_files_outline(git_repo):
+    """Test the outline context mode sends edit targets in full."""
+    git_repo({"a.py": SOURCE, "b.py": "def b():\n    return 1\n"})
+    messages = logic.logic_utils.generate_messages_from_files(
+        "test_owner/test_repo", "python", ["b.py"], "outline")
+
+    assert [message["content"].split("\n")[0] for message in messages] == [
+        "```b.py",
+        "```a.py (outline)",
+    ]
+    assert "return os.path.join" not in messages[1]["content"]
+
+    hits = file_cache.get_file_cache().stats()["hits"]
+    messages = logic.logic_utils.generate_messages_from_files(
+        "test_owner/test_repo", "python", context_mode="outline")
+    assert len(messages) == 2
+    assert file_cache.get_file_cache().stats()["hits"] == hits + 2
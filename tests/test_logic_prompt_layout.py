@@ -0,0 +1,74 @@
+"""Test logic.prompt_layout module."""
+
+from logic import prompt_layout
+from logic.logic_utils import render_file_message
+
+
+def make_file_message(filename: str) -> dict[str, str]:
+    """Make a file message."""
+    return {
+        "role": "user",
+        "content": render_file_message(filename, "print('hello')\n")
+    }
+
+
+def test_layout_prompt_orders_messages():
+    """Test the system instruction, sorted files and variable messages order."""
+    issue_message = {"role": "user", "content": "issue"}
+    note_message = {"role": "user", "content": "note"}
+    messages = prompt_layout.layout_prompt(
+        "instruction",
+        [make_file_message("b.py"), note_message,
+         make_file_message("a.py")],
+        [issue_message],
+    )
+    assert messages == [
+        {
+            "role": "system",
+            "content": "instruction"
+        },
+        make_file_message("a.py"),
+        make_file_message("b.py"),
+        note_message,
+        issue_message,
+    ]
+
+
+def test_layout_prompt_instruction_last():
+    """Test an instruction about the content above it is placed last."""
+    body_message = {"role": "assistant", "content": "body"}
+    messages = prompt_layout.layout_prompt("Summarize the above.", [],
+                                           [body_message],
+                                           instruction_last=True)
+    assert messages == [
+        body_message,
+        {
+            "role": "system",
+            "content": "Summarize the above."
+        },
+    ]
+
+
+def test_prefix_is_shared_between_issues(mocker):
+    """Test calls with other file orders and issues share the prefix."""
+    spy = mocker.patch("logic.prompt_layout.log")
+    prompt_layout.layout_prompt(
+        "instruction",
+        [make_file_message("a.py"),
+         make_file_message("b.py")],
+        [{
+            "role": "user",
+            "content": "issue 1"
+        }],
+    )
+    prompt_layout.layout_prompt(
+        "instruction",
+        [make_file_message("b.py"),
+         make_file_message("a.py")],
+        [{
+            "role": "user",
+            "content": "issue 2"
+        }],
+    )
+    first, second = (call.kwargs["fingerprint"] for call in spy.call_args_list)
+    assert first == second
@@ -0,0 +1,40 @@
+"""Test logic.repo_context module."""
+
+import pytest
+
+import services.github
+from logic import code_modification, logic_utils, repo_context
+
+
+def test_get_file_messages_is_shared_until_commit(git_repo, mocker):
+    """Test file messages are built once per HEAD and are read-only."""
+    repo_path = git_repo({"main.py": "print('hello')\n"})
+    spy = mocker.spy(logic_utils, "generate_messages_from_files")
+    mocker.patch("utils.github_utils.exec_git_command_and_response_bool",
+                 return_value=True)
+
+    first = repo_context.get_file_messages("test_owner/test_repo", "python")
+    second = repo_context.get_file_messages("test_owner/test_repo", "python")
+    assert first is second
+    assert spy.call_count == 1
+    with pytest.raises(TypeError):
+        first[0]["content"] = "changed"
+
+    (repo_path / "main.py").write_text("print('bye')\n")
+    services.github.commit("test_owner/test_repo", "bye")
+    third = repo_context.get_file_messages("test_owner/test_repo", "python")
+    assert spy.call_count == 2
+    assert "bye" in third[0]["content"]
+
+
+def test_apply_modification_invalidates_context(git_repo):
+    """Test applying a modification drops the context of the repository."""
+    git_repo({"main.py": "print('hello')\n"})
+    first = repo_context.get_file_messages("test_owner/test_repo", "python")
+
+    code_modification.apply_modification(
+        "test_owner/test_repo",
+        code_modification.CodeModification("main.py", "hello", "bye"))
+    second = repo_context.get_file_messages("test_owner/test_repo", "python")
+    assert first is not second
+    assert "bye" in second[0]["content"]
@@ -0,0 +1,65 @@
+"""Test module for logic_utils.py."""
+
+from config import config
+from logic import logic_utils
+
+
+def test_enumerate_repo_files_respects_gitignore(git_repo, mocker):
+    """Test enumerate_repo_files lists files from the git index."""
+    repo_path = git_repo({
+        ".gitignore": "venv/\n",
+        "main.py": "",
+        "pkg/mod.py": "",
+        "__pycache__/cached.py": "",
+        "README.md": "",
+    })
+    (repo_path / "venv").mkdir()
+    (repo_path / "venv" / "site.py").write_text("")
+    (repo_path / "untracked.py").write_text("")
+
+    filenames = [
+        filename for filename, _ in logic_utils.enumerate_repo_files(
+            "test_owner/test_repo", "python")
+    ]
+    assert filenames == ["main.py", "pkg/mod.py"]
+
+    mocker.patch.dict(config, {"include_untracked_files": True})
+    filenames = [
+        filename for filename, _ in logic_utils.enumerate_repo_files(
+            "test_owner/test_repo", "python")
+    ]
+    assert filenames == ["main.py", "pkg/mod.py", "untracked.py"]
+
+
+def test_generate_messages_marks_truncated_files(git_repo, mocker):
+    """Test the head of a file over the decode limit ends with a marker."""
+    mocker.patch.dict(config, {
+        "mmap_threshold_bytes": 16,
+        "max_decode_bytes": 32,
+    })
+    git_repo({
+        "large.py": "xy = 1\n" * 16,
+        "small.py": "y = 2\n",
+    })
+
+    large, small = logic_utils.generate_messages_from_files(
+        "test_owner/test_repo", "python")
+
+    assert large["content"] == logic_utils.render_file_message(
+        "large.py", "xy = 1\n" * 4 + "xy =", truncated=True)
+    assert large["content"].endswith("xy =\n" + logic_utils.TRUNCATION_MARKER +
+                                     "```\n")
+    assert small["content"] == "```small.py\ny = 2\n```\n"
+
+
+def test_enumerate_repo_files_without_git(mocker):
+    """Test enumerate_repo_files walks the directory without git."""
+    mocker.patch(
+        "logic.logic_utils.os.walk",
+        return_value=[("downloads/test_owner/test_repo", [], ["main.py"])],
+    )
+    mocker.patch.dict(config, {"repository_path": "downloads"})
+    assert list(logic_utils.enumerate_repo_files(
+        "test_owner/test_repo", "python")) == [
+            ("main.py", "downloads/test_owner/test_repo/main.py")
+        ]
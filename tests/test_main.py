@@ -4,6 +4,7 @@ import pytest
 
 import main
 from main import MissingIssueIDError
+from services.llm import usage_ledger
 
 
 def test_parse_arguments_valid():
@@ -35,6 +36,21 @@ def test_parse_arguments_invalid_repository():
         main.parse_arguments(args)
 
 
+def test_parse_arguments_context_mode():
+    """Test parse_arguments() with context mode"""
+    args = ["add_issue", "--context-mode", "outline"]
+    parsed_args = main.parse_arguments(args)
+    assert parsed_args.context_mode == "outline"
+    assert main.parse_arguments(["add_issue"]).context_mode == "full"
+
+
+def test_parse_arguments_outline_for_tex():
+    """Test parse_arguments() with outline context mode for tex"""
+    args = ["add_issue", "--context-mode", "outline", "--code-lang", "tex"]
+    with pytest.raises(SystemExit):
+        main.parse_arguments(args)
+
+
 def test_main_add_issue(mocker, setup):
     """Test main() with action 'add_issue'"""
     setup(mocker)
@@ -76,3 +92,45 @@ def test_main_unrecognized_argument(mocker):
     """Test main() with unrecognized argument"""
     with pytest.raises(SystemExit):
         main.main(["add_issue", "--invalid-arg"])
+
+
+def test_main_usage_report(capsys):
+    """Test main() with action 'usage_report'"""
+    usage_ledger.record(
+        usage_ledger.UsageRecord("model", 10, 5, 1.5, action="add_issue"))
+    main.main(["usage_report"])
+    assert "add_issue" in capsys.readouterr().out
+
+
+def test_main_generate_code_from_issues_and_reply(mocker):
+    """Test main() with action 'generate_code_from_issues_and_reply'"""
+    action = mocker.MagicMock()
+    mocker.patch.dict(main.action_functions,
+                      {"generate_code_from_issues_and_reply": action})
+    main.main([
+        "generate_code_from_issues_and_reply", "--issue-ids", "1", "2",
+        "--workers", "3"
+    ])
+    action.assert_called_once_with([1, 2],
+                                   "tawada/grass-grower",
+                                   "main",
+                                   "python",
+                                   context_mode="full",
+                                   workers=3)
+
+
+@pytest.mark.parametrize("workers", ["0", "-1", "two"])
+def test_parse_arguments_invalid_workers(workers):
+    """Test parse_arguments() with workers that are not positive"""
+    args = [
+        "generate_code_from_issues_and_reply", "--issue-ids", "1",
+        "--workers", workers
+    ]
+    with pytest.raises(SystemExit):
+        main.parse_arguments(args)
+
+
+def test_parse_arguments_missing_issue_ids():
+    """Test parse_arguments() without issue_ids"""
+    with pytest.raises(MissingIssueIDError):
+        main.parse_arguments(["generate_code_from_issues_and_reply"])
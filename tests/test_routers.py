@@ -1,5 +1,7 @@
 """Test routers.py module."""
 
+import collections
+import random
 from datetime import datetime, timedelta
 
 import pytest
@@ -8,6 +10,8 @@ import logic.logic_exceptions
 import routers
 import routers.code_generator
 import services.github.exceptions
+import services.llm
+from schemas import IssueSummary
 
 
 def test_add_issue(
@@ -27,6 +31,36 @@ def test_add_issue(
     routers.add_issue("test_owner/test_repo", "python")
 
 
+def test_add_issue_summarizes_the_body_above(mocker, setup):
+    """Test the title instruction comes after the issue body it refers to."""
+    setup(mocker)
+    mocker.patch("builtins.open", mocker.mock_open(read_data="test"))
+    generate_text = mocker.patch("services.llm.generate_text",
+                                 side_effect=["issue body", "issue title"])
+    routers.add_issue("test_owner/test_repo", "python")
+
+    messages = generate_text.call_args.args[0]
+    assert [message["role"] for message in messages] == ["assistant", "system"]
+    assert messages[0]["content"] == "issue body"
+    assert "above" in messages[1]["content"]
+    services.github.create_issue.assert_called_once_with(
+        "test_owner/test_repo", "issue title", "issue body")
+
+
+def test_add_issue_does_not_reuse_cached_issue(mocker, setup_github,
+                                               setup_llm_detail):
+    """Test add_issue asks for a new issue when the tree is unchanged."""
+    setup_github(mocker)
+    setup_llm_detail(mocker)
+    mocker.patch("builtins.open", mocker.mock_open(read_data="test"))
+    spy = mocker.spy(services.llm.openai, "create")
+    routers.add_issue("test_owner/test_repo", "python")
+    routers.add_issue("test_owner/test_repo", "python")
+
+    assert spy.call_count == 4
+    assert services.github.create_issue.call_count == 2
+
+
 def test_add_issue_failed(mocker, setup):
     """Test add_issue() function."""
     setup(mocker)
@@ -135,10 +169,30 @@ def test_grow_grass_yesterday(mocker, setup):
             "after_code": "test_after_code",
         },
     )
-    mocker.patch("services.github.list_issue_ids", return_value=[1])
+    mocker.patch("services.github.iter_issues",
+                 return_value=iter([IssueSummary(1, "test", "open")]))
     routers.grow_grass("test_owner/test_repo", "main", "python")
 
 
+def test_choose_random_issue_id(mocker):
+    """Test each issue is chosen with the same probability."""
+    mocker.patch("services.github.iter_issues",
+                 side_effect=lambda repo: (IssueSummary(issue_id, "", "open")
+                                           for issue_id in range(1, 5)))
+    random.seed(0)
+    counts = collections.Counter(
+        routers.choose_random_issue_id("test_owner/test_repo")
+        for _ in range(4000))
+    assert sorted(counts) == [1, 2, 3, 4]
+    assert all(800 < count < 1200 for count in counts.values())
+
+
+def test_choose_random_issue_id_no_issues(mocker):
+    """Test None is returned without issues."""
+    mocker.patch("services.github.iter_issues", return_value=iter([]))
+    assert routers.choose_random_issue_id("test_owner/test_repo") is None
+
+
 def test_generate_code_from_issue_and_reply(mocker, setup):
     """Test generate_code_from_issue_and_reply() function."""
     setup(mocker)
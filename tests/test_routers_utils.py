@@ -15,12 +15,13 @@ def test_send_messages_to_system(mocker):
     result = send_messages_to_system(messages, system_instruction)
 
     expected_messages = [{
-        "role": "user",
-        "content": "テストメッセージ"
-    }, {
         "role": "system",
         "content": "テスト指示"
+    }, {
+        "role": "user",
+        "content": "テストメッセージ"
     }]
 
     mock_generate_text.assert_called_once_with(expected_messages, mock_client)
     assert result == "生成されたテキスト"
+    assert messages == [{"role": "user", "content": "テストメッセージ"}]
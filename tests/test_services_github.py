@@ -1,11 +1,13 @@
 """Test services.github module."""
 
+import json
 import subprocess
 
 import pytest
 
 import services.github
 import services.github.exceptions
+from schemas import Issue, IssueComment, IssueSummary
 
 
 def test_services_github_setup_repository_exist(mocker):
@@ -74,69 +76,126 @@ def test_services_github_create_issue(mocker):
     services.github.create_issue("test/test", "test", "test")
 
 
-def test_services_github_list_issue_ids_exec_command_success(mocker):
-    """Test services.github.list_issue_ids."""
+def mock_popen(mocker, lines: list[bytes], returncode: int = 0,
+               stderr: bytes = b""):
+    """Mock subprocess.Popen to write lines and exit with returncode."""
+    proc = mocker.MagicMock()
+    proc.stdout = iter(lines)
+    proc.stderr.read.return_value = stderr
+    proc.wait.return_value = returncode
+    proc.poll.return_value = returncode
+    popen = mocker.patch("services.github.subprocess.Popen")
+    popen.return_value.__enter__.return_value = proc
+    return popen
 
-    def get_mock_object():
-        """Return mock object."""
-        mock_object = type("MockObject", (object, ), {})
-        setattr(mock_object, "stdout",
-                "101\ttest\n202\ttest\n303\ttest".encode("utf-8"))
-        return mock_object
 
-    mocker.patch(
-        "services.github.subprocess.run",
-        return_value=get_mock_object(),
-    )
+def test_services_github_list_issue_ids_exec_command_success(mocker):
+    """Test services.github.list_issue_ids."""
+    popen = mock_popen(mocker, [
+        json.dumps({
+            "number": number,
+            "title": "test",
+            "state": "open"
+        }).encode("utf-8") + b"\n" for number in (101, 202, 303)
+    ])
     issue_ids = services.github.list_issue_ids("test/test")
     assert issue_ids == [101, 202, 303]
+    command = popen.call_args.args[0]
+    assert command[:6] == [
+        "gh", "api", "--method", "GET", "--paginate", "repos/test/test/issues"
+    ]
+    assert "state=open" in command
 
 
 def test_list_issue_ids_exec_command_failed(mocker):
     """Test services.github.list_issue_ids."""
-    mocker.patch(
-        "services.github.subprocess.run",
-        return_value=None,
-    )
+    mock_popen(mocker, [], returncode=1, stderr=b"HTTP 404: Not Found")
+    with pytest.raises(services.github.exceptions.CommandExecutionException):
+        services.github.list_issue_ids("test/test")
+
+
+def test_list_issue_ids_no_issues(mocker):
+    """Test services.github.list_issue_ids."""
+    mock_popen(mocker, [])
     issue_ids = services.github.list_issue_ids("test/test")
     assert not issue_ids
 
 
+def test_iter_issues_is_lazy(mocker):
+    """Test issues are yielded while gh is writing them."""
+    proc_lines = iter([
+        b'{"number": 1, "title": "one", "state": "open", '
+        b'"labels": [{"name": "bug"}], "updated_at": "2024-01-01T00:00:00Z", '
+        b'"comments": 2}\n',
+        b"not json\n",
+    ])
+    mock_popen(mocker, proc_lines)
+    issues = services.github.iter_issues("test/test", labels=["bug"])
+    assert next(issues) == IssueSummary(id=1,
+                                        title="one",
+                                        state="open",
+                                        labels=["bug"],
+                                        updated_at="2024-01-01T00:00:00Z",
+                                        comments=2)
+    issues.close()
+
+
 def test_get_issue_by_id(mocker):
     """Test services.github.get_issue_by_id."""
+    issue_json = {
+        "number": 101,
+        "title": "test_title",
+        "body": "hogehoge\n--\nfugafuga",
+        "comments": [{
+            "author": {
+                "login": "test"
+            },
+            "authorAssociation": "MEMBER",
+            "body": "test_body\n--\n",
+            "includesCreatedEdit": True,
+            "isMinimized": False,
+        }],
+    }
+    mock_run = mocker.patch(
+        "services.github.subprocess.run",
+        return_value=subprocess.CompletedProcess(
+            args=[],
+            returncode=0,
+            stdout=json.dumps(issue_json).encode("utf-8"),
+        ),
+    )
+    issue = services.github.get_issue_by_id("test/test", 101)
+
+    assert mock_run.call_count == 1
+    assert mock_run.call_args.args[0] == [
+        "gh", "issue", "view", "101", "--json", "number,title,body,comments"
+    ]
+    assert issue == Issue(
+        id=101,
+        title="test_title",
+        body="hogehoge\n--\nfugafuga",
+        comments=[
+            IssueComment(
+                author="test",
+                association="member",
+                edited="true",
+                status="none",
+                body="test_body\n--\n",
+            )
+        ],
+    )
 
-    def get_mock_object():
-        """Return mock object."""
-        mock_object = type("MockObject", (object, ), {})
-        setattr(mock_object, "stdout",
-                "title:\ttest_title\n--\nhogehoge".encode("utf-8"))
-        return mock_object
-
-    def get_mock_object2():
-        """Return mock object."""
-        mock_object = type("MockObject", (object, ), {})
-        setattr(
-            mock_object,
-            "stdout",
-            ("author:\ttest\n"
-             "association:\ttest\n"
-             "edited:\ttest\n"
-             "status:\ttest\n"
-             "--\n"
-             "body:\ttest_body\n"
-             "--").encode("utf-8"),
-        )
-        return mock_object
 
+def test_get_issue_by_id_invalid_json(mocker):
+    """Test services.github.get_issue_by_id with broken output."""
     mocker.patch(
         "services.github.subprocess.run",
-        side_effect=[
-            get_mock_object(),
-            get_mock_object2(),
-        ],
+        return_value=subprocess.CompletedProcess(args=[],
+                                                 returncode=0,
+                                                 stdout=b"title:\ttest"),
     )
-    issue = services.github.get_issue_by_id("test/test", 101)
-    assert issue
+    with pytest.raises(services.github.exceptions.GitHubException):
+        services.github.get_issue_by_id("test/test", 101)
 
 
 def test_setup_repository_exist(mocker):
@@ -0,0 +1,447 @@
+"""Test services.github.backends module."""
+
+import json
+import re
+import subprocess
+import threading
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import services.github
+from benchmarks import issue_fetch
+from config import config
+from schemas import Issue, IssueComment, IssueSummary
+from services.github import backends, exceptions
+
+
+class FakeGitHubHandler(BaseHTTPRequestHandler):
+    """Answer the requests of RestBackend like the GitHub REST API."""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """Answer a GET request."""
+        self.handle_request(None)
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        """Answer a POST request."""
+        length = int(self.headers.get("Content-Length", 0))
+        self.handle_request(json.loads(self.rfile.read(length)))
+
+    def handle_request(self, body):
+        """Record the request and send the routed response."""
+        server = self.server
+        server.requests.append((self.command, self.path, body))
+        server.client_ports.add(self.client_address[1])
+        status, data, headers = server.routes.get(
+            (self.command, self.path), (404, {
+                "message": "Not Found"
+            }, {}))
+        payload = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        """Do not log the requests."""
+
+
+@pytest.fixture()
+def github_server(mocker):
+    """Start a fake GitHub API and select the REST backend for it."""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeGitHubHandler)
+    server.daemon_threads = True
+    server.routes = {}
+    server.requests = []
+    server.client_ports = set()
+    thread = threading.Thread(target=server.serve_forever,
+                              kwargs={"poll_interval": 0.05},
+                              daemon=True)
+    thread.start()
+    host, port = server.server_address[:2]
+    mocker.patch.dict(
+        config, {
+            "github_backend": "rest",
+            "github_api_url": f"http://{host}:{port}",
+            "github_token": "test_token",
+        })
+    yield server
+    backends.reset_backend()
+    server.shutdown()
+    server.server_close()
+
+
+def test_rest_backend_issue_operations(github_server):
+    """Test the issue operations share a kept-alive connection."""
+    base_url = config["github_api_url"]
+    github_server.routes.update({
+        ("GET", "/repos/test/test/issues?per_page=100&state=open"): (200, [{
+            "number": 1,
+            "title": "one",
+            "state": "open",
+        }, {
+            "number": 2,
+            "title": "two",
+            "state": "open",
+            "pull_request": {}
+        }], {
+            "Link":
+            f'<{base_url}/repos/test/test/issues?page=2>; rel="next"'
+        }),
+        ("GET", "/repos/test/test/issues?page=2"): (200, [{
+            "number": 3,
+            "title": "three",
+            "state": "open",
+        }], {}),
+        ("GET", "/repos/test/test/issues/1"): (200, {
+            "number": 1,
+            "title": "test_title",
+            "body": "hogehoge\n--\nfugafuga",
+        }, {}),
+        ("GET", "/repos/test/test/issues/1/comments?per_page=100"): (200, [{
+            "user": {
+                "login": "test"
+            },
+            "author_association": "MEMBER",
+            "created_at": "2024-01-01T00:00:00Z",
+            "updated_at": "2024-01-01T00:00:00Z",
+            "body": "test_body",
+        }], {}),
+        ("POST", "/repos/test/test/issues"): (201, {}, {}),
+        ("POST", "/repos/test/test/issues/1/comments"): (201, {}, {}),
+    })
+
+    assert services.github.list_issue_ids("test/test") == [1, 3]
+    assert services.github.get_issue_by_id("test/test", 1) == Issue(
+        id=1,
+        title="test_title",
+        body="hogehoge\n--\nfugafuga",
+        comments=[
+            IssueComment(author="test",
+                         association="member",
+                         edited="false",
+                         status="none",
+                         body="test_body")
+        ],
+    )
+    assert services.github.create_issue("test/test", "title", "body")
+    assert services.github.reply_issue("test/test", 1, "reply")
+
+    assert github_server.requests[-2:] == [
+        ("POST", "/repos/test/test/issues", {
+            "title": "title",
+            "body": "body"
+        }),
+        ("POST", "/repos/test/test/issues/1/comments", {
+            "body": "reply"
+        }),
+    ]
+    assert len(github_server.client_ports) == 1
+    stats = backends.get_backend().latency_stats()
+    assert stats["list_issue_ids"]["calls"] == 1
+    assert stats["reply_issue"]["mean_seconds"] > 0
+
+
+def test_rest_backend_errors(github_server):
+    """Test 404 and 5xx responses raise the exceptions of the gh backend."""
+    github_server.routes[("GET", "/repos/test/test/issues/2")] = (502, {}, {})
+
+    with pytest.raises(exceptions.GitHubRepoNotFoundException):
+        services.github.get_issue_by_id("test/test", 1)
+    with pytest.raises(exceptions.GitHubConnectionException):
+        services.github.get_issue_by_id("test/test", 2)
+    assert len(github_server.requests) == 1 + config.get("retry_tries", 4)
+
+
+def test_rest_backend_does_not_repeat_posts(github_server):
+    """Test a POST that may have been performed is not sent again."""
+    github_server.routes[("POST", "/repos/test/test/issues/1/comments")] = (
+        502, {}, {})
+
+    with pytest.raises(exceptions.GitHubUnconfirmedException):
+        services.github.reply_issue("test/test", 1, "reply")
+    assert len(github_server.requests) == 1
+
+
+def test_rest_backend_retries_posts_not_sent(mocker, github_server):
+    """Test a POST is retried when it could not connect."""
+    # Nothing listens on the port of a closed server.
+    closed = ThreadingHTTPServer(("127.0.0.1", 0), FakeGitHubHandler)
+    host, port = closed.server_address[:2]
+    closed.server_close()
+    mocker.patch.dict(config, {"github_api_url": f"http://{host}:{port}"})
+    send = mocker.spy(backends.RestBackend, "send")
+
+    with pytest.raises(exceptions.GitHubConnectionException):
+        services.github.create_issue("test/test", "title", "body")
+    assert send.call_count == config.get("retry_tries", 4)
+
+
+def test_gh_backend_does_not_repeat_failed_comment(mocker):
+    """Test a gh command that fails after reaching GitHub runs once."""
+    mock_run = mocker.patch("services.github.subprocess.run",
+                            side_effect=subprocess.CalledProcessError(
+                                1, [], stderr=b"HTTP 502: Bad Gateway"))
+
+    with pytest.raises(exceptions.CommandExecutionException):
+        services.github.reply_issue("test/test", 1, "reply")
+    assert mock_run.call_count == 1
+
+
+def test_rest_backend_pull_request(mocker, github_server):
+    """Test a pull request is created from the current branch."""
+    mocker.patch("services.github.get_branch", return_value="feature")
+    github_server.routes[("POST", "/repos/test/test/pulls")] = (201, {}, {})
+
+    assert services.github.pull_request("test/test", "main", "title", "body")
+    assert github_server.requests[-1][2] == {
+        "base": "main",
+        "head": "feature",
+        "title": "title",
+        "body": "body",
+    }
+
+
+def test_rest_backend_iter_issues_filters(github_server):
+    """Test the filters are sent as query parameters."""
+    github_server.routes[(
+        "GET", "/repos/test/test/issues?per_page=100&state=all"
+        "&labels=bug%2Chelp&since=2024-01-01T00%3A00%3A00")] = (200, [{
+            "number": 1,
+            "title": "one",
+            "state": "closed",
+            "labels": [{
+                "name": "bug"
+            }, {
+                "name": "help"
+            }],
+            "updated_at": "2024-01-02T00:00:00Z",
+            "comments": 3,
+        }], {})
+
+    issues = services.github.iter_issues("test/test",
+                                         state="all",
+                                         labels=["bug", "help"],
+                                         since=datetime(2024, 1, 1))
+    assert list(issues) == [
+        IssueSummary(id=1,
+                     title="one",
+                     state="closed",
+                     labels=["bug", "help"],
+                     updated_at="2024-01-02T00:00:00Z",
+                     comments=3)
+    ]
+
+
+def test_incomplete_backend_cannot_be_created():
+    """Test a backend missing an operation fails when it is created."""
+
+    class IncompleteBackend(backends.GitHubBackend):
+        """A backend that cannot create issues."""
+
+        def iter_issues(self, repo, state="open", labels=None, since=None):
+            return iter([])
+
+    with pytest.raises(TypeError):
+        IncompleteBackend()
+
+
+def test_get_backend_falls_back_to_gh(mocker):
+    """Test the GitHub CLI is used without a token."""
+    mocker.patch.dict(config, {"github_backend": "rest", "github_token": None})
+    mocker.patch.dict("os.environ", clear=True)
+    assert isinstance(backends.get_backend(), backends.GhBackend)
+
+
+def test_gh_backend_pull_request(mocker):
+    """Test gh pr create is run from the current branch."""
+    mock_run = mocker.patch(
+        "services.github.subprocess.run",
+        return_value=subprocess.CompletedProcess(args=[],
+                                                 returncode=0,
+                                                 stdout=b"feature\n"),
+    )
+    assert services.github.pull_request("test/test", "main", "title", "body")
+    assert mock_run.call_args.args[0] == [
+        "gh", "pr", "create", "-B", "main", "-H", "feature", "-b", "body",
+        "-t", "title"
+    ]
+
+
+def test_gh_backend_get_issues_bulk(mocker):
+    """Test issues are fetched together, with their next comment pages."""
+
+    def comment(body):
+        """Return a comment in the GraphQL format."""
+        return {
+            "author": {
+                "login": "test"
+            },
+            "authorAssociation": "OWNER",
+            "body": body,
+            "includesCreatedEdit": False,
+            "isMinimized": True,
+        }
+
+    def graphql_output(repository):
+        """Return the output of gh api graphql."""
+        return subprocess.CompletedProcess(
+            args=[],
+            returncode=0,
+            stdout=json.dumps({
+                "data": {
+                    "repository": repository
+                }
+            }).encode("utf-8"))
+
+    mock_run = mocker.patch(
+        "services.github.subprocess.run",
+        side_effect=[
+            graphql_output({
+                "issue2": {
+                    "number": 2,
+                    "title": "title2",
+                    "body": "body2",
+                    "comments": {
+                        "pageInfo": {
+                            "hasNextPage": True,
+                            "endCursor": "cursor"
+                        },
+                        "nodes": [comment("first")],
+                    },
+                },
+                "issue1": {
+                    "number": 1,
+                    "title": "title1",
+                    "body": None,
+                    "comments": {
+                        "pageInfo": {
+                            "hasNextPage": False,
+                            "endCursor": None
+                        },
+                        "nodes": [],
+                    },
+                },
+            }),
+            graphql_output({
+                "issue2": {
+                    "comments": {
+                        "pageInfo": {
+                            "hasNextPage": False,
+                            "endCursor": "cursor2"
+                        },
+                        "nodes": [comment("second")],
+                    },
+                },
+            }),
+        ],
+    )
+    issues = services.github.get_issues_bulk("test/test", [2, 1, 2])
+
+    assert [issue.id for issue in issues] == [2, 1]
+    assert [comment.body for comment in issues[0].comments
+            ] == ["first", "second"]
+    assert issues[0].comments[0].status == "hidden"
+    assert issues[1].body == ""
+    assert mock_run.call_count == 2
+    command = mock_run.call_args.args[0]
+    assert command[:3] == ["gh", "api", "graphql"]
+    assert 'issue2: issue(number: 2) { comments(first: 100, after: "cursor")' \
+        in command[4]
+    assert command[5:] == ["-f", "owner=test", "-f", "name=test"]
+
+
+def test_get_issues_bulk_skips_missing_issue(mocker):
+    """Test an issue that is not found is left out of the batch."""
+    response = {
+        "data": {
+            "repository": {
+                "issue1": {
+                    "number": 1,
+                    "title": "title1",
+                    "body": "body1",
+                    "comments": {
+                        "pageInfo": {
+                            "hasNextPage": False
+                        },
+                        "nodes": []
+                    },
+                },
+                "issue2": None,
+            }
+        },
+        "errors": [{
+            "type": "NOT_FOUND",
+            "path": ["repository", "issue2"],
+            "message": "Could not resolve to an Issue with the number of 2.",
+        }],
+    }
+    # gh api exits with an error, writing the response out.
+    mocker.patch("services.github.subprocess.run",
+                 side_effect=subprocess.CalledProcessError(
+                     1, [],
+                     output=json.dumps(response).encode("utf-8"),
+                     stderr=b"gh: Could not resolve to an Issue"))
+    issues = services.github.get_issues_bulk("test/test", [2, 1])
+
+    assert [issue.id for issue in issues] == [1]
+
+
+def test_get_issues_bulk_raises_repository_error(github_server):
+    """Test an error of the repository itself still fails the fetch."""
+    github_server.routes[("POST", "/graphql")] = (200, {
+        "data": {
+            "repository": None
+        },
+        "errors": [{
+            "type": "NOT_FOUND",
+            "path": ["repository"],
+            "message": "Could not resolve to a Repository.",
+        }],
+    }, {})
+
+    with pytest.raises(exceptions.GitHubRepoNotFoundException):
+        services.github.get_issues_bulk("test/test", [1])
+
+
+def test_get_issues_bulk_chunks_by_cost(mocker):
+    """Test a query holds only the issues that fit in the node budget."""
+    mocker.patch.dict(config, {"github_graphql_max_nodes": 250})
+    graphql = mocker.patch.object(
+        backends.GhBackend,
+        "graphql",
+        side_effect=lambda repo, query, variables: {
+            "repository": {
+                alias: {
+                    "number": int(alias[5:]),
+                    "title": "",
+                    "body": "",
+                    "comments": {
+                        "pageInfo": {
+                            "hasNextPage": False
+                        },
+                        "nodes": []
+                    },
+                }
+                for alias in re.findall(r"(issue\d+):", query)
+            }
+        })
+    issues = services.github.get_issues_bulk("test/test", [1, 2, 3, 4, 5])
+
+    assert [issue.id for issue in issues] == [1, 2, 3, 4, 5]
+    assert graphql.call_count == 3
+
+
+def test_benchmark_issue_fetch():
+    """Test the benchmark fetches the same issues with fewer requests."""
+    results = issue_fetch.run(issues=5, comments=120, latency=0)
+
+    assert results["same_issues"]
+    assert results["get_issue_by_id"]["requests"] == 15
+    assert results["get_issues_bulk"]["requests"] == 2
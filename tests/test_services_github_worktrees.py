@@ -0,0 +1,141 @@
+"""Test services.github.worktrees module."""
+
+import os
+import subprocess
+import threading
+
+import pytest
+
+import routers
+import services.github
+from config import config
+from logic import logic_utils
+from services.github import worktrees
+from utils.lock_utils import FileLock
+
+REPO = "test_owner/test_repo"
+
+
+@pytest.fixture()
+def clone(mocker, tmp_path, git_repo):
+    """Create a clone with a worktree pool of two under tmp_path."""
+    mocker.patch.dict(config, {
+        "worktree_path": str(tmp_path / "worktrees"),
+        "worktree_pool_size": 2
+    })
+    return git_repo({"main.py": "print('main')\n"}, REPO)
+
+
+def git_output(path, *args: str) -> str:
+    """Return the output of a git command."""
+    return subprocess.run(["git", *args],
+                          cwd=path,
+                          check=True,
+                          capture_output=True).stdout.decode().strip()
+
+
+def test_worktrees_isolate_parallel_jobs(clone):
+    """Test jobs on the same repository commit in separate worktrees."""
+    barrier = threading.Barrier(2, timeout=10)
+    paths = {}
+    errors = []
+
+    def job(name: str):
+        try:
+            with services.github.worktree(REPO, "main") as path:
+                paths[name] = path
+                assert logic_utils.get_repo_path(REPO) == path
+                services.github.checkout_new_branch(REPO, name)
+                with open(os.path.join(path, "main.py"), "w") as file_object:
+                    file_object.write(f"print('{name}')\n")
+                barrier.wait()
+                git_output(path, "-c", "user.name=test", "-c",
+                           "user.email=test@example.com", "commit", "-q", "-a",
+                           "-m", name)
+                services.github.checkout_detached(REPO, "main")
+        except Exception as err:  # pylint: disable=broad-except
+            errors.append(err)
+
+    threads = [threading.Thread(target=job, args=(name, )) for name in "ab"]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not errors
+    assert paths["a"] != paths["b"]
+    assert git_output(clone, "branch", "--show-current") == "main"
+    assert git_output(clone, "status", "--porcelain") == ""
+    assert git_output(clone, "show", "a:main.py") == "print('a')"
+    assert git_output(clone, "show", "b:main.py") == "print('b')"
+    assert logic_utils.get_repo_path(REPO) == str(clone)
+
+
+def test_worktree_is_reused_clean(clone):
+    """Test a worktree is handed out again without the changes of a job."""
+    with services.github.worktree(REPO, "main") as path:
+        with open(os.path.join(path, "main.py"), "w") as file_object:
+            file_object.write("changed\n")
+        with open(os.path.join(path, "untracked.py"), "w") as file_object:
+            file_object.write("untracked\n")
+
+    with services.github.worktree(REPO, "main") as reused_path:
+        assert reused_path == path
+        assert git_output(path, "status", "--porcelain") == ""
+    assert worktrees.get_worktree_pool(REPO).created == 1
+
+    # A new pool, as in a later run, finds the worktree on disk.
+    worktrees.reset_worktree_pools()
+    with services.github.worktree(REPO, "main") as reused_path:
+        assert reused_path == path
+
+    worktrees.close_worktree_pools()
+    assert not os.path.exists(path)
+    assert git_output(clone, "worktree", "list").count("\n") == 0
+
+
+def test_worktree_locked_elsewhere_is_skipped(clone):
+    """Test a worktree locked by another process is not handed out."""
+    pool = worktrees.get_worktree_pool(REPO)
+    # flock also excludes another lock of the same process.
+    with FileLock(f"{pool.get_path(0)}.lock"):
+        with services.github.worktree(REPO, "main") as path:
+            assert path == pool.get_path(1)
+
+
+def test_stale_worktree_is_replaced(clone):
+    """Test a directory the clone no longer knows as a worktree is replaced."""
+    path = worktrees.get_worktree_pool(REPO).get_path(0)
+    os.makedirs(path)
+    with open(os.path.join(path, ".git"), "w") as file_object:
+        file_object.write("gitdir: /nonexistent/.git/worktrees/0\n")
+
+    with services.github.worktree(REPO, "main") as reused_path:
+        assert reused_path == path
+        assert git_output(path, "rev-parse", "--abbrev-ref",
+                          "HEAD") == "HEAD"
+    assert str(path) in git_output(clone, "worktree", "list")
+
+
+def test_generate_code_from_issues_and_reply(mocker, clone):
+    """Test issues are handled in parallel, each in its own worktree."""
+    mocker.patch("services.github.setup_repository")
+    barrier = threading.Barrier(2, timeout=10)
+    repo_paths = {}
+
+    def reply_issue_with_code(issue_id, repo, *args):
+        """Record the working tree of the job."""
+        repo_paths[issue_id] = logic_utils.get_repo_path(repo)
+        barrier.wait()
+        if issue_id == 3:
+            raise ValueError("failed")
+
+    mocker.patch("routers.code_generator.reply_issue_with_code",
+                 side_effect=reply_issue_with_code)
+    results = routers.generate_code_from_issues_and_reply([1, 2, 3, 4],
+                                                          REPO,
+                                                          workers=2)
+
+    assert results == {1: True, 2: True, 3: False, 4: True}
+    assert len(set(repo_paths.values())) == 2
+    assert str(clone) not in repo_paths.values()
@@ -55,11 +55,16 @@ def test_services_llm_generate_json_fail_invalid_response(
             self.model = None
             self.messages = None
 
+        def OpenAI(self, **kwargs):  # pylint: disable=invalid-name
+            """Mock OpenAI client constructor."""
+            return self
+
         def create(
             self,
             model,
             messages,
             response_format={"type": "text"},
+            timeout=None,
         ):
             """Mock create function."""
             self.model = model
@@ -0,0 +1,119 @@
+"""Test the async API of services.llm module."""
+
+import asyncio
+import threading
+import time
+
+import httpx
+import openai
+import pytest
+
+import services.llm
+from config import config
+from services.llm import llm_exceptions
+
+
+class SlowOpenAIObject:
+    """Mock OpenAI client that blocks and records concurrent calls."""
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.chat = self
+        self.completions = self
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+
+    def create(self, model, messages, response_format, timeout=None):
+        """Mock create function, timing out like the HTTP client."""
+        with self._lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            if timeout is not None and timeout < self.seconds:
+                time.sleep(timeout)
+                raise openai.APITimeoutError(
+                    request=httpx.Request("POST", "http://test"))
+            time.sleep(self.seconds)
+        finally:
+            with self._lock:
+                self.active -= 1
+        message = type("Message", (), {"content": messages[-1]["content"]})
+        choice = type("Choice", (), {"message": message})
+        return type("Response", (), {"choices": [choice]})
+
+
+def test_agenerate_text_bounds_concurrency(mocker):
+    """Test concurrent calls are bounded by llm_max_concurrency."""
+    mocker.patch.dict(config, {"llm_max_concurrency": 2})
+    client = SlowOpenAIObject(0.05)
+
+    async def generate_all():
+        return await asyncio.gather(*(services.llm.agenerate_text(
+            [{
+                "role": "user",
+                "content": f"message {idx}"
+            }], client) for idx in range(6)))
+
+    assert asyncio.run(generate_all()) == [
+        f"message {idx}" for idx in range(6)
+    ]
+    assert client.max_active == 2
+
+
+def test_generate_response_bounds_threads(mocker):
+    """Test sync calls from many threads share llm_max_concurrency."""
+    mocker.patch.dict(config, {"llm_max_concurrency": 2})
+    client = SlowOpenAIObject(0.05)
+    threads = [
+        threading.Thread(target=services.llm.generate_response,
+                         args=([{
+                             "role": "user",
+                             "content": f"message {idx}"
+                         }], client)) for idx in range(6)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert client.max_active == 2
+
+
+def test_agenerate_response_timeout():
+    """Test a call that takes too long raises LLMTimeoutException."""
+    client = SlowOpenAIObject(0.2)
+    with pytest.raises(llm_exceptions.LLMTimeoutException):
+        asyncio.run(
+            services.llm.agenerate_response(
+                [{
+                    "role": "user",
+                    "content": "hello"
+                }], client, timeout=0.01))
+    assert client.active == 0
+
+
+def test_generate_response_timeout_is_passed_to_client(mocker):
+    """Test the sync API times out when the client does, not at the end."""
+    mocker.patch.dict(config, {"llm_timeout_seconds": 0.2})
+    client = SlowOpenAIObject(2)
+    start = time.perf_counter()
+    with pytest.raises(llm_exceptions.LLMTimeoutException):
+        services.llm.generate_response([{
+            "role": "user",
+            "content": "hello"
+        }], client)
+    assert time.perf_counter() - start < 1.5
+
+
+def test_generate_response_inside_event_loop():
+    """Test the sync API also works while an event loop is running."""
+    client = SlowOpenAIObject(0)
+
+    async def call_sync():
+        return services.llm.generate_response(
+            [{
+                "role": "user",
+                "content": "hello"
+            }], client)
+
+    assert asyncio.run(call_sync()) == "hello"
@@ -0,0 +1,63 @@
+"""Test services.llm.client_pool module."""
+
+import http.server
+import threading
+
+import pytest
+
+import services.llm
+from services.llm import client_pool
+
+
+class KeepAliveHandler(http.server.BaseHTTPRequestHandler):
+    """Handler that keeps connections alive."""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """Respond with an empty JSON object."""
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"{}")
+
+    def log_message(self, *args):
+        """Suppress request logs."""
+
+
+@pytest.fixture()
+def http_server():
+    """Run a local HTTP server."""
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0),
+                                             KeepAliveHandler)
+    thread = threading.Thread(target=server.serve_forever,
+                              kwargs={"poll_interval": 0.05},
+                              daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_create_http_client_reuses_connections(http_server):
+    """Test requests reuse a kept-alive connection and are counted."""
+    stats = client_pool.ConnectionStats()
+    with client_pool.create_http_client(stats) as client:
+        for _ in range(3):
+            assert client.get(http_server).json() == {}
+
+    assert stats.as_dict() == {
+        "requests": 3,
+        "new_connections": 1,
+        "reused_connections": 2,
+        "tls_handshakes": 0,
+    }
+
+
+def test_get_openai_client_is_shared(mocker):
+    """Test the OpenAI client is created once per API key."""
+    mocker.patch.dict("os.environ", {"OPENAI_API_KEY": "test"})
+    client = services.llm.get_openai_client()
+    assert services.llm.get_openai_client() is client
+    assert services.llm.get_openai_client("other") is not client
@@ -0,0 +1,113 @@
+"""Test services.llm.json_stream module."""
+
+import json
+from types import SimpleNamespace
+
+import httpx
+import pytest
+
+import services.llm
+from services.llm import json_stream, llm_exceptions
+
+GENERATED_JSON = json.dumps({
+    "file_path": "main.py",
+    "before_code": "print(\"hello\")\n",
+    "after_code": "print('bye')\n",
+    "chunk_id": None,
+    "lines": [1, {"end": 2}],
+})
+
+
+def test_parser_matches_json_loads():
+    """Test parsing character by character gives the same object."""
+    fields = []
+    parser = json_stream.IncrementalJSONParser(
+        lambda key, value: fields.append(key))
+    for char in GENERATED_JSON:
+        parser.feed(char)
+    assert parser.close() == json.loads(GENERATED_JSON)
+    assert fields == [
+        "file_path", "before_code", "after_code", "chunk_id", "lines"
+    ]
+
+
+def test_parser_passes_fields_early():
+    """Test a string field is passed as soon as it is closed."""
+    fields = {}
+    parser = json_stream.IncrementalJSONParser(fields.__setitem__)
+    parser.feed('{"file_path": "main.py"')
+    assert fields == {"file_path": "main.py"}
+
+
+@pytest.mark.parametrize("text", [
+    'Sure! {"file_path": "main.py"}',
+    '{"file_path" "main.py"}',
+    '{"file_path": main.py}',
+    '{"file_path": "main.py"] ',
+    '{"file_path": "main.py"} trailing',
+])
+def test_parser_rejects_malformed_json(text):
+    """Test malformed text raises LLMJSONParseException."""
+    parser = json_stream.IncrementalJSONParser()
+    with pytest.raises(llm_exceptions.LLMJSONParseException):
+        parser.feed(text)
+        parser.close()
+
+
+def test_generate_json_aborts_invalid_stream(mocker, setup_llm_detail):
+    """Test an invalid field aborts the stream and the request is retried."""
+    setup_llm_detail(mocker)
+    openai_client = services.llm.get_openai_client()
+
+    def validate_field(key, value):
+        raise llm_exceptions.LLMJSONValidationException(f"{key}: {value}")
+
+    with pytest.raises(llm_exceptions.LLMJSONValidationException):
+        services.llm.generate_json([{
+            "role": "user",
+            "content": "Hello"
+        }], openai_client, validate_field)
+    assert len(openai_client.streams) == 4
+    assert all(stream.closed for stream in openai_client.streams)
+
+
+class BrokenOnceClient:
+    """Mock OpenAI client whose first stream drops the connection."""
+
+    def __init__(self, content: str):
+        self.chat = self
+        self.completions = self
+        self.content = content
+        self.streams = []
+
+    def create(self, stream=False, **kwargs):
+        """Mock create function."""
+        assert stream
+        self.streams.append(self.stream(broken=not self.streams))
+        return self.streams[-1]
+
+    def stream(self, broken: bool):
+        """Yield the content in two chunks, failing after the first."""
+        for index, content in enumerate(
+                (self.content[:20], self.content[20:])):
+            if broken and index == 1:
+                raise httpx.RemoteProtocolError("peer closed connection")
+            delta = SimpleNamespace(content=content)
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=delta)])
+
+
+def test_generate_json_restarts_broken_stream(mocker):
+    """Test a stream dropped after its first tokens is requested again."""
+    mocker.patch.dict("os.environ", {"OPENAI_API_KEY": "test"})
+    client = BrokenOnceClient(GENERATED_JSON)
+    fields = []
+
+    generated_json = services.llm.generate_json([{
+        "role": "user",
+        "content": "Hello"
+    }], client, lambda key, value: fields.append(key))
+
+    assert generated_json == json.loads(GENERATED_JSON)
+    assert len(client.streams) == 2
+    assert fields[0] == "file_path"
+    assert fields.count("after_code") == 1
@@ -0,0 +1,112 @@
+"""Test services.llm.rate_limiter module."""
+
+import asyncio
+import sqlite3
+
+import services.llm
+from services.llm import rate_limiter
+
+
+class FakeClock:
+    """A clock advanced only by the test."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        """Advance the clock instead of sleeping."""
+        self.now += seconds
+
+
+def test_rate_limiter_is_shared_by_processes(tmp_path):
+    """Test limiters on the same database draw from the same buckets."""
+    clock = FakeClock()
+    db_path = str(tmp_path / "rate_limit.sqlite3")
+    first = rate_limiter.RateLimiter(db_path, 2, 6000, clock=clock)
+    second = rate_limiter.RateLimiter(db_path, 2, 6000, clock=clock)
+
+    assert first.try_acquire(10) == 0
+    assert second.try_acquire(10) == 0
+    # The request bucket refills one request every 30 seconds.
+    assert first.try_acquire(10, "waiter") == 30
+    assert second.queue_depth() == 1
+
+    clock.sleep(30)
+    assert first.try_acquire(10, "waiter") == 0
+    first.remove_waiter("waiter")
+    assert second.queue_depth() == 0
+
+
+def test_aacquire_does_not_block_event_loop(tmp_path):
+    """Test the event loop runs while another process locks the database."""
+    db_path = str(tmp_path / "rate_limit.sqlite3")
+    limiter = rate_limiter.RateLimiter(db_path, 60, 6000)
+    limiter.queue_depth()
+    other = sqlite3.connect(db_path, isolation_level=None)
+    other.execute("BEGIN IMMEDIATE")
+
+    async def acquire_while_locked():
+        task = asyncio.create_task(limiter.aacquire(10))
+        # Not resumed before aacquire returns if it blocks the loop.
+        await asyncio.sleep(0.1)
+        resumed_while_waiting = not task.done()
+        other.execute("COMMIT")
+        await task
+        return resumed_while_waiting
+
+    try:
+        assert asyncio.run(acquire_while_locked())
+    finally:
+        other.close()
+    assert limiter.acquired == 1
+
+
+def test_rate_limiter_limits_tokens(tmp_path):
+    """Test large requests wait for tokens and output is accounted."""
+    clock = FakeClock()
+    limiter = rate_limiter.RateLimiter(str(tmp_path / "rate_limit.sqlite3"),
+                                       100,
+                                       600,
+                                       clock=clock)
+
+    # Requests larger than the bucket are clamped instead of waiting forever.
+    assert limiter.try_acquire(1000) == 0
+    assert limiter.try_acquire(100) == 10
+    clock.sleep(10)
+    limiter.consume(100)
+    assert limiter.try_acquire(100) == 10
+
+
+def test_acquire_waits_for_the_bucket(tmp_path, mocker):
+    """Test acquire blocks until the request fits and records the wait."""
+    clock = FakeClock()
+    mocker.patch("time.sleep", side_effect=clock.sleep)
+    limiter = rate_limiter.RateLimiter(str(tmp_path / "rate_limit.sqlite3"),
+                                       1,
+                                       6000,
+                                       clock=clock)
+
+    assert limiter.acquire(10) == 0
+    assert limiter.acquire(10) == 60
+    assert limiter.stats() == {
+        "queue_depth": 0,
+        "acquired": 2,
+        "last_wait_seconds": 60,
+        "total_wait_seconds": 60,
+    }
+
+
+def test_generate_text_acquires_rate_limit(mocker, setup_llm_detail):
+    """Test generate_text takes a request and its tokens from the limiter."""
+    setup_llm_detail(mocker)
+    openai_client = services.llm.get_openai_client()
+    services.llm.generate_text([{
+        "role": "user",
+        "content": "Hello"
+    }], openai_client)
+
+    limiter = rate_limiter.get_rate_limiter()
+    assert limiter.acquired == 1
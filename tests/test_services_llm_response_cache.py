@@ -0,0 +1,117 @@
+"""Test services.llm.response_cache module."""
+
+import asyncio
+import itertools
+import sqlite3
+
+import services.llm
+from config import config
+from services.llm import response_cache
+
+
+def test_make_key_is_canonical():
+    """Test equal requests share a key regardless of dict order."""
+    key = response_cache.make_key("model", [{
+        "role": "user",
+        "content": "hello"
+    }], {"type": "text"})
+    assert key == response_cache.make_key("model", [{
+        "content": "hello",
+        "role": "user"
+    }], {"type": "text"})
+    assert key != response_cache.make_key("model", [{
+        "role": "user",
+        "content": "hello"
+    }], {"type": "json_object"})
+
+
+def test_response_cache_expires(tmp_path, mocker):
+    """Test entries expire after the TTL."""
+    mocker.patch("services.llm.response_cache.time.time",
+                 side_effect=itertools.count(step=10))
+    cache = response_cache.ResponseCache(str(tmp_path / "cache.sqlite3"),
+                                         ttl_seconds=25)
+    cache.put("key1", "aaaa", request_size=100)
+    assert cache.get("key1") == "aaaa"
+    assert cache.get("key1") is None
+    assert cache.stats() == {
+        "hits": 1,
+        "misses": 1,
+        "bytes_saved": 104,
+        "entries": 0,
+        "bytes": 0,
+    }
+
+
+def test_response_cache_evicts_least_recently_used(tmp_path, mocker):
+    """Test entries over the size bound are evicted in LRU order."""
+    mocker.patch("services.llm.response_cache.time.time",
+                 side_effect=itertools.count())
+    cache = response_cache.ResponseCache(str(tmp_path / "cache.sqlite3"),
+                                         max_bytes=8)
+    cache.put("key1", "aaaa")
+    cache.put("key2", "bbbb")
+    cache.get("key1")
+    cache.put("key3", "cccc")
+    assert cache.get("key1") == "aaaa"
+    assert cache.get("key2") is None
+    assert cache.get("key3") == "cccc"
+
+
+def test_generate_text_uses_cache(mocker, setup_llm_detail):
+    """Test generate_text calls the API once for the same request."""
+    setup_llm_detail(mocker)
+    spy = mocker.spy(services.llm.openai, "create")
+    openai_client = services.llm.get_openai_client()
+    messages = [{"role": "user", "content": "Hello, world!"}]
+
+    assert services.llm.generate_text(messages, openai_client) == "Hello, world!"
+    assert services.llm.generate_text(messages, openai_client) == "Hello, world!"
+    assert spy.call_count == 1
+
+    mocker.patch.dict(config, {"llm_cache_bypass": True})
+    services.llm.generate_text(messages, openai_client)
+    assert spy.call_count == 2
+
+
+def test_generate_text_bypassed_block(mocker, setup_llm_detail):
+    """Test calls inside bypassed() neither read nor fill the cache."""
+    setup_llm_detail(mocker)
+    spy = mocker.spy(services.llm.openai, "create")
+    openai_client = services.llm.get_openai_client()
+    messages = [{"role": "user", "content": "Hello, world!"}]
+
+    with response_cache.bypassed():
+        services.llm.generate_text(messages, openai_client)
+        services.llm.generate_text(messages, openai_client)
+    assert spy.call_count == 2
+    assert not response_cache.is_bypassed()
+
+    services.llm.generate_text(messages, openai_client)
+    assert spy.call_count == 3
+
+
+def test_agenerate_response_does_not_block_event_loop(mocker,
+                                                      setup_llm_detail):
+    """Test the event loop runs while another process locks the cache."""
+    setup_llm_detail(mocker)
+    openai_client = services.llm.get_openai_client()
+    messages = [{"role": "user", "content": "Hello, world!"}]
+    services.llm.generate_text(messages, openai_client)
+    other = sqlite3.connect(response_cache.get_response_cache().db_path,
+                            isolation_level=None)
+    other.execute("BEGIN EXCLUSIVE")
+
+    async def generate_while_locked():
+        task = asyncio.create_task(
+            services.llm.agenerate_response(messages, openai_client))
+        # Not resumed before the task returns if it blocks the loop.
+        await asyncio.sleep(0.1)
+        resumed_while_waiting = not task.done()
+        other.execute("COMMIT")
+        return resumed_while_waiting, await task
+
+    try:
+        assert asyncio.run(generate_while_locked()) == (True, "Hello, world!")
+    finally:
+        other.close()
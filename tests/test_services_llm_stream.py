@@ -0,0 +1,65 @@
+"""Test streaming responses of services.llm module."""
+
+import pytest
+
+import services.llm
+from config import config
+from services.llm import llm_exceptions
+
+
+def test_generate_text_streams_tokens(mocker, setup_llm_detail):
+    """Test tokens are passed to on_token as they arrive, and cached."""
+    setup_llm_detail(mocker)
+    openai_client = services.llm.get_openai_client()
+    messages = [{"role": "user", "content": "Hello"}]
+
+    tokens = []
+    text = services.llm.generate_text(messages,
+                                      openai_client,
+                                      on_token=tokens.append)
+    assert tokens == ["Hello, ", "world!"]
+    assert text == "Hello, world!"
+    assert openai_client.streams[-1].closed
+
+    # A cached response is passed to on_token at once.
+    tokens = []
+    services.llm.generate_text(messages, openai_client, on_token=tokens.append)
+    assert tokens == ["Hello, world!"]
+    assert len(openai_client.streams) == 1
+
+
+def test_generate_text_aborts_stream(mocker, setup_llm_detail):
+    """Test on_token returning False closes the stream without caching."""
+    setup_llm_detail(mocker)
+    openai_client = services.llm.get_openai_client()
+    messages = [{"role": "user", "content": "Hello"}]
+
+    tokens = []
+
+    def on_token(token):
+        tokens.append(token)
+        return False
+
+    with pytest.raises(llm_exceptions.LLMStreamAbortedException):
+        services.llm.generate_text(messages, openai_client, on_token=on_token)
+    assert tokens == ["Hello, "]
+    assert openai_client.streams[-1].closed
+
+    services.llm.generate_text(messages, openai_client, on_token=tokens.append)
+    assert len(openai_client.streams) == 2
+
+
+def test_generate_text_aborts_runaway_stream(mocker, setup_llm_detail):
+    """Test a stream longer than llm_max_output_tokens is aborted."""
+    setup_llm_detail(mocker)
+    mocker.patch.dict(config, {"llm_max_output_tokens": 1})
+    openai_client = services.llm.get_openai_client()
+
+    with pytest.raises(llm_exceptions.LLMStreamAbortedException):
+        services.llm.generate_text([{
+            "role": "user",
+            "content": "Hello"
+        }],
+                                   openai_client,
+                                   on_token=lambda token: None)
+    assert openai_client.streams[-1].closed
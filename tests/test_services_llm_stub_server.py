@@ -0,0 +1,122 @@
+"""Test services.llm against services.llm.stub_server."""
+
+import json
+import time
+
+import pytest
+
+import services.llm
+from config import config
+from services.llm import stub_server
+
+
+@pytest.fixture()
+def stub(mocker):
+    """Start a stub server and point services.llm at it."""
+
+    def inner(options: stub_server.StubOptions):
+        server = stub_server.StubServer(options)
+        server.__enter__()
+        servers.append(server)
+        mocker.patch.dict(config, {
+            "openai_base_url": server.base_url,
+            "llm_cache_bypass": True
+        })
+        mocker.patch.dict("os.environ", {"OPENAI_API_KEY": "test"})
+        return server
+
+    servers = []
+    yield inner
+    for server in servers:
+        server.__exit__()
+
+
+def test_generate_text_retries_scripted_errors(stub):
+    """Test 429 and 500 responses are retried until the scripted answer."""
+    server = stub(
+        stub_server.StubOptions(script=[
+            stub_server.ScriptedResponse(status=429, retry_after=0),
+            stub_server.ScriptedResponse(status=500),
+            stub_server.ScriptedResponse(content="Hello, stub!"),
+        ]))
+    openai_client = services.llm.get_openai_client()
+    assert services.llm.generate_text([{
+        "role": "user",
+        "content": "Hello"
+    }], openai_client) == "Hello, stub!"
+    assert server.statuses == {429: 1, 500: 1, 200: 1}
+    assert server.requests[-1]["messages"] == [{
+        "role": "user",
+        "content": "Hello"
+    }]
+
+
+def test_generate_text_streams_and_json(stub):
+    """Test streamed text and the json_object format."""
+    stub(stub_server.StubOptions())
+    openai_client = services.llm.get_openai_client()
+    tokens = []
+    text = services.llm.generate_text([{
+        "role": "user",
+        "content": "one two three"
+    }],
+                                      openai_client,
+                                      on_token=tokens.append)
+    assert text == "one two three"
+    assert tokens == ["one ", "two ", "three"]
+
+    generated_json = services.llm.generate_json([{
+        "role": "user",
+        "content": "Hello"
+    }], openai_client)
+    assert generated_json == {"content": "Hello"}
+
+
+def test_generate_text_times_out(stub, mocker):
+    """Test a request the server never answers times out and is retried."""
+    mocker.patch.dict(config, {"llm_timeout_seconds": 0.2})
+    server = stub(
+        stub_server.StubOptions(timeout_seconds=5,
+                                script=[
+                                    stub_server.ScriptedResponse(status=0),
+                                    stub_server.ScriptedResponse(
+                                        content="late"),
+                                ]))
+    openai_client = services.llm.get_openai_client()
+    start = time.perf_counter()
+    assert services.llm.generate_text([{
+        "role": "user",
+        "content": "Hello"
+    }], openai_client) == "late"
+    # The timed out request is closed instead of awaited.
+    assert time.perf_counter() - start < 2
+    assert server.statuses == {0: 1, 200: 1}
+
+
+def test_error_rates_and_latency():
+    """Test injected errors follow the rates and latencies are sampled."""
+    server = stub_server.StubServer(
+        stub_server.StubOptions(error_rates={
+            429: 0.5,
+            500: 0.5
+        },
+                                latency=stub_server.Latency.parse(
+                                    "uniform:0.1,0.2"),
+                                seed=1))
+    try:
+        responses = [server.next_response({}) for _ in range(20)]
+    finally:
+        server.server_close()
+    assert {response.status for response in responses} == {429, 500}
+    assert all(0.1 <= response.latency <= 0.2 for response in responses)
+    assert json.loads(
+        stub_server.get_default_content({
+            "messages": [{
+                "content": "x"
+            }],
+            "response_format": {
+                "type": "json_object"
+            }
+        })) == {
+            "content": "x"
+        }
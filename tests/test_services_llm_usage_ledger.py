@@ -0,0 +1,66 @@
+"""Test services.llm.usage_ledger module."""
+
+import services.llm
+from services.llm import usage_ledger
+
+
+def test_generate_text_records_usage(mocker, setup_llm_detail):
+    """Test each call is recorded with its action and stage."""
+    setup_llm_detail(mocker)
+    openai_client = services.llm.get_openai_client()
+    messages = [{"role": "user", "content": "Hello"}]
+
+    with usage_ledger.labels(action="update_issue"):
+        with usage_ledger.stage("reply"):
+            services.llm.generate_text(messages, openai_client)
+        services.llm.generate_text(messages, openai_client)
+
+    first, second = usage_ledger.read_records()
+    assert (first.action, first.stage, first.cached) == ("update_issue",
+                                                          "reply", False)
+    assert first.model == services.llm.MODEL_NAME
+    assert first.prompt_tokens > 0
+    assert first.completion_tokens > 0
+    assert first.retries == 0
+    assert (second.action, second.stage, second.cached) == ("update_issue",
+                                                             None, True)
+
+
+def test_stage_decorator():
+    """Test stage labels the calls made inside a function."""
+
+    @usage_ledger.stage("inner")
+    def inner():
+        usage_ledger.record(usage_ledger.UsageRecord("model", 1, 2, 0.5))
+
+    inner()
+    usage_ledger.record(usage_ledger.UsageRecord("model", 1, 2, 0.5))
+    assert [usage.stage for usage in usage_ledger.read_records()] == [
+        "inner", None
+    ]
+
+
+def test_summarize_percentiles():
+    """Test percentiles and totals per action and stage."""
+    records = [
+        usage_ledger.UsageRecord("model",
+                                 10,
+                                 5,
+                                 float(latency),
+                                 action="add_issue",
+                                 stage="body") for latency in range(1, 101)
+    ]
+    records.append(
+        usage_ledger.UsageRecord("model", 1, 1, 9, error="LLMTimeoutException"))
+    summary = usage_ledger.summarize(records)
+
+    body = summary[("add_issue", "body")]
+    assert body["calls"] == 100
+    assert body["prompt_tokens"] == 1000
+    assert (body["p50_seconds"], body["p90_seconds"],
+            body["p99_seconds"]) == (50, 90, 99)
+    assert summary[("-", "-")]["errors"] == 1
+
+    report = usage_ledger.format_report(records)
+    assert "add_issue" in report
+    assert report.splitlines()[-1].startswith("total")
@@ -0,0 +1,40 @@
+"""Test utils.lock_utils module."""
+
+import multiprocessing
+
+from utils.lock_utils import FileLock
+
+
+def hold_lock(path, locked, release):
+    """Hold the lock until release is set."""
+    with FileLock(path):
+        locked.set()
+        release.wait(10)
+
+
+def test_file_lock_excludes_other_locks(tmp_path):
+    """Test a held lock cannot be taken by another FileLock of the path."""
+    path = str(tmp_path / "locks" / "test.lock")
+    with FileLock(path) as lock:
+        assert lock.locked
+        assert not FileLock(path).acquire(blocking=False)
+    assert not lock.locked
+    other = FileLock(path)
+    assert other.acquire(blocking=False)
+    other.release()
+
+
+def test_file_lock_excludes_other_processes(tmp_path):
+    """Test a lock held by another process cannot be taken."""
+    path = str(tmp_path / "test.lock")
+    context = multiprocessing.get_context("spawn")
+    locked, release = context.Event(), context.Event()
+    process = context.Process(target=hold_lock, args=(path, locked, release))
+    process.start()
+    try:
+        assert locked.wait(10)
+        assert not FileLock(path).acquire(blocking=False)
+    finally:
+        release.set()
+        process.join()
+    assert FileLock(path).acquire(blocking=False)
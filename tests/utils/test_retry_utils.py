@@ -0,0 +1,183 @@
+"""Test cases for the retry policy"""
+
+import asyncio
+import subprocess
+
+import httpx
+import openai
+import pytest
+
+import services.llm
+from utils import github_utils, retry_utils
+
+
+class TransientError(Exception):
+    """A transient error for testing."""
+
+
+def make_headers_error(headers: dict[str, str]) -> Exception:
+    """Make an error with a response carrying headers."""
+    error = TransientError()
+    error.response = httpx.Response(429, headers=headers)
+    return error
+
+
+def test_full_jitter_delay_is_bounded():
+    """Test the delay is a random fraction of the capped backoff"""
+    assert retry_utils.full_jitter_delay(0, 1, 30, rand=lambda: 1) == 1
+    assert retry_utils.full_jitter_delay(3, 1, 30, rand=lambda: 0.5) == 4
+    assert retry_utils.full_jitter_delay(10, 1, 30, rand=lambda: 1) == 30
+    assert retry_utils.full_jitter_delay(10, 1, 30, rand=lambda: 0) == 0
+
+
+def test_get_retry_after():
+    """Test Retry-After is read in seconds, milliseconds and HTTP dates"""
+    assert retry_utils.get_retry_after(make_headers_error({"retry-after":
+                                                           "7"})) == 7
+    assert retry_utils.get_retry_after(
+        make_headers_error({"retry-after-ms": "1500"})) == 1.5
+    assert retry_utils.get_retry_after(
+        make_headers_error({"retry-after":
+                            "Wed, 21 Oct 2015 07:28:00 GMT"})) == 0
+    assert retry_utils.get_retry_after(make_headers_error({})) is None
+    assert retry_utils.get_retry_after(TransientError()) is None
+
+
+def test_get_delay_clamps_retry_after(mocker):
+    """Test a Retry-After longer than max_delay waits only max_delay"""
+    mocker.stop(retry_utils.RetryPolicy.get_delay)
+    policy = retry_utils.RetryPolicy((TransientError, ), max_delay=30)
+    assert policy.get_delay(0, make_headers_error({"retry-after": "7"})) == 7
+    assert policy.get_delay(0, make_headers_error({"retry-after":
+                                                   "3600"})) == 30
+
+
+def test_retry_policy_retries_transient_errors_only():
+    """Test transient errors are retried and other errors raised at once"""
+    policy = retry_utils.RetryPolicy((TransientError, ), tries=3)
+    results = iter([TransientError(), TransientError(), "ok"])
+
+    def flaky():
+        result = next(results)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    assert policy.call("test", flaky) == "ok"
+
+    calls = []
+
+    def broken():
+        calls.append(1)
+        raise ValueError("not transient")
+
+    with pytest.raises(ValueError):
+        policy.call("test", broken)
+    assert len(calls) == 1
+
+    metrics = policy.metrics()["test"]
+    assert metrics["attempts"] == 4
+    assert metrics["retries"] == 2
+    assert metrics["failures"] == 2
+    assert metrics["successes"] == 1
+
+
+def test_circuit_breaker_fails_fast():
+    """Test an endpoint failing repeatedly is rejected until reset"""
+    policy = retry_utils.RetryPolicy((TransientError, ),
+                                     tries=2,
+                                     failure_threshold=2)
+    calls = []
+
+    @policy.retrying("down")
+    def down():
+        calls.append(1)
+        raise TransientError()
+
+    with pytest.raises(TransientError):
+        down()
+    with pytest.raises(retry_utils.CircuitOpenException):
+        down()
+    assert len(calls) == 2
+    assert policy.metrics()["down"]["rejections"] == 1
+    # Other endpoints are not affected.
+    assert policy.call("up", lambda: "ok") == "ok"
+
+    breaker = policy.get_breaker("down")
+    breaker.opened_at -= breaker.reset_seconds
+    assert breaker.state == "half_open"
+    assert policy.call("down", lambda: "ok") == "ok"
+    assert breaker.state == "closed"
+
+
+def test_circuit_breaker_trial_error_reopens():
+    """Test a trial call failing with any error opens the circuit again"""
+    policy = retry_utils.RetryPolicy((TransientError, ),
+                                     tries=1,
+                                     failure_threshold=1)
+
+    def raise_error(err: Exception):
+        raise err
+
+    with pytest.raises(TransientError):
+        policy.call("down", raise_error, TransientError())
+    breaker = policy.get_breaker("down")
+    breaker.opened_at -= breaker.reset_seconds
+    assert breaker.state == "half_open"
+
+    with pytest.raises(ValueError):
+        policy.call("down", raise_error, ValueError("not transient"))
+    assert breaker.state == "open"
+    with pytest.raises(retry_utils.CircuitOpenException):
+        policy.call("down", lambda: "ok")
+
+
+def test_async_retry_policy():
+    """Test coroutine functions are retried with the same policy"""
+    policy = retry_utils.RetryPolicy((TransientError, ), tries=2)
+    calls = []
+
+    @policy.retrying("test")
+    async def flaky():
+        calls.append(1)
+        if len(calls) == 1:
+            raise TransientError()
+        return "ok"
+
+    assert asyncio.run(flaky()) == "ok"
+    assert len(calls) == 2
+
+
+def test_generate_text_retries_rate_limit(mocker, setup_llm_detail):
+    """Test a rate limited request to the LLM API is retried"""
+    setup_llm_detail(mocker)
+    openai_client = services.llm.get_openai_client()
+    response = httpx.Response(429,
+                              headers={"retry-after": "3"},
+                              request=httpx.Request("POST", "http://test"))
+    mocker.patch.object(openai_client,
+                        "create",
+                        side_effect=[
+                            openai.RateLimitError("rate limited",
+                                                  response=response,
+                                                  body=None),
+                            openai_client,
+                        ])
+
+    assert services.llm.generate_text([{
+        "role": "user",
+        "content": "Hello"
+    }], openai_client) == "Hello, world!"
+    assert services.llm.retry_policy.metrics()["openai"]["retries"] == 1
+
+
+def test_exec_git_command_retries_connection_errors(mocker):
+    """Test git commands are retried only when GitHub cannot be reached"""
+    error = subprocess.CalledProcessError(
+        128, "git", stderr=b"Could not resolve hostname github.com")
+    mock_run = mocker.patch("subprocess.run",
+                            side_effect=[error, mocker.Mock(returncode=0)])
+    assert github_utils.exec_git_command_and_response_bool(
+        "test_repo", ["git", "pull"]) is True
+    assert mock_run.call_count == 2
+    assert github_utils.retry_policy.metrics()["github"]["retries"] == 1
@@ -0,0 +1,16 @@
+"""Test cases for token utility functions"""
+
+from utils.token_utils import count_message_tokens, count_tokens
+
+
+def test_count_tokens():
+    """Test count_tokens with ASCII and non-ASCII text"""
+    assert count_tokens("") == 0
+    assert count_tokens("abcdefgh") == 2
+    assert count_tokens("テスト") == 3
+
+
+def test_count_message_tokens():
+    """Test count_message_tokens adds the overhead of each message"""
+    messages = [{"role": "user", "content": "abcd"}] * 2
+    assert count_message_tokens(messages) == 10
@@ -43,4 +43,42 @@ def get_default_config() -> Dict[str, Any]:
         "repository_path": repository_path,
         "exclude_dirs": ["__pycache__", ".git", repository_path],
         "openai_model_name": os.getenv('OPENAI_MODEL_NAME', 'gpt-4'),
+        "openai_base_url": None,
+        "cache_path": os.getenv('CACHE_PATH', '.cache'),
+        "file_cache_max_bytes": 256 * 1024 * 1024,
+        "token_budgets": {
+            "default": 60000
+        },
+        "retrieval_top_k": 10,
+        "import_graph_hops": 1,
+        "include_untracked_files": False,
+        "file_loader_workers": 8,
+        "max_file_bytes": 4 * 1024 * 1024,
+        "mmap_threshold_bytes": 1024 * 1024,
+        "max_decode_bytes": 256 * 1024,
+        "llm_cache_bypass": False,
+        "llm_cache_ttl_seconds": 24 * 60 * 60,
+        "llm_cache_max_bytes": 64 * 1024 * 1024,
+        "llm_max_concurrency": 4,
+        "llm_timeout_seconds": 600,
+        "llm_max_output_tokens": 16000,
+        "llm_requests_per_minute": 500,
+        "llm_tokens_per_minute": 200000,
+        "llm_connect_timeout_seconds": 10,
+        "llm_max_connections": 20,
+        "llm_max_keepalive_connections": 10,
+        "llm_keepalive_expiry_seconds": 60,
+        "retry_tries": 4,
+        "retry_base_delay_seconds": 1,
+        "retry_max_delay_seconds": 30,
+        "circuit_failure_threshold": 5,
+        "circuit_reset_seconds": 30,
+        "github_backend": os.getenv('GITHUB_BACKEND', 'gh'),
+        "github_api_url": "https://api.github.com",
+        "github_timeout_seconds": 30,
+        "github_max_connections": 10,
+        "github_keepalive_expiry_seconds": 60,
+        "github_graphql_max_nodes": 10000,
+        "worktree_path": os.path.join(repository_path, ".worktrees"),
+        "worktree_pool_size": 4,
     }
@@ -1,13 +1,64 @@
 """Utilities for working with GitHub repositories."""
 
+import contextlib
+import contextvars
 import os
 import subprocess
+from typing import Iterator
 
 from config import config
 from services.github import exceptions
 from utils.logging_utils import log
+from utils.retry_utils import create_retry_policy
 
 DEFAULT_PATH = config["repository_path"]
+# git subcommands that talk to the remote.
+REMOTE_COMMANDS = {"clone", "fetch", "ls-remote", "pull", "push"}
+# Errors that may succeed when retried.
+retry_policy = create_retry_policy(
+    (exceptions.GitHubConnectionException, ))
+# The repository and the worktree that the current job runs in.
+_worktree: contextvars.ContextVar[tuple[str, str] | None] = (
+    contextvars.ContextVar("git_worktree", default=None))
+
+
+def get_worktree_path(repo: str) -> str | None:
+    """Return the worktree of the repository used by the current job, if any."""
+    worktree = _worktree.get()
+    if worktree is not None and worktree[0] == repo:
+        return worktree[1]
+    return None
+
+
+def get_repo_path(repo: str) -> str:
+    """Return the working tree that the commands of the repository run in.
+
+    It is the worktree of the current job if any, otherwise the clone under
+    DEFAULT_PATH.
+    """
+    return get_worktree_path(repo) or os.path.join(DEFAULT_PATH, repo)
+
+
+@contextlib.contextmanager
+def use_worktree(repo: str, path: str) -> Iterator[None]:
+    """Run the commands of the repository in a worktree inside the block.
+
+    The worktree is a context variable, so that jobs running in other threads
+    or tasks keep their own working tree.
+    """
+    token = _worktree.set((repo, path))
+    try:
+        yield
+    finally:
+        _worktree.reset(token)
+
+
+def get_endpoint(command: list[str]) -> str:
+    """Return 'github' for commands that talk to GitHub, otherwise 'git'."""
+    if command[0] == "gh" or (len(command) > 1
+                              and command[1] in REMOTE_COMMANDS):
+        return "github"
+    return "git"
 
 
 def exec_git_command(
@@ -19,10 +70,22 @@ def exec_git_command(
     If capture_output is True, the function returns a subprocess.CompletedProcess object.
     Otherwise, it returns a boolean indicating success.
 
+    Transient errors, such as a failure to connect to GitHub, are retried
+    by retry_policy.
+
     Returns:
         Union[bool, subprocess.CompletedProcess]: The result of the subprocess run or success flag.
     """
-    repo_path = os.path.join(DEFAULT_PATH, repo)
+    return retry_policy.call(get_endpoint(command), run_git_command, repo,
+                             command, capture_output)
+
+
+def run_git_command(
+        repo: str,
+        command: list[str],
+        capture_output: bool = False) -> subprocess.CompletedProcess:
+    """Execute a shell command once within the specified git repository path."""
+    repo_path = get_repo_path(repo)
     try:
         complete_process = subprocess.run(
             command,
@@ -42,6 +105,40 @@ def exec_git_command(
         raise exception(error_message) from err
 
 
+def stream_git_command(repo: str, command: list[str]) -> Iterator[str]:
+    """Execute a shell command within the specified git repository path,
+    yielding the lines of its output as they are written.
+
+    The output is not held in memory as a whole. The command is not retried,
+    since its output may already have been consumed, and it is killed if
+    the iteration stops early.
+    """
+    repo_path = get_repo_path(repo)
+    with subprocess.Popen(
+            command,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            cwd=repo_path,
+    ) as proc:
+        try:
+            for line in proc.stdout:
+                yield line.decode()
+            stderr = proc.stderr.read()
+            returncode = proc.wait()
+        finally:
+            if proc.poll() is None:
+                proc.kill()
+    if returncode:
+        err = subprocess.CalledProcessError(returncode, command, stderr=stderr)
+        shorted_commands = " ".join(command)[:50]
+        log(
+            f"Command {shorted_commands} failed with error ({returncode}): {err}",
+            level="exception",
+        )
+        exception, error_message = exceptions.parse_exception(err)
+        raise exception(error_message) from err
+
+
 def exec_git_command_and_response_bool(repo: str,
                                        command: list[str],
                                        capture_output: bool = False) -> bool:
@@ -4,9 +4,16 @@ import os
 from typing import TextIO, cast
 
 
-def safe_join(*args: str) -> str:
-    """パスコンポーネントを安全に結合します。"""
-    return os.path.normpath(os.path.join(*args))
+def safe_join(base: str, *paths: str) -> str:
+    """パスコンポーネントを安全に結合します。
+
+    結合したパスがbaseの外を指す場合はValueErrorを送出します。
+    """
+    path = os.path.normpath(os.path.join(base, *paths))
+    base_path = os.path.abspath(base)
+    if os.path.commonpath([base_path, os.path.abspath(path)]) != base_path:
+        raise ValueError(f"パスがベースディレクトリの外を指しています: {path}")
+    return path
 
 
 def validate_path(path: str) -> None:
@@ -1,51 +1,350 @@
 """
-This file contains the retry_on_exception decorator
-which can be used to retry a function in case of
-a specific exception.
+This file contains the retry policy shared by the calls to
+external services, such as the LLM API and git commands.
+
+A RetryPolicy retries transient errors with exponential backoff and full
+jitter, honors the Retry-After header of the server, and keeps a circuit
+breaker and metrics for each endpoint.
 """
 
+import asyncio
+import email.utils
 import functools
-import logging
-from time import sleep
+import inspect
+import random
+import threading
+import time
+from typing import Any, Awaitable, Callable, TypeVar
+
+from config import config
+from utils.logging_utils import log
+
+T = TypeVar("T")
+
+DEFAULT_TRIES = 4
+DEFAULT_BASE_DELAY_SECONDS = 1.0
+DEFAULT_MAX_DELAY_SECONDS = 30.0
+DEFAULT_FAILURE_THRESHOLD = 5
+DEFAULT_RESET_SECONDS = 30.0
+
+
+class CircuitOpenException(Exception):
+    """Exception raised when a call is rejected by an open circuit breaker."""
+
+
+def full_jitter_delay(attempt: int,
+                      base_delay: float,
+                      max_delay: float,
+                      rand: Callable[[], float] = random.random) -> float:
+    """Return a random delay up to the exponential backoff of the attempt.
+
+    attempt starts at 0 for the delay after the first failure.
+    """
+    return rand() * min(max_delay, base_delay * 2**attempt)
 
 
-def retry_on_exception(exception_to_check,
-                       tries=4,
-                       delay=3,
-                       backoff=2,
-                       logger=None):
+def get_retry_after(err: BaseException) -> float | None:
+    """Return the seconds to wait requested by the server, if any.
+
+    The Retry-After header of the response of the error is read, either in
+    seconds or as an HTTP date, as well as the retry-after-ms header of the
+    OpenAI API.
+    """
+    headers = getattr(getattr(err, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms"):
+            return max(0.0, float(headers["retry-after-ms"]) / 1000)
+        retry_after = headers.get("retry-after")
+        if not retry_after:
+            return None
+        try:
+            return max(0.0, float(retry_after))
+        except ValueError:
+            retry_at = email.utils.parsedate_to_datetime(retry_after)
+            return max(0.0, retry_at.timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class CircuitBreaker:
+    """A circuit breaker of an endpoint.
+
+    After failure_threshold consecutive failures, calls are rejected for
+    reset_seconds. Then a single trial call is let through, which closes the
+    circuit on success and opens it again on any error.
     """
-    Decorator to retry a function in case of a specific exception.
 
-    Args:
-        exception_to_check: Exception to check.
-        tries: Number of tries.
-        delay: Initial delay in seconds.
-        backoff: Backoff factor.
-        logger: Logger to use.
+    def __init__(self,
+                 failure_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+                 reset_seconds: float = DEFAULT_RESET_SECONDS,
+                 clock: Callable[[], float] = time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.clock = clock
+        self.failures = 0
+        self.opened_at: float | None = None
+        self.trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        """Return 'closed', 'open' or 'half_open'."""
+        if self.opened_at is None:
+            return "closed"
+        if self.clock() - self.opened_at < self.reset_seconds:
+            return "open"
+        return "half_open"
+
+    def before_call(self):
+        """Reject the call if the circuit is open."""
+        with self._lock:
+            state = self.state
+            if state == "open" or (state == "half_open"
+                                   and self.trial_running):
+                raise CircuitOpenException("The circuit breaker is open.")
+            if state == "half_open":
+                self.trial_running = True
+
+    def on_success(self):
+        """Close the circuit."""
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_running = False
+
+    def on_error(self):
+        """Handle an error that is not a failure of the endpoint.
+
+        It resets the count of consecutive failures, but a failed trial call
+        opens the circuit again, as only a success closes it.
+        """
+        with self._lock:
+            if self.trial_running:
+                self.opened_at = self.clock()
+                self.trial_running = False
+            elif self.opened_at is None:
+                self.failures = 0
 
-    Returns:
-        Decorator function.
+    def release_trial(self):
+        """Let another trial call through after one ended without a result."""
+        with self._lock:
+            self.trial_running = False
+
+    def on_failure(self):
+        """Count a failure, and open the circuit at the threshold."""
+        with self._lock:
+            self.failures += 1
+            if self.trial_running or self.failures >= self.failure_threshold:
+                self.opened_at = self.clock()
+            self.trial_running = False
+
+
+class RetryPolicy:
+    """Retry transient errors of calls to endpoints.
+
+    Exceptions of the retry_on types are transient. They are retried up to
+    tries attempts in total, and count as failures of the circuit breaker of
+    the endpoint. Other exceptions are raised at once, and the endpoint is
+    regarded as working, except that they fail the trial call of an open
+    circuit breaker. If failure_threshold is None, no circuit breaker is
+    used.
     """
 
-    def decorator_retry(func):
+    def __init__(
+        self,
+        retry_on: tuple[type[BaseException], ...],
+        tries: int = DEFAULT_TRIES,
+        base_delay: float = DEFAULT_BASE_DELAY_SECONDS,
+        max_delay: float = DEFAULT_MAX_DELAY_SECONDS,
+        failure_threshold: int | None = DEFAULT_FAILURE_THRESHOLD,
+        reset_seconds: float = DEFAULT_RESET_SECONDS,
+    ):
+        self.retry_on = retry_on
+        self.tries = tries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._breakers: dict[str, CircuitBreaker] = {}
+        self._metrics: dict[str, dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def get_breaker(self, endpoint: str) -> CircuitBreaker | None:
+        """Return the circuit breaker of the endpoint."""
+        if self.failure_threshold is None:
+            return None
+        with self._lock:
+            if endpoint not in self._breakers:
+                self._breakers[endpoint] = CircuitBreaker(
+                    self.failure_threshold, self.reset_seconds)
+            return self._breakers[endpoint]
+
+    def get_delay(self, attempt: int, err: BaseException) -> float:
+        """Return the delay before retrying after the error.
+
+        The Retry-After of the server is honored up to max_delay.
+        """
+        retry_after = get_retry_after(err)
+        if retry_after is not None:
+            return min(retry_after, self.max_delay)
+        return full_jitter_delay(attempt, self.base_delay, self.max_delay)
+
+    def metrics(self) -> dict[str, dict[str, float]]:
+        """Return the attempt, retry and latency counts of each endpoint."""
+        with self._lock:
+            return {
+                endpoint: dict(metrics)
+                for endpoint, metrics in self._metrics.items()
+            }
+
+    def reset(self):
+        """Forget the circuit breakers and metrics."""
+        with self._lock:
+            self._breakers.clear()
+            self._metrics.clear()
+
+    def _record(self, endpoint: str, key: str, value: float = 1):
+        """Add value to a metric of the endpoint."""
+        with self._lock:
+            metrics = self._metrics.setdefault(
+                endpoint, {
+                    "attempts": 0,
+                    "successes": 0,
+                    "failures": 0,
+                    "retries": 0,
+                    "rejections": 0,
+                    "latency_seconds": 0.0,
+                    "max_latency_seconds": 0.0,
+                })
+            if key == "latency_seconds":
+                metrics["max_latency_seconds"] = max(
+                    metrics["max_latency_seconds"], value)
+            metrics[key] += value
+
+    def _before_attempt(self, endpoint: str, breaker: CircuitBreaker | None):
+        """Count an attempt, rejecting it if the circuit is open."""
+        self._record(endpoint, "attempts")
+        if breaker is not None:
+            try:
+                breaker.before_call()
+            except CircuitOpenException:
+                self._record(endpoint, "rejections")
+                log(f"Circuit breaker of {endpoint} is open", level="warning")
+                raise
+
+    def _after_failure(self, endpoint: str, breaker: CircuitBreaker | None,
+                       attempt: int, err: BaseException) -> float | None:
+        """Handle a failed attempt, returning the delay if it is retried."""
+        if not isinstance(err, self.retry_on):
+            if breaker is not None:
+                breaker.on_error()
+            return None
+        self._record(endpoint, "failures")
+        if breaker is not None:
+            breaker.on_failure()
+        if attempt + 1 >= self.tries:
+            return None
+        delay = self.get_delay(attempt, err)
+        self._record(endpoint, "retries")
+        log(f"{endpoint}: {err}, retrying in {delay:.2f} seconds...",
+            level="warning")
+        return delay
+
+    def _after_success(self, endpoint: str, breaker: CircuitBreaker | None):
+        """Handle a successful attempt."""
+        self._record(endpoint, "successes")
+        if breaker is not None:
+            breaker.on_success()
+
+    def call(self, endpoint: str, func: Callable[..., T], *args,
+             **kwargs) -> T:
+        """Call func, retrying transient errors."""
+        breaker = self.get_breaker(endpoint)
+        attempt = 0
+        while True:
+            self._before_attempt(endpoint, breaker)
+            start = time.perf_counter()
+            try:
+                result = func(*args, **kwargs)
+            except Exception as err:
+                delay = self._after_failure(endpoint, breaker, attempt, err)
+                if delay is None:
+                    raise
+            except BaseException:
+                if breaker is not None:
+                    breaker.release_trial()
+                raise
+            else:
+                self._after_success(endpoint, breaker)
+                return result
+            finally:
+                self._record(endpoint, "latency_seconds",
+                             time.perf_counter() - start)
+            time.sleep(delay)
+            attempt += 1
+
+    async def acall(self, endpoint: str, func: Callable[..., Awaitable[T]],
+                    *args, **kwargs) -> T:
+        """Async counterpart of call."""
+        breaker = self.get_breaker(endpoint)
+        attempt = 0
+        while True:
+            self._before_attempt(endpoint, breaker)
+            start = time.perf_counter()
+            try:
+                result = await func(*args, **kwargs)
+            except Exception as err:
+                delay = self._after_failure(endpoint, breaker, attempt, err)
+                if delay is None:
+                    raise
+            except BaseException:
+                if breaker is not None:
+                    breaker.release_trial()
+                raise
+            else:
+                self._after_success(endpoint, breaker)
+                return result
+            finally:
+                self._record(endpoint, "latency_seconds",
+                             time.perf_counter() - start)
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    def retrying(self, endpoint: str) -> Callable[[Callable], Callable]:
+        """Decorator to call a function or coroutine function with the policy."""
+
+        def decorator_retry(func):
+            if inspect.iscoroutinefunction(func):
+
+                @functools.wraps(func)
+                async def async_func_retry(*args, **kwargs) -> Any:
+                    return await self.acall(endpoint, func, *args, **kwargs)
+
+                return async_func_retry
+
+            @functools.wraps(func)
+            def func_retry(*args, **kwargs) -> Any:
+                return self.call(endpoint, func, *args, **kwargs)
 
-        @functools.wraps(func)
-        def func_retry(*args, **kwargs):
-            _logger = logger or logging.getLogger(__name__)
-            mtries, mdelay = tries, delay
+            return func_retry
 
-            while mtries > 0:
-                try:
-                    return func(*args, **kwargs)
-                except exception_to_check as err:
-                    _logger.warning(
-                        f"{str(err)}, retrying in {mdelay} seconds...")
-                    sleep(mdelay)
-                    mtries -= 1
-                    mdelay *= backoff
-            return func(*args, **kwargs)
+        return decorator_retry
 
-        return func_retry
 
-    return decorator_retry
+def create_retry_policy(
+        retry_on: tuple[type[BaseException], ...]) -> RetryPolicy:
+    """Create a retry policy with the retry and circuit breaker config."""
+    return RetryPolicy(
+        retry_on,
+        tries=config.get("retry_tries", DEFAULT_TRIES),
+        base_delay=config.get("retry_base_delay_seconds",
+                              DEFAULT_BASE_DELAY_SECONDS),
+        max_delay=config.get("retry_max_delay_seconds",
+                             DEFAULT_MAX_DELAY_SECONDS),
+        failure_threshold=config.get("circuit_failure_threshold",
+                                     DEFAULT_FAILURE_THRESHOLD),
+        reset_seconds=config.get("circuit_reset_seconds",
+                                 DEFAULT_RESET_SECONDS),
+    )
@@ -0,0 +1,26 @@
+"""Utilities for estimating the token counts of LLM messages."""
+
+import math
+
+# Tokens added by the chat format around each message.
+MESSAGE_OVERHEAD_TOKENS = 4
+# Average number of ASCII characters per token for code and English text.
+ASCII_CHARS_PER_TOKEN = 4
+
+
+def count_tokens(text: str) -> int:
+    """Estimate the number of tokens in a text without calling the API.
+
+    ASCII text averages about four characters per token, while other
+    characters such as Japanese are counted as one token each.
+    """
+    ascii_chars = sum(1 for char in text if char.isascii())
+    return math.ceil(ascii_chars / ASCII_CHARS_PER_TOKEN) + (len(text) -
+                                                             ascii_chars)
+
+
+def count_message_tokens(messages: list[dict[str, str]]) -> int:
+    """Estimate the number of tokens in a list of messages."""
+    return sum(
+        count_tokens(message.get("content", "")) + MESSAGE_OVERHEAD_TOKENS
+        for message in messages)